@@ -7,6 +7,7 @@
 
 from crash.types.list import list_for_each_entry
 from crash.util import container_of
+from crash.cache.tasks import load_all_tasks
 import gdb
 
 dentry_type = gdb.lookup_type('struct dentry')
@@ -131,6 +132,8 @@ for item in list_for_each_entry(ail['xa_ail'], xfs_log_item_type, 'li_ail'):
 
 checked = 0
 dead = 0
+# Every task must be a gdb thread, even with --lazy-tasks
+load_all_tasks()
 for thread in gdb.selected_inferior().threads():
     thread.switch()
     try:
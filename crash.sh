@@ -3,7 +3,18 @@
 
 usage() {
 cat <<END >&2
-usage: $(basename $0) [-d|--search-dir <debuginfo/module dir>] <vmlinux> <vmcore>
+usage: $(basename $0) [-d|--search-dir <debuginfo/module dir>] [--lazy-modules] [--lazy-tasks] <vmlinux> <vmcore>
+
+--lazy-modules  Load module symbols and debuginfo only when an address
+                within the module is first needed, or all remaining
+                modules when crash-python can't find a symbol or type.
+                Plain gdb commands (p, info symbol, x/i) don't load
+                modules and only see those loaded so far.
+--lazy-tasks    Register only the tasks running on a CPU as threads at
+                startup and the others when they are first needed.
+                info threads, and scripts that iterate over threads
+                without calling crash.cache.tasks.load_all_tasks(),
+                only see the tasks registered so far.
 
 Debugging options:
 --gdb           Run the embedded gdb underneath a separate gdb instance.
@@ -18,7 +29,7 @@ END
 exit 1
 }
 
-TEMP=$(getopt -o 'd:h' --long 'search-dir:,gdb,valgrind,nofiles,help' -n "$(basename $0)" -- "$@")
+TEMP=$(getopt -o 'd:h' --long 'search-dir:,lazy-modules,lazy-tasks,gdb,valgrind,nofiles,help' -n "$(basename $0)" -- "$@")
 
 if [ $? -ne 0 ]; then
     echo "Terminating." >&2
@@ -35,6 +46,16 @@ while true; do
             shift 2
             continue
         ;;
+        '--lazy-modules')
+            LAZYMODULES=True
+            shift
+            continue
+            ;;
+        '--lazy-tasks')
+            LAZYTASKS=True
+            shift
+            continue
+            ;;
         '--gdb')
             DEBUGMODE=gdb
             shift
@@ -130,7 +151,9 @@ except RuntimeError as e:
     sys.exit(1)
 path = "$SEARCHDIRS".split(' ')
 try:
-   x = crash.session.Session("$KERNEL", "$VMCORE", "$ZKERNEL", path)
+   x = crash.session.Session("$KERNEL", "$VMCORE", "$ZKERNEL", path,
+                             lazy_modules=${LAZYMODULES:-False},
+                             lazy_tasks=${LAZYTASKS:-False})
    print("The 'pyhelp' command will list the command extensions.")
 except gdb.error as e:
     print("crash-python: {}, exiting".format(str(e)), file=sys.stderr)
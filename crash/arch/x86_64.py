@@ -7,11 +7,15 @@ from __future__ import division
 
 import gdb
 import sys
+import struct
 
 if sys.version_info.major >= 3:
     long = int
 
 from crash.arch import CrashArchitecture, register, KernelFrameFilter
+from crash.layout import StructLayout
+from crash.memory import RawMemory, read_ulong, read_ulong_array
+from crash.cache.syscache import config
 
 class x86_64Architecture(CrashArchitecture):
     ident = "i386:x86-64"
@@ -34,6 +38,9 @@ class x86_64Architecture(CrashArchitecture):
             except Exception:
                 raise RuntimeError("{} requires symbol 'thread_return'"
                                    .format(self.__class__.__name__))
+        self.thread_sp_layout = None
+        self.frame_pointers = None
+        self.word = None
         self.ulong_type = gdb.lookup_type('unsigned long')
         thread_info_type = gdb.lookup_type('struct thread_info')
         self.thread_info_p_type = thread_info_type.pointer()
@@ -56,51 +63,107 @@ class x86_64Architecture(CrashArchitecture):
             except KeyError as e:
                 pass
 
-    def fetch_register_scheduled_inactive(self, thread, register):
-        ulong_type = self.ulong_type
-        task = thread.info.task_struct
-
-        rsp = task['thread']['sp'].cast(ulong_type.pointer())
-
-        frame = rsp.cast(self.inactive_task_frame_type.pointer()).dereference()
+    def __setup_frame_layouts(self):
+        self.thread_sp_layout = StructLayout('struct task_struct',
+                                             [ 'thread.sp' ], [ 'sp' ])
+        if self.fetch_register_scheduled == \
+                self.fetch_register_scheduled_inactive:
+            self.inactive_frame_layout = StructLayout(
+                            self.inactive_task_frame_type,
+                            [ 'ret_addr', 'bp', 'bx', 'r12', 'r13',
+                              'r14', 'r15' ])
+        else:
+            self.inactive_frame_layout = None
+
+    def read_saved_frames(self, addrs):
+        """
+        Reads the registers saved when each of a set of tasks scheduled out
+
+        Args:
+            addrs (list of int): The addresses of the task_structs
+
+        Returns:
+            dict: Maps the address of each task whose frame could be read
+                to a dict of register name to value
+        """
+        if self.thread_sp_layout is None:
+            self.__setup_frame_layouts()
+
+        frames = {}
+        for addr in addrs:
+            try:
+                rsp = self.thread_sp_layout.read(addr).sp
+                if self.inactive_frame_layout is not None:
+                    rec = self.inactive_frame_layout.read(rsp)
+                    frame = {
+                        'rip' : rec.ret_addr,
+                        'rbp' : rec.bp,
+                        'rbx' : rec.bx,
+                        'r12' : rec.r12,
+                        'r13' : rec.r13,
+                        'r14' : rec.r14,
+                        'r15' : rec.r15,
+                    }
+                else:
+                    rbp = read_ulong(rsp)
+                    (r15, r14, r13, r12, rbx) = read_ulong_array(rbp - 40, 5)
+                    frame = {
+                        'rip' : long(self.thread_return),
+                        'rbp' : rbp,
+                        'rbx' : rbx,
+                        'r12' : r12,
+                        'r13' : r13,
+                        'r14' : r14,
+                        'r15' : r15,
+                    }
+            except gdb.error:
+                continue
+            frame['rsp'] = rsp
+            frames[addr] = frame
+        return frames
+
+    def saved_frame(self, task):
+        """
+        Returns the registers saved when a task scheduled out
+
+        The registers are read once per task.
+
+        Args:
+            task (LinuxTask): The task
+
+        Returns:
+            dict: Maps register name to value
+        """
+        if task.saved_frame is None:
+            addr = long(task.task_struct.address)
+            frames = self.read_saved_frames([ addr ])
+            if addr not in frames:
+                raise gdb.MemoryError("Failed to read saved registers for task {:#x}"
+                                      .format(addr))
+            task.saved_frame = frames[addr]
+        return task.saved_frame
+
+    def __fetch_register_scheduled(self, thread, register):
+        frame = self.saved_frame(thread.info)
 
         # Only write rip when requested; It resets the frame cache
         if register == 16 or register == -1:
-            thread.registers['rip'].value = frame['ret_addr']
+            thread.registers['rip'].value = frame['rip']
             if register == 16:
                 return True
 
-        thread.registers['rsp'].value = rsp
-        thread.registers['rbp'].value = frame['bp']
-        thread.registers['rbx'].value = frame['bx']
-        thread.registers['r12'].value = frame['r12']
-        thread.registers['r13'].value = frame['r13']
-        thread.registers['r14'].value = frame['r14']
-        thread.registers['r15'].value = frame['r15']
+        for reg in [ 'rsp', 'rbp', 'rbx', 'r12', 'r13', 'r14', 'r15' ]:
+            thread.registers[reg].value = frame[reg]
         thread.registers['cs'].value = 2*8
         thread.registers['ss'].value = 3*8
 
-        thread.info.stack_pointer = rsp
+        thread.info.stack_pointer = frame['rsp']
         thread.info.valid_stack = True
 
-    def fetch_register_scheduled_thread_return(self, thread, register):
-        ulong_type = self.ulong_type
-        task = thread.info.task_struct
-
-        # Only write rip when requested; It resets the frame cache
-        if register == 16 or register == -1:
-            thread.registers['rip'].value = self.thread_return
-            if register == 16:
-                return True
-
-        rsp = task['thread']['sp'].cast(ulong_type.pointer())
-        rbp = rsp.dereference().cast(ulong_type.pointer())
-        rbx = (rbp - 1).dereference()
-        r12 = (rbp - 2).dereference()
-        r13 = (rbp - 3).dereference()
-        r14 = (rbp - 4).dereference()
-        r15 = (rbp - 5).dereference()
+    def fetch_register_scheduled_inactive(self, thread, register):
+        return self.__fetch_register_scheduled(thread, register)
 
+    def fetch_register_scheduled_thread_return(self, thread, register):
         # The two pushes that don't have CFI info
         # rsp += 2
 
@@ -108,18 +171,68 @@ class x86_64Architecture(CrashArchitecture):
         # if ex:
         #     print("EXCEPTION STACK: pid {:d}".format(task['pid']))
 
-        thread.registers['rsp'].value = rsp
-        thread.registers['rbp'].value = rbp
-        thread.registers['rbx'].value = rbx
-        thread.registers['r12'].value = r12
-        thread.registers['r13'].value = r13
-        thread.registers['r14'].value = r14
-        thread.registers['r15'].value = r15
-        thread.registers['cs'].value = 2*8
-        thread.registers['ss'].value = 3*8
+        return self.__fetch_register_scheduled(thread, register)
 
-        thread.info.stack_pointer = rsp
-        thread.info.valid_stack = True
+    def has_frame_pointers(self):
+        """
+        Returns whether the kernel was built with frame pointers
+
+        CONFIG_FRAME_POINTER is used if the kernel configuration is
+        available.  Otherwise, kernels using the ORC unwinder are assumed
+        not to have frame pointers and others are assumed to have them.
+
+        Returns:
+            bool: Whether the kernel has frame pointers
+        """
+        if self.frame_pointers is None:
+            try:
+                self.frame_pointers = config['FRAME_POINTER'] == 'y'
+            except Exception:
+                orc = gdb.lookup_minimal_symbol('__start_orc_unwind_ip')
+                self.frame_pointers = orc is None
+        return self.frame_pointers
+
+    def unwind_frame_pointers(self, frame, stack, stack_base, is_text,
+                              max_depth=64):
+        """
+        Unwinds a scheduled-out task's stack using the frame pointers
+
+        Args:
+            frame (dict): The saved registers, see read_saved_frames
+            stack (bytes): The contents of the task's kernel stack
+            stack_base (int): The address of the start of the stack
+            is_text (callable): Returns whether an address is within
+                kernel or module text
+            max_depth (int, optional, default=64): The maximum number of
+                frames to return
+
+        Returns:
+            list of int: The program counter of each frame, innermost
+                first.  The walk ends at the first frame pointer or return
+                address that doesn't look valid.
+        """
+        if self.word is None:
+            if RawMemory.byte_order is None:
+                RawMemory.setup_byte_order()
+            prefix = '<'
+            if RawMemory.byte_order == 'big':
+                prefix = '>'
+            self.word = struct.Struct(prefix + 'QQ')
+
+        pcs = [ frame['rip'] ]
+        sp = frame['rsp']
+        bp = frame['rbp']
+        stack_end = stack_base + len(stack)
+        while len(pcs) < max_depth:
+            if bp & 7 or bp < sp or bp < stack_base or bp + 16 > stack_end:
+                break
+            (next_bp, ret) = self.word.unpack_from(stack, bp - stack_base)
+            if not is_text(ret):
+                break
+            pcs.append(ret)
+            sp = bp + 16
+            bp = next_bp
+        return pcs
 
     @classmethod
     def get_stack_pointer(cls, thread):
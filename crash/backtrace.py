@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+import bisect
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.memory import read_memory
+from crash.kernel import thread_size, kernel_text_ranges
+from crash.kernel import load_module_for_address
+from crash.cache.tasks import get_task, get_task_table
+
+class BacktraceEngine(object):
+    """
+    Unwinds the kernel stacks of many tasks in one pass
+
+    Switching to each thread and walking gdb frames costs a DWARF unwind
+    for every frame of every task.  Instead, the registers that each
+    scheduled-out task saved are read in one pass up front.  On kernels
+    built with frame pointers, each of those stacks is then read with a
+    single read and the frame pointer chain is followed within the
+    buffer.  Running tasks, and all tasks on kernels without frame
+    pointers, are unwound by gdb, using the registers already read.
+
+    The symbolic form of each return address, and of each distinct chain
+    of return addresses, is only computed once.
+
+    Args:
+        max_depth (int, optional, default=64): The maximum number of frames
+            to unwind for each task
+        use_frame_pointers (bool, optional, default=None): Whether to walk
+            the frame pointers.  Defaults to whether the architecture
+            reports that the kernel was built with them.
+        stack_size (int, optional, default=None): The size of each stack.
+            Defaults to THREAD_SIZE.
+    """
+    def __init__(self, max_depth=64, use_frame_pointers=None,
+                 stack_size=None):
+        self.arch = getattr(gdb.current_target(), 'arch', None)
+        if use_frame_pointers is None:
+            use_frame_pointers = (self.arch is not None and
+                                  hasattr(self.arch, 'has_frame_pointers') and
+                                  self.arch.has_frame_pointers())
+        self.use_frame_pointers = use_frame_pointers
+        self.max_depth = max_depth
+        if stack_size is None:
+            stack_size = thread_size()
+        self.stack_size = stack_size
+
+        ranges = kernel_text_ranges()
+        self.text_starts = [ r[0] for r in ranges ]
+        self.text_ends = [ r[1] for r in ranges ]
+
+        self.symbols = {}
+        self.function_names = {}
+        self.chains = {}
+        self.fp_unwinds = 0
+        self.gdb_unwinds = 0
+
+    def is_text(self, addr):
+        """
+        Returns whether an address is within kernel or module text
+
+        Args:
+            addr (int): The address
+
+        Returns:
+            bool: Whether the address is within text
+        """
+        idx = bisect.bisect_right(self.text_starts, addr) - 1
+        return idx >= 0 and addr < self.text_ends[idx]
+
+    @staticmethod
+    def __lookup_symbol(pc):
+        try:
+            out = gdb.execute("info symbol {:#x}".format(pc), to_string=True)
+        except gdb.error:
+            return "{:#x}".format(pc)
+        if out.startswith("No symbol"):
+            return "{:#x}".format(pc)
+        # e.g. "schedule + 42 in section .text of /path/to/module.ko"
+        return out.split(" in section ")[0].strip().replace(" + ", "+")
+
+    def symbol(self, pc):
+        """
+        Returns the symbolic form of an address, e.g. 'schedule+42'
+
+        Modules that are loaded lazily are loaded as needed.
+
+        Args:
+            pc (int): The address
+
+        Returns:
+            str: The symbol and offset, or the address in hex if it isn't
+                within a known symbol
+        """
+        try:
+            return self.symbols[pc]
+        except KeyError:
+            pass
+        load_module_for_address(pc)
+        name = self.__lookup_symbol(pc)
+        self.symbols[pc] = name
+        return name
+
+    def function(self, pc):
+        """
+        Returns the name of the function containing an address
+
+        Args:
+            pc (int): The address
+
+        Returns:
+            str: The function name, or the address in hex if it isn't
+                within a known symbol
+        """
+        try:
+            return self.function_names[pc]
+        except KeyError:
+            pass
+        name = self.symbol(pc).split('+')[0]
+        self.function_names[pc] = name
+        return name
+
+    def symbolize(self, pcs):
+        """
+        Returns the symbolic form of a chain of return addresses
+
+        Args:
+            pcs (tuple of int): The addresses
+
+        Returns:
+            tuple of str: The symbolic form of each address
+        """
+        try:
+            return self.chains[pcs]
+        except KeyError:
+            pass
+        frames = tuple([ self.symbol(pc) for pc in pcs ])
+        self.chains[pcs] = frames
+        return frames
+
+    def __fp_unwind(self, table, row, frame):
+        base = table.stack[row]
+        try:
+            stack = read_memory(base, self.stack_size)
+        except gdb.error:
+            return []
+        return self.arch.unwind_frame_pointers(frame, stack, base,
+                                               self.is_text, self.max_depth)
+
+    def __gdb_unwind(self, pid, frame):
+        try:
+            task = get_task(pid)
+        except KeyError:
+            return []
+        if frame is not None and task.saved_frame is None:
+            task.saved_frame = frame
+
+        pcs = []
+        try:
+            task.thread.switch()
+            f = gdb.newest_frame()
+            while f is not None and len(pcs) < self.max_depth:
+                pc = f.pc()
+                # Stop at the boundary to user space
+                if pcs and not self.is_text(pc):
+                    break
+                pcs.append(pc)
+                f = f.older()
+        except gdb.error:
+            pass
+        return pcs
+
+    def backtraces(self, rows=None):
+        """
+        Unwinds the kernel stacks of a set of tasks
+
+        The thread that was selected beforehand is selected again when the
+        iteration finishes.
+
+        Args:
+            rows (list of int, optional, default=None): The rows of the
+                task table describing the tasks.  Defaults to every task,
+                in pid order.
+
+        Yields:
+            (int, tuple of int): The row and the program counter of each
+                frame, innermost first
+        """
+        table = get_task_table()
+        if rows is None:
+            rows = table.order('pid')
+
+        frames = {}
+        if self.arch is not None and hasattr(self.arch, 'read_saved_frames'):
+            frames = self.arch.read_saved_frames([ table.address[row]
+                                                   for row in rows
+                                                   if not table.active[row] ])
+
+        selected = gdb.selected_thread()
+        try:
+            for row in rows:
+                frame = frames.get(table.address[row])
+                pcs = None
+                if frame is not None and self.use_frame_pointers:
+                    pcs = self.__fp_unwind(table, row, frame)
+                    # Only the saved pc means the chain was unusable
+                    if len(pcs) < 2:
+                        pcs = None
+                    else:
+                        self.fp_unwinds += 1
+                if pcs is None:
+                    pcs = self.__gdb_unwind(table.pid[row], frame)
+                    self.gdb_unwinds += 1
+                yield (row, tuple(pcs))
+        finally:
+            if selected is not None and selected.is_valid():
+                selected.switch()
+
+    def signatures(self, rows=None):
+        """
+        Groups tasks by the chain of return addresses on their stacks
+
+        Args:
+            rows (list of int, optional, default=None): See backtraces
+
+        Returns:
+            list of (tuple of int, list of int): Each distinct chain and
+                the rows of the tasks sharing it, most common first
+        """
+        groups = {}
+        for (row, pcs) in self.backtraces(rows):
+            groups.setdefault(pcs, []).append(row)
+        return sorted(groups.items(), key=lambda item: (-len(item[1]),
+                                                        item[0]))
+
+class StackGroup(object):
+    """
+    A group of tasks sharing a normalized stack
+
+    Attributes:
+        functions (tuple of str): The function names, innermost first
+        state (int): The task state shared by the tasks, or None if the
+            tasks weren't grouped by state
+        rows (list of int): The task table rows of the tasks, in the
+            order they were added
+        oldest_row (int): The row of the task that ran least recently
+    """
+    __slots__ = [ 'functions', 'state', 'rows', 'oldest_row' ]
+
+    def __init__(self, functions, state):
+        self.functions = functions
+        self.state = state
+        self.rows = []
+        self.oldest_row = None
+
+class StackAggregator(object):
+    """
+    Groups tasks by the functions on their kernel stacks
+
+    This is the equivalent of "foreach bt | uniq -c".  Stacks are
+    normalized to the names of their functions, dropping the offsets and
+    collapsing directly recursive calls, so each group describes one
+    code path.  The normalized form of each distinct chain of return
+    addresses is only computed once.
+
+    Args:
+        engine (BacktraceEngine): The engine used to unwind the stacks
+        by_state (bool, optional, default=True): Whether tasks in
+            different states are kept in separate groups
+    """
+    def __init__(self, engine, by_state=True):
+        self.engine = engine
+        self.by_state = by_state
+        self.table = get_task_table()
+        self.normalized = {}
+        self.groups = {}
+
+    def normalize(self, pcs):
+        """
+        Returns the normalized form of a chain of return addresses
+
+        Args:
+            pcs (tuple of int): The addresses, innermost first
+
+        Returns:
+            tuple of str: The function names, innermost first
+        """
+        try:
+            return self.normalized[pcs]
+        except KeyError:
+            pass
+        names = []
+        for pc in pcs:
+            name = self.engine.function(pc)
+            if not names or names[-1] != name:
+                names.append(name)
+        names = tuple(names)
+        self.normalized[pcs] = names
+        return names
+
+    def add(self, row, pcs):
+        """
+        Adds a task to its group
+
+        Args:
+            row (int): The task table row of the task
+            pcs (tuple of int): The return addresses on its stack
+
+        Returns:
+            (StackGroup, bool): The group and whether it is new
+        """
+        state = None
+        if self.by_state:
+            state = self.table.state[row]
+        key = (self.normalize(pcs), state)
+
+        new = False
+        try:
+            group = self.groups[key]
+        except KeyError:
+            group = StackGroup(key[0], state)
+            self.groups[key] = group
+            new = True
+
+        group.rows.append(row)
+        last_run = self.table.last_run
+        if (group.oldest_row is None or
+                last_run[row] < last_run[group.oldest_row]):
+            group.oldest_row = row
+        return (group, new)
+
+    def run(self, rows=None):
+        """
+        Unwinds and groups a set of tasks
+
+        The results are available while the tasks are being unwound.
+
+        Args:
+            rows (list of int, optional, default=None): See
+                BacktraceEngine.backtraces
+
+        Yields:
+            (int, StackGroup, bool): The row of each task, its group, and
+                whether the group is new
+        """
+        for (row, pcs) in self.engine.backtraces(rows):
+            (group, new) = self.add(row, pcs)
+            yield (row, group, new)
+
+    def sorted_groups(self):
+        """
+        Returns the groups, largest first
+
+        Returns:
+            list of StackGroup: The groups
+        """
+        return sorted(self.groups.values(),
+                      key=lambda group: (-len(group.rows), group.functions))
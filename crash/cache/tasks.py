@@ -7,14 +7,158 @@ from __future__ import division
 
 import gdb
 from crash.cache import CrashCache
+from crash.types.task import TaskTable
 
 tasks = {}
 
+# pid -> task_struct address for every task, loaded or not
+task_addresses = {}
+# task_struct address -> cpu for the tasks that were running
+active_tasks = {}
+task_loader = None
+task_table = None
+
 def cache_task(task):
     tasks[int(task.task_struct['pid'])] = task
 
+def index_task(pid, addr, cpu=None):
+    global task_table
+    task_addresses[pid] = addr
+    if cpu is not None:
+        active_tasks[addr] = cpu
+    task_table = None
+
+def set_task_loader(loader):
+    """
+    Sets the callback used to load indexed tasks on demand
+
+    Args:
+        loader (callable): Called with the task_struct address of a task
+            that has been indexed but not yet loaded.  It must register the
+            task using cache_task and return it, or return None if the task
+            could not be loaded.  None disables loading on demand.
+    """
+    global task_loader
+    task_loader = loader
+
 def get_task(pid):
-    return tasks[pid]
+    try:
+        return tasks[pid]
+    except KeyError:
+        if task_loader is None or pid not in task_addresses:
+            raise
+    task = task_loader(task_addresses[pid])
+    if task is None:
+        raise KeyError(pid)
+    return task
+
+def load_all_tasks():
+    """
+    Loads every indexed task that hasn't been loaded yet
+
+    With lazy task loading, gdb only knows about the tasks loaded so far.
+    Code that iterates over gdb.selected_inferior().threads() must call
+    this first.  Commands that only need task information use
+    get_task_table instead, which covers every task without loading it.
+    """
+    if task_loader is None:
+        return
+    for pid in sorted(task_addresses.keys()):
+        if pid not in tasks:
+            task_loader(task_addresses[pid])
+
+def get_task_table():
+    """
+    Returns a TaskTable describing every indexed task
+
+    The table is built on first use and kept until the index changes.
+
+    Returns:
+        TaskTable: The table
+    """
+    global task_table
+    if task_table is None:
+        task_table = TaskTable(list(task_addresses.values()), active_tasks)
+    return task_table
+
+def _tasks_for_rows(table, rows):
+    return [ get_task(table.pid[row]) for row in rows ]
+
+def get_task_by_address(addr):
+    """
+    Returns the task for the task_struct at an address
+
+    Args:
+        addr (int): The address of the task_struct
+
+    Returns:
+        LinuxTask: The task
+
+    Raises:
+        KeyError: There is no task at the address
+    """
+    table = get_task_table()
+    row = table.row_of_address(addr)
+    if row is None:
+        raise KeyError(addr)
+    return get_task(table.pid[row])
+
+def get_thread_group(tgid):
+    """
+    Returns the tasks in a thread group
+
+    Args:
+        tgid (int): The thread group id
+
+    Returns:
+        list of LinuxTask: The tasks
+    """
+    table = get_task_table()
+    return _tasks_for_rows(table, table.thread_group(tgid))
+
+def get_children(pid):
+    """
+    Returns the children of a task
+
+    Args:
+        pid (int): The pid of the parent
+
+    Returns:
+        list of LinuxTask: The tasks
+    """
+    table = get_task_table()
+    return _tasks_for_rows(table, table.children(pid))
+
+def get_tasks_by_comm(comm):
+    """
+    Returns the tasks with a command name
+
+    Args:
+        comm (str): The command name
+
+    Returns:
+        list of LinuxTask: The tasks
+    """
+    table = get_task_table()
+    return _tasks_for_rows(table, table.rows_with_comm(comm))
+
+def search_tasks_by_comm(pattern):
+    """
+    Returns the tasks whose command names match a regular expression
+
+    Args:
+        pattern (str or compiled regular expression): The regular
+            expression, matched with search
+
+    Returns:
+        list of LinuxTask: The tasks
+    """
+    table = get_task_table()
+    return _tasks_for_rows(table, table.search_comm(pattern))
 
 def drop_task(pid):
+    global task_table
     del tasks[pid]
+    addr = task_addresses.pop(pid, None)
+    active_tasks.pop(addr, None)
+    task_table = None
@@ -13,6 +13,8 @@ import re
 
 from crash.commands import CrashCommand, CrashCommandParser
 from crash.exceptions import DelayedAttributeError
+from crash.layout import StructLayout
+from crash.memory import read_memory
 
 if sys.version_info.major >= 3:
     long = int
@@ -156,7 +158,7 @@ EXAMPLES
         parser.format_usage = lambda: 'log [-tdm]\n'
         CrashCommand.__init__(self, name, parser)
 
-    __types__ = [ 'struct printk_log *' , 'char *' ]
+    __types__ = [ 'struct printk_log *' ]
     __symvals__ = [ 'log_buf', 'log_buf_len', 'log_first_idx', 'log_next_idx',
                     'clear_seq', 'log_first_seq', 'log_next_seq' ]
 
@@ -175,49 +177,43 @@ EXAMPLES
 
         return '\n'.join(lines)
 
+    printk_log_layout = None
+
     def log_from_idx(self, logbuf, idx, dict_needed=False):
-        msg = (logbuf + idx).cast(self.printk_log_p_type)
+        if self.printk_log_layout is None:
+            LogCommand.printk_log_layout = StructLayout(
+                        self.printk_log_p_type.target(),
+                        [ 'ts_nsec', 'len', 'text_len', 'dict_len', 'level' ])
 
-        try:
-            textval = (msg.cast(self.char_p_type) +
-                       self.printk_log_p_type.target().sizeof)
-            text = textval.string(length=long(msg['text_len']))
-        except UnicodeDecodeError as e:
-            print(e)
+        layout = self.printk_log_layout
+        addr = long(logbuf) + idx
+        msg = layout.read(addr)
 
-        msglen = int(msg['len'])
+        textlen = msg.text_len
+        textaddr = addr + layout.size
+        text = read_memory(textaddr, textlen).tobytes()
+        text = text.decode('utf-8', 'replace')
 
         # A zero-length message means we wrap back to the beginning
-        if msglen == 0:
+        if msg.len == 0:
             nextidx = 0
         else:
-            nextidx = idx + msglen
-
-        textlen = int(msg['text_len'])
+            nextidx = idx + msg.len
 
         msgdict = {
-            'text' : text[0:textlen],
-            'timestamp' : long(msg['ts_nsec']),
-            'level' : int(msg['level']),
+            'text' : text,
+            'timestamp' : msg.ts_nsec,
+            'level' : msg.level,
             'next' : nextidx,
             'dict' : [],
         }
 
-        if dict_needed:
-            dict_len = int(msg['dict_len'])
-            d = (msg.cast(self.char_p_type) +
-                 self.printk_log_p_type.target().sizeof + textlen)
-            s = ''
-
-            for i in range(0, dict_len):
-                if d[i]:
-                    s += chr(d[i])
-                else:
-                    msgdict['dict'].append(s)
-                    s = ''
-
-            if s != '':
-                msgdict['dict'].append(s)
+        if dict_needed and msg.dict_len:
+            d = read_memory(textaddr + textlen, msg.dict_len).tobytes()
+            entries = d.split(b'\0')
+            if entries[-1] == b'':
+                entries.pop()
+            msgdict['dict'] = [ e.decode('utf-8', 'replace') for e in entries ]
         return msgdict
 
     def get_log_msgs(self, dict_needed=False):
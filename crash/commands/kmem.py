@@ -5,10 +5,19 @@ import gdb
 import crash
 from crash.commands import CrashCommand, CrashCommandParser
 from crash.types.slab import kmem_cache_get_all, kmem_cache_from_name, slab_from_obj_addr
+from crash.types.slab import get_slab_index
+from crash.workers import DumpWorkerPool
 from crash.types.zone import for_each_zone, for_each_populated_zone
 from crash.types.vmstat import VmStat
+from crash.types.memmap import PageCensus
+from crash.types.page import Page
 import argparse
 import re
+import sys
+import time
+
+# Number of page flag combinations shown by kmem -i
+COMBINATIONS_SHOWN = 32
 
 def getValue(sym):
     return gdb.lookup_symbol(sym, None)[0].value()
@@ -22,11 +31,18 @@ NAME
 SYNOPSIS
   kmem addr             - try to find addr within kmem caches
   kmem -s [slabname]    - check consistency of single or all kmem cache
+  kmem -s -j workers    - check all kmem caches using worker processes
   kmem -z               - report zones
   kmem -V               - report vmstats
+  kmem -i               - report where the memory went, from the mem_map
 
 DESCRIPTION
   This command currently offers very basic kmem cache query and checking.
+
+  With -j, the caches are split across that many worker processes, each
+  of which opens the same kernel and vmcore.  The output of each cache is
+  displayed in cache order once all of them have been checked, followed
+  by a summary of the time each took.
     """
 
     def __init__(self, name):
@@ -36,10 +52,12 @@ DESCRIPTION
         group.add_argument('-s', action='store_true', default=False)
         group.add_argument('-z', action='store_true', default=False)
         group.add_argument('-V', action='store_true', default=False)
+        group.add_argument('-i', action='store_true', default=False)
 
+        parser.add_argument('-j', type=int, default=0)
         parser.add_argument('arg', nargs=argparse.REMAINDER)
 
-        parser.format_usage = lambda : "kmem [-s] [addr | slabname]\n"
+        parser.format_usage = lambda : "kmem [-s [-j workers]] [addr | slabname]\n"
         super(KmemCommand, self).__init__(name, parser)
 
     def execute(self, args):
@@ -49,6 +67,9 @@ DESCRIPTION
         elif args.V:
             self.print_vmstats()
             return
+        elif args.i:
+            self.print_census()
+            return
         elif args.s:
             if args.arg:
                 cache_name = args.arg[0]
@@ -58,11 +79,18 @@ DESCRIPTION
                     print "Cache {} not found.".format(cache_name)
                     return
                 cache.check_all()
+            elif args.j > 0:
+                self.check_caches_parallel(args.j)
             else:
+                print "Indexing all slabs..."
+                index = get_slab_index()
+                if index.failed:
+                    print ("%d slab lists could not be read completely" %
+                                                                index.failed)
                 print "Checking all kmem caches..."  
                 for cache in kmem_cache_get_all():
                     print cache.name
-                    cache.check_all()
+                    cache.check_all(index)
 
             print "Checking done."
             return
@@ -105,6 +133,46 @@ DESCRIPTION
                 print ("FREE object %x from slab %s (in %s)" %
                                            (obj[1], name, ac_desc))
 
+    def check_caches_parallel(self, workers):
+        names = [cache.name for cache in kmem_cache_get_all()]
+        print("Checking all kmem caches using %d workers..." % workers)
+        try:
+            pool = DumpWorkerPool(workers)
+        except RuntimeError as e:
+            raise gdb.GdbError(str(e))
+
+        start = time.time()
+        results = pool.run("crash.types.slab:check_kmem_cache", names)
+        elapsed = time.time() - start
+
+        for res in results:
+            print res.item
+            sys.stdout.write(res.output)
+            if res.error:
+                print(res.error)
+
+        print
+        print("%-24s %6s %10s %8s  %s" %
+                        ("CACHE", "WORKER", "SECONDS", "LINES", "STATUS"))
+        failed = 0
+        for res in results:
+            if res.error:
+                status = "failed"
+                failed += 1
+            else:
+                status = "checked"
+            if res.worker is None:
+                worker = "-"
+            else:
+                worker = str(res.worker)
+            print("%-24s %6s %10.2f %8d  %s" %
+                        (res.item, worker, res.seconds,
+                         res.output.count("\n"), status))
+        print
+        print("%d caches checked in %.2f seconds (%.2f seconds of work), %d failed" %
+                        (len(results), elapsed,
+                         sum([res.seconds for res in results]), failed))
+
     def __print_vmstat(self, vmstat, diffs):
         vmstat_names = VmStat.get_stat_names();
         just = max(map(len, vmstat_names))
@@ -149,6 +217,62 @@ DESCRIPTION
         for name, val in zip(names, vm_events):
             print("%s: %d" % (name.rjust(just), val))
 
+    def __print_census_row(self, label, counts, total):
+        cells = ["%10d" % count for count in counts]
+        print("%-16s %10d %s" % (label, total, " ".join(cells)))
+
+    def print_census(self):
+        census = PageCensus()
+        census.run()
+
+        names = {}
+        for zone in for_each_zone():
+            names[(zone.nid, zone.zid)] = zone.gdb_obj["name"].string()
+
+        page_kb = Page.PAGE_SIZE / 1024
+        print("%-16s %10s %s" % ("", "PAGES", " ".join(["%10s" % c.upper()
+                                           for c in census.categories])))
+        for key in sorted(census.zones.keys()):
+            counts = census.zones[key]
+            label = "node %d %s" % (key[0], names.get(key, "zone %d" % key[1]))
+            self.__print_census_row(label, counts, sum(counts))
+        self.__print_census_row("total", census.totals, census.pages)
+        print
+        for (name, count) in zip(census.categories, census.totals):
+            percent = 0.0
+            if census.pages:
+                percent = 100.0 * count / census.pages
+            print("%10s: %10d pages %12d kB %5.1f%%" %
+                            (name, count, count * page_kb, percent))
+        if census.missing:
+            print("%10s: %10d pages (struct pages could not be read)" %
+                            ("unreadable", census.missing))
+
+        print
+        print "  COMPOUND ORDERS:"
+        for order in sorted(census.orders.keys()):
+            count = census.orders[order]
+            print("%5d: %10d allocations %12d pages" %
+                            (order, count, count << order))
+
+        print
+        print "  FREE BLOCK ORDERS:"
+        for order in sorted(census.free_orders.keys()):
+            count = census.free_orders[order]
+            print("%5d: %10d blocks %12d pages" %
+                            (order, count, count << order))
+
+        print
+        print "  PAGE FLAGS:"
+        combinations = sorted(census.flag_combinations.items(),
+                              key=lambda item: -item[1])
+        for (flags, count) in combinations[:COMBINATIONS_SHOWN]:
+            flag_names = "|".join(census.flag_names(flags)) or "(none)"
+            print("%10d  %016x  %s" % (count, flags, flag_names))
+        if len(combinations) > COMBINATIONS_SHOWN:
+            print("%d more combinations" %
+                            (len(combinations) - COMBINATIONS_SHOWN))
+
     def print_zones(self):
         for zone in for_each_zone():
             zone_struct = zone.gdb_obj
@@ -5,16 +5,17 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import division
 
-import gdb
 import argparse
 import sys
+import re
 
 if sys.version_info.major >= 3:
     long = int
 
 from crash.commands import CrashCommand, CrashCommandParser
 from crash.commands import CrashCommandLineError
-from crash.types.task import LinuxTask, TaskStateFlags as TF
+from crash.types.task import task_state_string, setup_task_state_strings
+import crash.cache.tasks
 
 class PSCommand(CrashCommand):
     """display process status information
@@ -431,80 +432,63 @@ EXAMPLES
         self.num_line_template = "{0} {1:>5}   {2:>5}  {3:>3}  {4:{5}d}  {6:3}  {7:.1f}"
         self.num_line_template += " {8:7d} {9:6d}  {10:.{11}}{12}{13:.{14}}"
 
-    def task_state_string(self, task):
-        state = task.task_state()
-        buf = None
-        exclusive = False
-
-        try:
-            exclusive = (state & TF.TASK_EXCLUSIVE) == TF.TASK_EXCLUSIVE
-            state &= ~TF.TASK_EXCLUSIVE
-        except AttributeError:
-            pass
+    def state_string(self, state):
+        return task_state_string(state)
 
-        buf = '??'
-        if hasattr(TF, 'TASK_DEAD'):
-            try:
-                buf = self.task_states[state & ~TF.TASK_DEAD]
-            except KeyError:
-                pass
-
-            if state & TF.TASK_DEAD and task.maybe_dead():
-                buf = self.task_states[TF.TASK_DEAD]
-
-        if buf is not None and exclusive:
-            buf += "EX"
+    def task_state_string(self, task):
+        return self.state_string(task.task_state())
 
-        return buf
+    task_header_template = "PID: {0:-5d}  TASK: {1:x}  CPU: {2:>2d}  COMMAND: \"{3}\""
 
     @classmethod
     def task_header(cls, task):
         task_struct = task.task_struct
-        template = "PID: {0:-5d}  TASK: {1:x}  CPU: {2:>2d}  COMMAND: \"{3}\""
         cpu = task.get_last_cpu()
         if task.active:
             cpu = task.cpu
-        return template.format(int(task_struct['pid']),
-                               long(task_struct.address), cpu,
-                               task_struct['comm'].string())
+        return cls.task_header_template.format(int(task_struct['pid']),
+                                           long(task_struct.address), cpu,
+                                           task_struct['comm'].string())
 
-    def print_last_run(self, task):
+    @classmethod
+    def row_header(cls, table, row):
+        return cls.task_header_template.format(table.pid[row],
+                                           table.address[row],
+                                           table.cpu[row], table.comm[row])
+
+    def print_last_run(self, table, row):
         radix = 10
         if radix == 10:
             radix_string = "d"
         else:
             radix_string = "x"
         template = "[{0:{1}}] [{2}]  {3}"
-        print(template.format(task.last_run(), radix_string,
-                              self.task_state_string(task),
-                              self.task_header(task)))
-
-    def print_one(self, argv, thread):
-        task = thread.info
-        specified = argv.args is None
-        task_struct = task.task_struct
-
-        pointer = task_struct.address
-        if argv.s:
-            pointer = task.get_stack_pointer()
-
-        if argv.n:
-            pointer = thread.num
+        print(template.format(table.last_run[row], radix_string,
+                              self.state_string(table.state[row]),
+                              self.row_header(table, row)))
 
+    def print_one(self, argv, table, row):
         if argv.l:
-            self.print_last_run(task)
+            self.print_last_run(table, row)
             return
 
-        try:
-            parent_pid = task_struct['parent']['pid']
-        except KeyError:
+        pointer = table.address[row]
+        if argv.s or argv.n:
+            # These need the task registered as a thread
+            task = crash.cache.tasks.get_task(table.pid[row])
+            if argv.s:
+                pointer = task.get_stack_pointer()
+            else:
+                pointer = task.thread.num
+
+        if table.ppid[row] < 0:
             # This can happen on live systems where pids have gone
             # away
-            print("Couldn't locate task at address {:#x}"
-                  .format(task_struct.parent.address))
+            print("Couldn't locate parent of task at address {:#x}"
+                  .format(table.address[row]))
             return
 
-        if task.active:
+        if table.active[row]:
             active = ">"
         else:
             active = " "
@@ -514,47 +498,60 @@ EXAMPLES
             line = self.num_line_template
             width = 7
 
-        print(line.format(active, int(task_struct['pid']), int(parent_pid),
-                          int(task.get_last_cpu()), long(pointer),
-                          width, self.task_state_string(task), 0,
-                          task.total_vm * 4096 // 1024,
-                          task.rss * 4096 // 1024,
-                          "[", int(task.is_kernel_task()),
-                          task_struct['comm'].string(),
-                          "]", int(task.is_kernel_task())))
-
-    def setup_task_states(self):
-        self.task_states = {
-            TF.TASK_RUNNING         : "RU",
-            TF.TASK_INTERRUPTIBLE   : "IN",
-            TF.TASK_UNINTERRUPTIBLE : "UN",
-            TF.TASK_ZOMBIE          : "ZO",
-            TF.TASK_STOPPED         : "ST",
-        }
-
-        if hasattr(TF, 'TASK_EXCLUSIVE'):
-            self.task_states[TF.TASK_EXCLUSIVE] = "EX"
-        if hasattr(TF, 'TASK_SWAPPING'):
-            self.task_states[TF.TASK_SWAPPING] = "SW"
-        if hasattr(TF, 'TASK_DEAD'):
-            self.task_states[TF.TASK_DEAD] = "DE"
-        if hasattr(TF, 'TASK_TRACING_STOPPED'):
-            self.task_states[TF.TASK_TRACING_STOPPED] = "TR"
+        kernel = table.kernel[row]
+        print(line.format(active, table.pid[row], table.ppid[row],
+                          table.cpu[row], long(pointer),
+                          width, self.state_string(table.state[row]), 0,
+                          table.total_vm[row] * 4096 // 1024,
+                          table.rss[row] * 4096 // 1024,
+                          "[", kernel, table.comm[row], "]", kernel))
+
+    def select_rows(self, table, args):
+        selected = set()
+        for arg in args:
+            if arg.startswith('\\'):
+                selected.update(table.rows_with_comm(arg[1:]))
+            elif len(arg) > 1 and arg[0] == "'" and arg[-1] == "'":
+                try:
+                    regex = re.compile(arg[1:-1])
+                except re.error as e:
+                    raise CrashCommandLineError("invalid regular expression {}: {}"
+                                                .format(arg, str(e)))
+                selected.update(table.search_comm(regex))
+            elif arg.isdigit():
+                row = table.row_of_pid(int(arg))
+                if row is None:
+                    print("ps: invalid task or pid value: {}".format(arg))
+                else:
+                    selected.add(row)
+            else:
+                row = None
+                try:
+                    row = table.row_of_address(int(arg, 16))
+                except ValueError:
+                    pass
+                if row is not None:
+                    selected.add(row)
+                else:
+                    rows = table.rows_with_comm(arg)
+                    if not rows:
+                        print("ps: invalid task, pid, or command: {}"
+                              .format(arg))
+                    selected.update(rows)
+        return selected
 
     def execute(self, argv):
-        sort_by_pid = lambda x: x.info.task_struct['pid']
-        sort_by_last_run = lambda x: -x.info.last_run()
-
-        if not hasattr(self, 'task_states'):
-            try:
-                self.setup_task_states()
-            except AttributeError:
-                raise CrashCommandLineError("The task subsystem is not available.")
+        try:
+            setup_task_state_strings()
+        except AttributeError:
+            raise CrashCommandLineError("The task subsystem is not available.")
 
-        sort_by = sort_by_pid
         if argv.l:
-            sort_by = sort_by_last_run
+            column = 'last_run'
+            reverse = True
         else:
+            column = 'pid'
+            reverse = False
             if argv.s:
                 col4name = "KSTACK"
                 width = 16
@@ -566,18 +563,21 @@ EXAMPLES
                 width = 16
             print(self.header_template.format(width, col4name))
 
-        if not argv.args:
-            for thread in sorted(gdb.selected_inferior().threads(), key=sort_by):
-                task = thread.info
-                if task:
-                    if argv.k and not task.is_kernel_task():
-                        continue
-                    if argv.u and task.is_kernel_task():
-                        continue
+        table = crash.cache.tasks.get_task_table()
+        rows = table.order(column, reverse)
+        if argv.args:
+            selected = self.select_rows(table, argv.args)
+            rows = [ row for row in rows if row in selected ]
+
+        for row in rows:
+            if argv.k and not table.kernel[row]:
+                continue
+            if argv.u and table.kernel[row]:
+                continue
+
+            # Only show thread group leaders
+#            if argv.G and table.pid[row] != table.tgid[row]:
 
-                    # Only show thread group leaders
-#                    if argv.G and task.pid != int(task.task_struct['tgid']):
+            self.print_one(argv, table, row)
 
-                    task.update_mem_usage()
-                    self.print_one(argv, thread)
 PSCommand()
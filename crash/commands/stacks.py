@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import gdb
+import sys
+import argparse
+from crash.commands import CrashCommand, CrashCommandParser
+from crash.commands import CrashCommandLineError
+from crash.backtrace import BacktraceEngine, StackAggregator
+from crash.types.task import task_state_string, setup_task_state_strings
+import crash.cache.tasks
+
+class StacksCommand(CrashCommand):
+    """summarize the kernel stacks of all tasks
+
+NAME
+  stacks - summarize the kernel stacks of all tasks
+
+SYNOPSIS
+  stacks [-k|-u] [-s] [-p] [-q] [-n samples] [-d depth] [-g]
+
+DESCRIPTION
+  This command unwinds the kernel stack of every task and groups the
+  tasks by the functions on their stacks, like "foreach bt | uniq -c".
+  Each group is displayed once, with the number of tasks in it, a sample
+  of their PIDs, and the task in it that ran least recently.  The largest
+  groups are displayed first.
+
+  While the stacks are unwound, each new group is reported as it is
+  found, along with the first task in it.
+
+  On kernels built with frame pointers, the stacks of tasks that are not
+  running are walked directly from memory, which is much faster than
+  unwinding each task in gdb.
+
+        -k  restrict the output to kernel threads.
+        -u  restrict the output to user tasks.
+        -s  keep tasks in different states in separate groups.
+        -p  group by return address rather than by function, and display
+            the addresses.
+        -q  don't report new groups while unwinding.
+ -n samples  display at most this many PIDs per group (default 8).
+  -d depth  unwind at most depth frames per task (default 64).
+        -g  unwind every task using gdb.
+
+EXAMPLES
+  Display the stacks of all user tasks, keeping states separate:
+
+    stacks -u -s
+    """
+    def __init__(self, name):
+        parser = CrashCommandParser(prog=name)
+
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('-k', action='store_true', default=False)
+        group.add_argument('-u', action='store_true', default=False)
+
+        parser.add_argument('-s', action='store_true', default=False)
+        parser.add_argument('-p', action='store_true', default=False)
+        parser.add_argument('-q', action='store_true', default=False)
+        parser.add_argument('-n', type=int, default=8)
+        parser.add_argument('-d', type=int, default=64)
+        parser.add_argument('-g', action='store_true', default=False)
+
+        parser.format_usage = lambda: \
+            "stacks [-k|-u] [-s] [-p] [-q] [-n samples] [-d depth] [-g]\n"
+        CrashCommand.__init__(self, name, parser)
+
+    def print_addresses(self, engine, table, pcs, rows, samples):
+        print("{} task{}:".format(len(rows), "s" if len(rows) != 1 else ""))
+        self.print_samples(table, rows, samples)
+        for (i, name) in enumerate(engine.symbolize(pcs)):
+            print("  #{:<2d} {:#x} {}".format(i, pcs[i], name))
+        print()
+
+    def print_group(self, table, group, samples):
+        line = "{} task{}".format(len(group.rows),
+                                  "s" if len(group.rows) != 1 else "")
+        if group.state is not None:
+            line += " [{}]".format(task_state_string(group.state))
+        oldest = group.oldest_row
+        line += ", oldest PID {} last ran at {}:".format(table.pid[oldest],
+                                                         table.last_run[oldest])
+        print(line)
+        self.print_samples(table, group.rows, samples)
+        for (i, name) in enumerate(group.functions):
+            print("  #{:<2d} {}".format(i, name))
+        print()
+
+    @staticmethod
+    def print_samples(table, rows, samples):
+        pids = [ str(table.pid[row]) for row in rows[:samples] ]
+        if len(rows) > samples:
+            pids.append("...")
+        print("  PIDs: {}".format(", ".join(pids)))
+
+    def execute(self, args):
+        if args.d < 1:
+            raise CrashCommandLineError("depth must be at least 1")
+        if args.n < 0:
+            raise CrashCommandLineError("samples must not be negative")
+        try:
+            setup_task_state_strings()
+        except AttributeError:
+            raise CrashCommandLineError("The task subsystem is not available.")
+
+        table = crash.cache.tasks.get_task_table()
+        rows = table.order('pid')
+        if args.k:
+            rows = [ row for row in rows if table.kernel[row] ]
+        elif args.u:
+            rows = [ row for row in rows if not table.kernel[row] ]
+
+        use_frame_pointers = None
+        if args.g:
+            use_frame_pointers = False
+        engine = BacktraceEngine(args.d, use_frame_pointers)
+
+        if args.p:
+            signatures = engine.signatures(rows)
+            for (pcs, group) in signatures:
+                self.print_addresses(engine, table, pcs, group, args.n)
+            count = len(signatures)
+        else:
+            aggregator = StackAggregator(engine, args.s)
+            for (row, group, new) in aggregator.run(rows):
+                if new and not args.q:
+                    print("new stack: PID {} [{}] {}".format(table.pid[row],
+                                        task_state_string(table.state[row]),
+                                        " <- ".join(group.functions[:4])))
+                    sys.stdout.flush()
+            if not args.q:
+                print()
+
+            groups = aggregator.sorted_groups()
+            for group in groups:
+                self.print_group(table, group, args.n)
+            count = len(groups)
+
+        print("{} tasks, {} distinct stacks ({} walked with frame pointers, "
+              "{} unwound by gdb)".format(len(rows), count,
+                                          engine.fp_unwinds,
+                                          engine.gdb_unwinds))
+
+StacksCommand("stacks")
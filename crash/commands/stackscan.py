@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import gdb
+import sys
+import argparse
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.commands import CrashCommand, CrashCommandParser
+from crash.commands import CrashCommandLineError
+from crash.stackscan import StackScanner
+from crash.backtrace import BacktraceEngine
+import crash.cache.tasks
+
+class StackScanCommand(CrashCommand):
+    """search the kernel stacks of all tasks for values
+
+NAME
+  stackscan - search the kernel stacks of all tasks for values
+
+SYNOPSIS
+  stackscan [-k|-u] [-T] [address | expression] ...
+
+DESCRIPTION
+  This command reads the whole kernel stack of every task and displays
+  each word that matches one of the given values, without unwinding the
+  stacks.  This is useful to find the tasks that reference an object,
+  such as a lock or a locked inode, or that have passed through a
+  function.  Each value may be an address or a gdb expression.
+
+  For each match, the task, the address of the word on the stack, and
+  the value are displayed.  Values within kernel or module text are also
+  displayed symbolically.
+
+        -k  restrict the search to kernel threads.
+        -u  restrict the search to user tasks.
+        -T  also display every value within kernel or module text.
+
+EXAMPLES
+  Find the tasks referencing an inode:
+
+    stackscan ffff88003a9d8e48
+
+  Find the tasks that have passed through a function:
+
+    stackscan -T
+    """
+    def __init__(self, name):
+        parser = CrashCommandParser(prog=name)
+
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('-k', action='store_true', default=False)
+        group.add_argument('-u', action='store_true', default=False)
+
+        parser.add_argument('-T', action='store_true', default=False)
+        parser.add_argument('args', nargs=argparse.REMAINDER)
+
+        parser.format_usage = lambda: \
+            "stackscan [-k|-u] [-T] [address | expression] ...\n"
+        CrashCommand.__init__(self, name, parser)
+
+    @staticmethod
+    def parse_value(arg):
+        try:
+            return long(arg, 16)
+        except ValueError:
+            pass
+        try:
+            value = gdb.parse_and_eval(arg)
+        except gdb.error as e:
+            raise CrashCommandLineError("invalid address or expression {}: {}"
+                                        .format(arg, str(e)))
+        # Functions and arrays are searched for by address
+        if value.type.strip_typedefs().code in (gdb.TYPE_CODE_FUNC,
+                                                gdb.TYPE_CODE_ARRAY):
+            value = value.address
+        return long(value)
+
+    def execute(self, args):
+        if not args.args and not args.T:
+            raise CrashCommandLineError("no values to search for")
+
+        addresses = [ self.parse_value(arg) for arg in args.args ]
+
+        table = crash.cache.tasks.get_task_table()
+        rows = table.order('pid')
+        if args.k:
+            rows = [ row for row in rows if table.kernel[row] ]
+        elif args.u:
+            rows = [ row for row in rows if not table.kernel[row] ]
+
+        scanner = StackScanner(addresses, args.T)
+        engine = BacktraceEngine()
+        tasks = set()
+        count = 0
+        for (row, offset, value) in scanner.scan(rows):
+            name = ""
+            if engine.is_text(value):
+                name = " " + engine.symbol(value)
+            print("PID: {:<5d}  TASK: {:x}  {:x}: {:x}{}"
+                  .format(table.pid[row], table.address[row],
+                          table.stack[row] + offset, value, name))
+            tasks.add(row)
+            count += 1
+
+        print("{} matches in the stacks of {} tasks".format(count,
+                                                            len(tasks)))
+        if scanner.failed:
+            print("{} stacks could not be read".format(scanner.failed))
+
+StackScanCommand("stackscan")
@@ -17,28 +17,35 @@ NAME
   task - select task by pid
 
 SYNOPSIS
-  task <pid>
+  task <pid | taskp>
 
 DESCRIPTION
-  This command selects the appropriate gdb thread using its Linux pid.
+  This command selects the appropriate gdb thread using its Linux pid
+  or the hexadecimal address of its task_struct.
 
 EXAMPLES
     task 1402
+    task ffff88003a9d8000
     """
     def __init__(self, name):
 
         parser = CrashCommandParser(prog=name)
 
-        parser.add_argument('pid', type=int, nargs=1)
+        parser.add_argument('pid', nargs=1)
 
-        parser.format_usage = lambda: "thread <pid>\n"
+        parser.format_usage = lambda: "task <pid | taskp>\n"
         CrashCommand.__init__(self, name, parser)
 
     def execute(self, args):
+        arg = args.pid[0]
         try:
-            thread = crash.cache.tasks.get_task(args.pid[0]).thread
-            gdb.execute("thread {}".format(thread.num))
-        except KeyError:
-            print("No such task with pid {}".format(args.pid[0]))
+            if arg.isdigit():
+                task = crash.cache.tasks.get_task(int(arg))
+            else:
+                task = crash.cache.tasks.get_task_by_address(int(arg, 16))
+        except (KeyError, ValueError):
+            print("No such task with pid or address {}".format(arg))
+            return
+        gdb.execute("thread {}".format(task.thread.num))
 
 TaskCommand("task")
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+from collections import OrderedDict
+
+class PageCache(object):
+    """
+    A bounded cache of page-sized buffers read from the vmcore
+
+    Pages are keyed by their index (address // page size) in the
+    kernel virtual address space.  When the cache is full, the entry
+    selected by the eviction policy is dropped to make room.
+
+    Args:
+        pages (int, optional, default=4096): The maximum number of pages
+            to keep in the cache.  A value of 0 disables caching.
+        policy (str, optional, default='lru'): The eviction policy.
+            'lru' evicts the least recently used page and 'fifo' evicts
+            the page that was inserted first.
+
+    Raises:
+        ValueError: The size or policy is invalid
+    """
+    policies = ('lru', 'fifo')
+
+    def __init__(self, pages=4096, policy='lru'):
+        self.pages = OrderedDict()
+        self.max_pages = 0
+        self.policy = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.set_policy(policy)
+        self.resize(pages)
+
+    def set_policy(self, policy):
+        """
+        Selects the eviction policy
+
+        Args:
+            policy (str): 'lru' or 'fifo'
+
+        Raises:
+            ValueError: The policy is not known
+        """
+        if policy not in self.policies:
+            raise ValueError("Unknown cache eviction policy `{}'"
+                             .format(policy))
+        self.policy = policy
+
+    def resize(self, pages):
+        """
+        Changes the maximum number of pages kept in the cache
+
+        Entries are evicted according to the policy if the cache currently
+        holds more than the new maximum.
+
+        Args:
+            pages (int): The maximum number of pages.  0 disables caching.
+
+        Raises:
+            ValueError: The size is negative
+        """
+        if pages < 0:
+            raise ValueError("Cache size must not be negative")
+        self.max_pages = pages
+        while len(self.pages) > pages:
+            self.pages.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, index):
+        """
+        Returns the cached buffer for a page
+
+        Args:
+            index (int): The page index
+
+        Returns:
+            bytearray: The contents of the page or
+            None: if the page is not cached
+        """
+        try:
+            buf = self.pages[index]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        if self.policy == 'lru':
+            del self.pages[index]
+            self.pages[index] = buf
+        self.hits += 1
+        return buf
+
+    def peek(self, index):
+        """
+        Returns the cached buffer for a page without updating statistics
+        or the eviction order
+
+        Args:
+            index (int): The page index
+
+        Returns:
+            bytearray: The contents of the page or
+            None: if the page is not cached
+        """
+        return self.pages.get(index)
+
+    def insert(self, index, buf):
+        """
+        Adds a page to the cache, evicting another page if required
+
+        Args:
+            index (int): The page index
+            buf (bytearray): The contents of the page
+        """
+        if self.max_pages == 0:
+            return
+
+        if index in self.pages:
+            del self.pages[index]
+        elif len(self.pages) >= self.max_pages:
+            self.pages.popitem(last=False)
+            self.evictions += 1
+        self.pages[index] = buf
+
+    def flush(self):
+        """Drops every page from the cache"""
+        self.pages.clear()
+
+    def stats(self):
+        """
+        Returns the cache statistics
+
+        Returns:
+            dict: The 'pages', 'max_pages', 'hits', 'misses' and
+                'evictions' counters
+        """
+        return {
+            'pages' : len(self.pages),
+            'max_pages' : self.max_pages,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'evictions' : self.evictions,
+        }
+
+    def __contains__(self, index):
+        return index in self.pages
+
+    def __len__(self):
+        return len(self.pages)
+
+class MissingPageCache(object):
+    """
+    A bounded record of pages that could not be read from the vmcore
+
+    Filtered dumps omit whole pages, and translation failures apply to
+    whole pages as well.  Remembering the error for each such page lets
+    repeated reads fail immediately instead of asking libkdumpfile again.
+
+    Args:
+        pages (int, optional, default=65536): The maximum number of pages
+            to remember.  A value of 0 disables the cache.
+
+    Raises:
+        ValueError: The size is negative
+    """
+    def __init__(self, pages=65536):
+        self.pages = OrderedDict()
+        self.max_pages = 0
+        self.hits = 0
+
+        self.resize(pages)
+
+    def resize(self, pages):
+        """
+        Changes the maximum number of pages remembered
+
+        Args:
+            pages (int): The maximum number of pages.  0 disables the cache.
+
+        Raises:
+            ValueError: The size is negative
+        """
+        if pages < 0:
+            raise ValueError("Cache size must not be negative")
+        self.max_pages = pages
+        while len(self.pages) > pages:
+            self.pages.popitem(last=False)
+
+    def lookup(self, index):
+        """
+        Returns the error recorded for a page
+
+        Args:
+            index (int): The page index
+
+        Returns:
+            (type, str): The exception class and message recorded for the
+                page or
+            None: if the page is not known to be missing
+        """
+        try:
+            error = self.pages[index]
+        except KeyError:
+            return None
+        self.hits += 1
+        return error
+
+    def peek(self, index):
+        """
+        Returns the error recorded for a page without counting a hit
+
+        Args:
+            index (int): The page index
+
+        Returns:
+            (type, str): The exception class and message recorded for the
+                page or
+            None: if the page is not known to be missing
+        """
+        return self.pages.get(index)
+
+    def insert(self, index, exception):
+        """
+        Records that a page could not be read
+
+        Args:
+            index (int): The page index
+            exception (Exception): The error raised while reading the page
+        """
+        if self.max_pages == 0:
+            return
+
+        if index not in self.pages and len(self.pages) >= self.max_pages:
+            self.pages.popitem(last=False)
+        self.pages[index] = (exception.__class__, str(exception))
+
+    def flush(self):
+        """Forgets every recorded page"""
+        self.pages.clear()
+
+    def stats(self):
+        """
+        Returns the cache statistics
+
+        Returns:
+            dict: The 'pages', 'max_pages' and 'hits' counters
+        """
+        return {
+            'pages' : len(self.pages),
+            'max_pages' : self.max_pages,
+            'hits' : self.hits,
+        }
+
+    def __contains__(self, index):
+        return index in self.pages
+
+    def __len__(self):
+        return len(self.pages)
@@ -12,6 +12,7 @@ from kdumpfile.exceptions import *
 import addrxlat
 import crash.arch
 import crash.arch.x86_64
+from crash.kdump.cache import PageCache, MissingPageCache
 
 if sys.version_info.major >= 3:
     long = int
@@ -37,12 +38,45 @@ class SymbolCallback(object):
         raise addrxlat.NoDataError()
 
 class Target(gdb.Target):
-    def __init__(self, vmcore, debug=False):
+    """
+    The gdb target that services memory reads from a kdumpfile
+
+    Reads from the dump are satisfied from a page-granular cache so that
+    the many small reads gdb issues while accessing structure members
+    don't each turn into a separate libkdumpfile read.  Pages that are
+    missing from the dump are remembered as well so that repeated reads
+    from them fail without going back to libkdumpfile.
+
+    When reads miss the cache on consecutive pages, the target reads ahead
+    with a window that doubles on every sequential miss, up to
+    max_readahead pages.  Callers that know they are about to scan a range
+    can use prefetch() to read it in one go.
+
+    Args:
+        vmcore (kdumpfile): The opened dump file
+        debug (bool, optional, default=False): Whether to report read errors
+        cache_pages (int, optional, default=4096): The maximum number of
+            pages to keep in the read cache.  0 disables the cache.
+        cache_policy (str, optional, default='lru'): The eviction policy for
+            the read cache, 'lru' or 'fifo'
+        missing_pages (int, optional, default=65536): The maximum number of
+            unreadable pages to remember.  0 disables the negative cache.
+        max_readahead (int, optional, default=64): The largest number of
+            pages to read ahead on sequential access.  1 disables read-ahead.
+    """
+    def __init__(self, vmcore, debug=False, cache_pages=4096,
+                 cache_policy='lru', missing_pages=65536, max_readahead=64):
         if not isinstance(vmcore, kdumpfile):
             raise TypeError("vmcore must be of type kdumpfile")
         self.arch = None
         self.debug = debug
         self.kdump = vmcore
+        self.page_cache = PageCache(cache_pages, cache_policy)
+        self.missing_cache = MissingPageCache(missing_pages)
+        self.page_size = None
+        self.max_readahead = max(max_readahead, 1)
+        self.readahead_window = 1
+        self.readahead_next = None
         ctx = self.kdump.get_addrxlat_ctx()
         ctx.cb_sym = SymbolCallback(ctx)
         self.kdump.attr['addrxlat.ostype'] = 'linux'
@@ -76,11 +110,222 @@ class Target(gdb.Target):
               .format(length, addr, str(error)),
               file=sys.stderr)
 
+    def setup_page_size(self):
+        try:
+            self.page_size = int(self.kdump.attr['arch.page_size'])
+        except (KeyError, TypeError):
+            self.page_size = 4096
+
+    def configure_cache(self, pages=None, policy=None, missing_pages=None,
+                        max_readahead=None):
+        """
+        Changes the size or eviction policy of the read caches
+
+        Args:
+            pages (int, optional, default=None): The maximum number of pages
+                to cache.  0 disables the cache.
+            policy (str, optional, default=None): 'lru' or 'fifo'
+            missing_pages (int, optional, default=None): The maximum number
+                of unreadable pages to remember.  0 disables the negative
+                cache.
+            max_readahead (int, optional, default=None): The largest number
+                of pages to read ahead on sequential access.  1 disables
+                read-ahead.
+
+        Raises:
+            ValueError: A size or the policy is invalid
+        """
+        if policy is not None:
+            self.page_cache.set_policy(policy)
+        if pages is not None:
+            self.page_cache.resize(pages)
+        if missing_pages is not None:
+            self.missing_cache.resize(missing_pages)
+        if max_readahead is not None:
+            self.max_readahead = max(max_readahead, 1)
+
+    def flush_cache(self):
+        """Drops every page from the read caches"""
+        self.page_cache.flush()
+        self.missing_cache.flush()
+
+    def cache_stats(self):
+        """
+        Returns the read cache statistics
+
+        Returns:
+            dict: See PageCache.stats.  The statistics for the negative
+                cache are under the 'missing' key; see MissingPageCache.stats.
+        """
+        stats = self.page_cache.stats()
+        stats['missing'] = self.missing_cache.stats()
+        return stats
+
+    def missing_page_hits(self):
+        """
+        Returns the number of reads failed using the negative cache
+
+        Returns:
+            int: The number of reads that were failed because they touched
+                a page already known to be missing from the dump
+        """
+        return self.missing_cache.hits
+
+    def __read_partial(self, addr, length):
+        try:
+            return self.kdump.read(KDUMP_KVADDR, addr, length)
+        except (NoDataException, AddressTranslationException) as e:
+            self.missing_cache.insert(addr // self.page_size, e)
+            raise
+
+    def __fill_pages(self, first, count):
+        page_size = self.page_size
+        try:
+            data = self.kdump.read(KDUMP_KVADDR, first * page_size,
+                                   count * page_size)
+        except (EOFException, NoDataException, AddressTranslationException):
+            data = None
+
+        if data is not None:
+            for i in range(count):
+                self.page_cache.insert(first + i,
+                                       data[i * page_size:(i + 1) * page_size])
+            return
+
+        # Something in the range is unreadable; find out what
+        for index in range(first, first + count):
+            try:
+                buf = self.kdump.read(KDUMP_KVADDR, index * page_size,
+                                      page_size)
+            except (NoDataException, AddressTranslationException) as e:
+                self.missing_cache.insert(index, e)
+                continue
+            except EOFException:
+                # The caller retries with just the requested range and
+                # reports the error if that fails as well.
+                break
+            self.page_cache.insert(index, buf)
+
+    def __fill_range(self, first, last):
+        start = None
+        for index in range(first, last + 1):
+            if (self.page_cache.peek(index) is None and
+                    self.missing_cache.peek(index) is None):
+                if start is None:
+                    start = index
+            elif start is not None:
+                self.__fill_pages(start, index - start)
+                start = None
+        if start is not None:
+            self.__fill_pages(start, last + 1 - start)
+
+    def __read_page(self, index):
+        buf = self.page_cache.lookup(index)
+        if buf is not None:
+            return buf
+
+        if index == self.readahead_next:
+            self.readahead_window = min(self.readahead_window * 2,
+                                        self.max_readahead,
+                                        self.page_cache.max_pages)
+        else:
+            self.readahead_window = 1
+
+        count = self.readahead_window
+        self.readahead_next = index + count
+        self.__fill_range(index, index + count - 1)
+
+        buf = self.page_cache.peek(index)
+        if buf is None:
+            error = self.missing_cache.peek(index)
+            if error is not None:
+                raise error[0](error[1])
+        return buf
+
+    def prefetch(self, addr, length):
+        """
+        Reads a range of kernel virtual memory into the read cache
+
+        This is a hint for callers that are about to scan a range of memory.
+        Pages that are already cached or known to be missing are skipped
+        and the rest are read with as few libkdumpfile reads as possible.
+        At most half of the cache is filled so the prefetched pages don't
+        evict each other before they are used.  Errors are not reported
+        here; they are reported when the memory is actually read.
+
+        Args:
+            addr (int): The kernel virtual address to start at
+            length (int): The number of bytes to prefetch
+        """
+        if length <= 0:
+            return
+        if self.page_size is None:
+            self.setup_page_size()
+
+        first = addr // self.page_size
+        last = (addr + length - 1) // self.page_size
+        limit = self.page_cache.max_pages // 2
+        if limit == 0:
+            return
+        last = min(last, first + limit - 1)
+
+        self.__fill_range(first, last)
+
+    def read_cached(self, addr, length):
+        """
+        Reads kernel virtual memory from the dump through the read cache
+
+        Args:
+            addr (int): The kernel virtual address to read
+            length (int): The number of bytes to read
+
+        Returns:
+            bytearray: The requested contents
+
+        Raises:
+            EOFException, NoDataException, AddressTranslationException:
+                The memory could not be read.  NoDataException and
+                AddressTranslationException are remembered for the page
+                that caused them and raised again for later reads of it.
+        """
+        if self.page_size is None:
+            self.setup_page_size()
+        page_size = self.page_size
+
+        first = addr // page_size
+        last = (addr + length - 1) // page_size
+        for index in range(first, last + 1):
+            error = self.missing_cache.lookup(index)
+            if error is not None:
+                raise error[0](error[1])
+
+        # Large reads would only thrash the cache
+        if last - first >= self.page_cache.max_pages:
+            if first == last:
+                return self.__read_partial(addr, length)
+            return self.kdump.read(KDUMP_KVADDR, addr, length)
+
+        data = bytearray()
+        while length > 0:
+            index = addr // page_size
+            start = addr - index * page_size
+            count = min(length, page_size - start)
+
+            buf = self.__read_page(index)
+            if buf is None:
+                data += self.__read_partial(addr, count)
+            else:
+                data += buf[start:start + count]
+
+            addr += count
+            length -= count
+        return data
+
     def to_xfer_partial(self, obj, annex, readbuf, writebuf, offset, ln):
         ret = -1
         if obj == self.TARGET_OBJECT_MEMORY:
             try:
-                r = self.kdump.read(KDUMP_KVADDR, offset, ln)
+                r = self.read_cached(offset, ln)
                 readbuf[:] = r
                 ret = ln
             except EOFException as e:
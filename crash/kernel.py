@@ -8,29 +8,58 @@ from __future__ import division
 import gdb
 import sys
 import os.path
-from crash.infra import CrashBaseClass, export
-from crash.types.list import list_for_each_entry
+import bisect
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from crash.infra import CrashBaseClass, export, register_singleton
+from crash.util import safe_lookup_type, offsetof, offsetof_type
+from crash.util import add_lookup_fallback
+from crash.memory import read_ulong_array, read_unsigned
+from crash.types.list import list_for_each_entry, list_for_each_raw
 from crash.types.percpu import get_percpu_var
-from crash.types.list import list_for_each_entry
 import crash.cache.tasks
 from crash.types.task import LinuxTask
 import crash.kdump
 import crash.kdump.target
 from kdumpfile import kdumpfile
 from elftools.elf.elffile import ELFFile
+from elftools.common.exceptions import ELFError
+from crash.pathindex import PathIndex
 
 if sys.version_info.major >= 3:
     long = int
 
 LINUX_KERNEL_PID = 1
 
+def thread_size():
+    """
+    Returns the size of a task's kernel stack
+
+    This only needs the kernel's debuginfo, not a CrashKernel.
+
+    Returns:
+        int: The size of the stack, THREAD_SIZE
+    """
+    thread_union = safe_lookup_type('union thread_union')
+    if thread_union is not None:
+        return thread_union.sizeof
+    return 16384
+
 class CrashKernel(CrashBaseClass):
-    __types__ = [ 'struct module' ]
+    __types__ = [ 'struct module', 'unsigned long' ]
     __symvals__ = [ 'modules' ]
 
     def __init__(self, vmlinux_filename, searchpath=None):
         self.findmap = {}
+        self.module_ranges = []
+        self.module_starts = []
+        self.pending_modules = set()
+        self.scanned_threads = set()
+        self.prompt_hook_connected = False
+        self.lookup_fallback_added = False
+        self.text_ranges = None
         self.vmlinux_filename = vmlinux_filename
+        self.vmcore_filename = None
         self.searchpath = searchpath
 
         f = open(self.vmlinux_filename, 'rb')
@@ -38,6 +67,9 @@ class CrashKernel(CrashBaseClass):
 
         self.set_gdb_arch()
 
+        # Make the exported helpers use this instance
+        register_singleton(sys.modules[__name__], self)
+
     def set_gdb_arch(self):
         mach = self.elffile['e_machine']
         e_class = self.elffile['e_ident']['EI_CLASS']
@@ -137,50 +169,134 @@ class CrashKernel(CrashBaseClass):
 
         return " ".join(out)
 
-    def load_modules(self, verbose=False):
+    def __module_info(self, module):
+        if 'module_core' in module.type:
+            addr = long(module['module_core'])
+        else:
+            addr = long(module['core_layout']['base'])
+
+        return {
+            'name' : module['name'].string(),
+            'addr' : addr,
+            'sections' : self.get_module_sections(module),
+        }
+
+    @staticmethod
+    def __examine_elf(path):
+        try:
+            with open(path, 'rb') as f:
+                elf = ELFFile(f)
+                debuginfo = elf.get_section_by_name('.debug_info') is not None
+                build_id = None
+                notes = elf.get_section_by_name('.note.gnu.build-id')
+                if notes is not None:
+                    for note in notes.iter_notes():
+                        if note['n_type'] == 'NT_GNU_BUILD_ID':
+                            build_id = note['n_desc']
+                return (debuginfo, build_id)
+        except (ELFError, IOError, OSError):
+            # e.g. compressed modules; let gdb decide after loading
+            return (None, None)
+
+    def __resolve_module(self, info):
+        modfname = "{}.ko".format(info['name'])
+        info['path'] = None
+        info['debuginfo'] = None
+        info['debugpath'] = None
+        for path in self.searchpath:
+            modpath = self.find_module_file(modfname, path)
+            if modpath:
+                info['path'] = modpath
+                break
+
+        if info['path'] is not None:
+            # Reading the ELF headers also pulls the file into the page
+            # cache before gdb gets to it.
+            (debuginfo, build_id) = self.__examine_elf(info['path'])
+            info['debuginfo'] = debuginfo
+            if debuginfo is not True:
+                info['debugpath'] = self.find_debuginfo(info['path'],
+                                                        build_id)
+        return info
+
+    def __register_module(self, info, verbose=False):
+        modpath = info['path']
+        addr = info['addr']
+
+        if verbose:
+            print("Loading {} at {:#x}".format(info['name'], addr))
+        gdb.execute("add-symbol-file {} {:#x} {}"
+                    .format(modpath, addr, info['sections']),
+                    to_string=True)
+
+        needs_debuginfo = info['debuginfo'] is False
+        if info['debuginfo'] is None:
+            sal = gdb.find_pc_line(addr)
+            needs_debuginfo = sal.symtab is None
+
+        if needs_debuginfo:
+            objfile = gdb.lookup_objfile(modpath)
+            if info['debugpath']:
+                objfile.add_separate_debug_file(info['debugpath'])
+            else:
+                print("Could not locate debuginfo for {}".format(modpath))
+
+        # We really should check the version, but GDB doesn't export
+        # a way to lookup sections.
+
+    def load_modules(self, verbose=False, threads=None):
+        """
+        Loads the symbols and debuginfo for every loaded module
+
+        This happens in three stages.  The module names, addresses, and
+        section addresses are read from the vmcore.  The module and
+        debuginfo files are then located, and the modules examined for
+        debuginfo, using a pool of threads, since that is mostly waiting
+        on the file system.  Finally, the results are registered with gdb.
+
+        Args:
+            verbose (bool, optional, default=False): Whether to print each
+                module as it is loaded
+            threads (int, optional, default=None): The number of threads
+                to use to locate files.  Defaults to twice the number of
+                CPUs.
+        """
         print("Loading modules...", end='')
         sys.stdout.flush()
         failed = 0
         loaded = 0
-        for module in self.for_each_module():
-            modname = "{}".format(module['name'].string())
-            modfname = "{}.ko".format(modname)
-            found = False
-            for path in self.searchpath:
-                modpath = self.find_module_file(modfname, path)
-                if not modpath:
-                    continue
-
-                found = True
-
-                if 'module_core' in module.type:
-                    addr = long(module['module_core'])
-                else:
-                    addr = long(module['core_layout']['base'])
-
-                if verbose:
-                    print("Loading {} at {:#x}".format(modname, addr))
-                sections = self.get_module_sections(module)
-                gdb.execute("add-symbol-file {} {:#x} {}"
-                            .format(modpath, addr, sections),
-                            to_string=True)
-                sal = gdb.find_pc_line(addr)
-                if sal.symtab is None:
-                    objfile = gdb.lookup_objfile(modpath)
-                    self.load_debuginfo(objfile, modpath)
-
-                # We really should check the version, but GDB doesn't export
-                # a way to lookup sections.
-                break
 
-            if not found:
+        modules = [ self.__module_info(module)
+                    for module in self.for_each_module() ]
+
+        if threads is None:
+            threads = multiprocessing.cpu_count() * 2
+        pool = ThreadPool(max(1, threads))
+        try:
+            # Index each search path once, in parallel, so the lookups
+            # that follow only need to read the map.
+            paths = [ path for path in self.searchpath
+                      if path not in self.findmap ]
+            for (path, index) in zip(paths, pool.map(self.index_path, paths)):
+                self.findmap[path] = index
+
+            modules = pool.map(self.__resolve_module, modules)
+        finally:
+            pool.close()
+            pool.join()
+
+        for info in modules:
+            if info['path'] is None:
                 if failed == 0:
                     print()
-                print("Couldn't find module file for {}".format(modname))
+                print("Couldn't find module file for {}".format(info['name']))
                 failed += 1
-            else:
-                loaded += 1
-            if (loaded + failed) % 10 == 10:
+                continue
+
+            self.__register_module(info, verbose)
+
+            loaded += 1
+            if (loaded + failed) % 10 == 0:
                 print(".", end='')
                 sys.stdout.flush()
         print(" done. ({} loaded".format(loaded), end='')
@@ -193,91 +309,386 @@ class CrashKernel(CrashBaseClass):
         del self.findmap
         self.findmap = {}
 
-    def find_module_file(self, name, path):
-        if not path in self.findmap:
-            self.findmap[path] = {}
+    def __module_size(self, module):
+        if 'core_size' in module.type:
+            return long(module['core_size'])
+        return long(module['core_layout']['size'])
+
+    def setup_module_index(self):
+        """
+        Records the address ranges of all modules without loading them
+
+        This is the lazy alternative to load_modules.  The core address
+        range of each module is kept in a sorted index and the module's
+        symbols and debuginfo are only loaded when an address within the
+        range is first needed, via load_module_for_address.  Before each
+        prompt, the stack of the selected thread is scanned for addresses
+        within modules that haven't been loaded so that backtraces have
+        the symbols they need, and a symbol or type that crash-python
+        can't find loads all of the remaining modules; see
+        load_pending_modules.
+
+        Plain gdb commands, e.g. print or info symbol, don't load
+        modules.  They only see the modules loaded so far.
+        """
+        ranges = []
+        for module in self.for_each_module():
+            if 'module_core' in module.type:
+                addr = long(module['module_core'])
+            else:
+                addr = long(module['core_layout']['base'])
+            ranges.append((addr, addr + self.__module_size(module),
+                           long(module.address), module['name'].string()))
+        ranges.sort()
+
+        self.module_ranges = ranges
+        self.module_starts = [ r[0] for r in ranges ]
+        self.pending_modules = set([ r[3] for r in ranges ])
+        self.scanned_threads = set()
+
+        if self.pending_modules and not self.prompt_hook_connected:
+            gdb.events.before_prompt.connect(self.__before_prompt)
+            self.prompt_hook_connected = True
+        if not self.lookup_fallback_added:
+            add_lookup_fallback(self.load_pending_modules)
+            self.lookup_fallback_added = True
+
+        print("Indexed {} modules for loading on demand."
+              .format(len(ranges)))
+
+    @export
+    def dump_files(self):
+        """
+        Returns the files this session was opened with
+
+        Returns:
+            (str, str, list of str): The paths of the kernel executable and
+                the vmcore, and the module and debuginfo search path
+        """
+        return (self.vmlinux_filename, self.vmcore_filename,
+                list(self.searchpath or []))
+
+    @export
+    def kernel_text_ranges(self):
+        """
+        Returns the address ranges containing kernel and module text
+
+        The ranges are read once and cached.
+
+        Returns:
+            list of (int, int): The sorted [start, end) ranges
+        """
+        if self.text_ranges is not None:
+            return self.text_ranges
+
+        ranges = []
+        stext = gdb.lookup_minimal_symbol('_stext')
+        etext = gdb.lookup_minimal_symbol('_etext')
+        if stext is not None and etext is not None:
+            ranges.append((long(stext.value().address),
+                           long(etext.value().address)))
+
+        for module in self.for_each_module():
+            if 'module_core' in module.type:
+                addr = long(module['module_core'])
+                size = long(module['core_text_size'])
+            else:
+                addr = long(module['core_layout']['base'])
+                size = long(module['core_layout']['text_size'])
+            ranges.append((addr, addr + size))
+        ranges.sort()
+
+        self.text_ranges = ranges
+        return ranges
+
+    @export
+    def module_for_address(self, addr):
+        """
+        Returns the name of the module containing an address
+
+        Only available after setup_module_index has been called.
+
+        Args:
+            addr (int): The address to look up
+
+        Returns:
+            str: The name of the module, or None if no module contains
+                the address
+        """
+        idx = bisect.bisect_right(self.module_starts, addr) - 1
+        if idx >= 0 and addr < self.module_ranges[idx][1]:
+            return self.module_ranges[idx][3]
+        return None
+
+    @export
+    def load_module_for_address(self, addr, verbose=False):
+        """
+        Loads the module containing an address if it isn't loaded yet
+
+        Args:
+            addr (int): The address that needs symbols
+            verbose (bool, optional, default=False): Whether to print the
+                module being loaded
+
+        Returns:
+            bool: Whether a module was loaded
+        """
+        idx = bisect.bisect_right(self.module_starts, long(addr)) - 1
+        if idx < 0 or long(addr) >= self.module_ranges[idx][1]:
+            return False
+
+        (start, end, modaddr, name) = self.module_ranges[idx]
+        if name not in self.pending_modules:
+            return False
+        self.pending_modules.discard(name)
+
+        module = gdb.Value(modaddr).cast(self.module_type.pointer())
+        info = self.__resolve_module(self.__module_info(module.dereference()))
+        if info['path'] is None:
+            print("Couldn't find module file for {}".format(name))
+            return False
+
+        self.__register_module(info, verbose)
+        return True
+
+    def load_pending_modules(self, verbose=False):
+        """
+        Loads every module that hasn't been loaded yet
+
+        Which module defines a symbol or type isn't known until it has
+        been loaded, so a failed lookup loads all of them.  This is
+        registered as a lookup fallback by setup_module_index.
+
+        Args:
+            verbose (bool, optional, default=False): Whether to print each
+                module being loaded
+
+        Returns:
+            bool: Whether any module was loaded
+        """
+        if not self.pending_modules:
+            return False
+
+        print("Loading {} remaining modules to resolve a lookup."
+              .format(len(self.pending_modules)))
+        loaded = False
+        for (start, end, modaddr, name) in self.module_ranges:
+            if name in self.pending_modules:
+                if self.load_module_for_address(start, verbose):
+                    loaded = True
+        return loaded
+
+    def load_modules_for_task(self, task_struct, verbose=False):
+        """
+        Loads the modules referenced from a task's kernel stack
+
+        Every word on the stack that falls within a module that hasn't
+        been loaded yet causes that module to be loaded.
+
+        Args:
+            task_struct (gdb.Value<struct task_struct>): The task
+
+        Returns:
+            int: The number of modules loaded
+        """
+        if not self.pending_modules:
+            return 0
+
+        stack = long(task_struct['stack'])
+        words = read_ulong_array(stack, thread_size() //
+                                        self.unsigned_long_type.sizeof)
+
+        lowest = self.module_starts[0]
+        highest = self.module_ranges[-1][1]
+        loaded = 0
+        for word in words:
+            if lowest <= word < highest:
+                if self.load_module_for_address(word, verbose):
+                    loaded += 1
+        return loaded
+
+    def __before_prompt(self):
+        if not self.pending_modules:
+            gdb.events.before_prompt.disconnect(self.__before_prompt)
+            self.prompt_hook_connected = False
+            return
 
-            for root, dirs, files in os.walk(path):
-                for filename in files:
-                    nname = filename.replace('-', '_')
-                    self.findmap[path][nname] = os.path.join(root, filename)
         try:
-            nname = name.replace('-', '_')
-            return self.findmap[path][nname]
-        except KeyError:
-            return None
+            thread = gdb.selected_thread()
+        except gdb.error:
+            return
+        if thread is None or thread.num in self.scanned_threads:
+            return
+        self.scanned_threads.add(thread.num)
+
+        try:
+            self.load_modules_for_task(thread.info.task_struct)
+        except (gdb.error, AttributeError) as e:
+            print("Failed to load modules for thread {}: {}"
+                  .format(thread.num, str(e)))
+
+    @staticmethod
+    def index_path(path):
+        """
+        Returns an up to date index of the files found under a path
+
+        The index is kept on disk between sessions and only directories
+        that have changed since the last session are listed again.
+
+        Args:
+            path (str): The directory to index
+
+        Returns:
+            PathIndex: The index for the path
+        """
+        index = PathIndex(path)
+        index.refresh()
+        return index
+
+    def find_module_file(self, name, path):
+        if not path in self.findmap:
+            self.findmap[path] = self.index_path(path)
+        return self.findmap[path].lookup(name)
+
+    def find_debuginfo(self, name, build_id=None):
+        """
+        Locates the separate debuginfo file for a file
+
+        Args:
+            name (str): The name of the file, e.g. the module file
+            build_id (str, optional, default=None): The build-id of the
+                file.  If provided, a debuginfo file with a matching
+                build-id is preferred over one matching by name.
+
+        Returns:
+            str: The path to the debuginfo file, or None if not found
+        """
+        if build_id:
+            for path in self.searchpath:
+                if not path in self.findmap:
+                    self.findmap[path] = self.index_path(path)
+                filepath = self.findmap[path].lookup_build_id(build_id)
+                if filepath:
+                    return filepath
 
-    def load_debuginfo(self, objfile, name=None, verbose=False):
-        if name is None:
-            name = objfile.filename
         if ".gz" in name:
             name = name.replace(".gz", "")
         filename = "{}.debug".format(os.path.basename(name))
-        filepath = None
 
         # Check current directory first
         if os.path.exists(filename):
-            filepath = filename
-        else:
-            for path in self.searchpath:
-                filepath = self.find_module_file(filename, path)
-                if filepath:
-                    break
+            return filename
+
+        for path in self.searchpath:
+            filepath = self.find_module_file(filename, path)
+            if filepath:
+                return filepath
+        return None
 
+    def load_debuginfo(self, objfile, name=None, verbose=False):
+        if name is None:
+            name = objfile.filename
+
+        build_id = getattr(objfile, 'build_id', None)
+        filepath = self.find_debuginfo(name, build_id)
         if filepath:
             objfile.add_separate_debug_file(filepath)
         else:
+            if ".gz" in name:
+                name = name.replace(".gz", "")
             print("Could not locate debuginfo for {}".format(name))
 
-    def setup_tasks(self):
+    def __register_task(self, task):
+        cpu = None
+        regs = None
+        active = long(task.address) in self.rqscurrs
+        if active:
+            cpu = self.rqscurrs[long(task.address)]
+            regs = self.vmcore.attr.cpu[cpu].reg
+
+        ltask = LinuxTask(task, active, cpu, regs)
+        ptid = (LINUX_KERNEL_PID, task['pid'], 0)
+        try:
+            thread = gdb.selected_inferior().new_thread(ptid, ltask)
+        except gdb.error as e:
+            print("Failed to setup task @{:#x}".format(long(task.address)))
+            return None
+        thread.name = task['comm'].string()
+
+        self.target.arch.setup_thread_info(thread)
+        ltask.attach_thread(thread)
+        ltask.set_get_stack_pointer(self.target.arch.get_stack_pointer)
+
+        crash.cache.tasks.cache_task(ltask)
+        return ltask
+
+    def __load_task(self, addr):
+        task = gdb.Value(addr).cast(self.task_struct_type.pointer())
+        return self.__register_task(task.dereference())
+
+    def __for_each_task_address(self, init_task):
+        tasks_offset = offsetof(self.task_struct_type, 'tasks')
+        thread_group_offset = offsetof(self.task_struct_type, 'thread_group')
+        init_addr = long(init_task.value().address)
+
+        for node in list_for_each_raw(init_addr + tasks_offset,
+                                      include_head=True):
+            leader = node - tasks_offset
+            yield leader
+            for thread in list_for_each_raw(leader + thread_group_offset):
+                yield thread - thread_group_offset
+
+    def setup_tasks(self, lazy=False):
+        """
+        Registers the tasks in the vmcore as gdb threads
+
+        Args:
+            lazy (bool, optional, default=False): Whether to register only
+                the tasks that were running on a CPU.  The others are
+                registered when first looked up using
+                crash.cache.tasks.get_task or crash.cache.tasks.load_all_tasks.
+                Every task is recorded in the pid to task_struct address
+                index in crash.cache.tasks either way.
+        """
         gdb.execute('set print thread-events 0')
 
         init_task = gdb.lookup_global_symbol('init_task')
-        task_list = init_task.value()['tasks']
         runqueues = gdb.lookup_global_symbol('runqueues')
 
         rqs = get_percpu_var(runqueues)
-        rqscurrs = {long(x["curr"]) : k for (k, x) in rqs.items()}
+        self.rqscurrs = {long(x["curr"]) : k for (k, x) in rqs.items()}
 
-        self.pid_to_task_struct = {}
+        self.task_struct_type = init_task.type
+        (pid_offset, pid_type) = offsetof_type(self.task_struct_type, 'pid')
 
         print("Loading tasks...", end='')
         sys.stdout.flush()
 
+        # Collect every address before registering anything so that a
+        # broken task list doesn't leave us with a partial set of threads.
+        addrs = list(self.__for_each_task_address(init_task))
+
+        crash.cache.tasks.set_task_loader(None)
         task_count = 0
-        tasks = []
-        for taskg in list_for_each_entry(task_list, init_task.type, 'tasks', include_head=True):
-            tasks.append(taskg)
-            for task in list_for_each_entry(taskg['thread_group'], init_task.type, 'thread_group'):
-                tasks.append(task)
-
-        for task in tasks:
-            cpu = None
-            regs = None
-            active = long(task.address) in rqscurrs
-            if active:
-                cpu = rqscurrs[long(task.address)]
-                regs = self.vmcore.attr.cpu[cpu].reg
-
-            ltask = LinuxTask(task, active, cpu, regs)
-            ptid = (LINUX_KERNEL_PID, task['pid'], 0)
-            try:
-                thread = gdb.selected_inferior().new_thread(ptid, ltask)
-            except gdb.error as e:
-                print("Failed to setup task @{:#x}".format(long(task.address)))
+        for addr in addrs:
+            pid = read_unsigned(addr + pid_offset, pid_type.sizeof)
+            crash.cache.tasks.index_task(pid, addr, self.rqscurrs.get(addr))
+            if lazy and addr not in self.rqscurrs:
                 continue
-            thread.name = task['comm'].string()
-
-            self.target.arch.setup_thread_info(thread)
-            ltask.attach_thread(thread)
-            ltask.set_get_stack_pointer(self.target.arch.get_stack_pointer)
 
-            crash.cache.tasks.cache_task(ltask)
+            if self.__load_task(addr) is None:
+                continue
 
             task_count += 1
             if task_count % 100 == 0:
                 print(".", end='')
                 sys.stdout.flush()
-        print(" done. ({} tasks total)".format(task_count))
+
+        if lazy:
+            crash.cache.tasks.set_task_loader(self.__load_task)
+            print(" done. ({} tasks total, {} loaded)"
+                  .format(len(addrs), task_count))
+        else:
+            print(" done. ({} tasks total)".format(task_count))
 
         gdb.selected_inferior().executing = False
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+import struct
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.util import resolve_type, InvalidArgumentTypeError
+from crash.util import InvalidComponentError
+from crash.memory import RawMemory, read_memory
+
+_signed_formats = { 1 : 'b', 2 : 'h', 4 : 'i', 8 : 'q' }
+_unsigned_formats = { 1 : 'B', 2 : 'H', 4 : 'I', 8 : 'Q' }
+
+_scalar_codes = (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_ENUM, gdb.TYPE_CODE_BOOL,
+                 gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_PTR)
+_aggregate_codes = (gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION)
+
+# Member kinds
+_SCALAR = 0
+_FLOAT = 1
+_STRING = 2
+_ARRAY = 3
+_BYTES = 4
+_BITFIELD = 5
+
+def _is_signed(gdbtype):
+    if gdbtype.code == gdb.TYPE_CODE_PTR:
+        return False
+    return long(gdb.Value(-1).cast(gdbtype)) < 0
+
+def _is_char(gdbtype):
+    # Only plain char holds text.  signed and unsigned char, and the s8
+    # and u8 typedefs that strip to them, hold small integers.
+    return (gdbtype.sizeof == 1 and
+            gdbtype.code in (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_CHAR) and
+            gdbtype.name == 'char')
+
+def _find_field(gdbtype, member):
+    for field in gdbtype.fields():
+        if field.name == member:
+            return (field.bitpos, field)
+
+        # Step into anonymous structs and unions
+        if field.name is None:
+            fieldtype = field.type.strip_typedefs()
+            if fieldtype.code in _aggregate_codes:
+                res = _find_field(fieldtype, member)
+                if res is not None:
+                    return (field.bitpos + res[0], res[1])
+    return None
+
+class _Member(object):
+    __slots__ = [ 'name', 'offset', 'size', 'kind', 'struct', 'shift',
+                  'mask', 'signed' ]
+
+class LayoutRecord(object):
+    """
+    The base class for records decoded by a StructLayout
+
+    Each layout creates a subclass with a slot for every member it decodes
+    and an 'address' slot for the address the record was read from.
+    """
+    __slots__ = [ 'address' ]
+    fields = ()
+
+    def __repr__(self):
+        vals = ", ".join(["{}={!r}".format(name, getattr(self, name))
+                          for name in self.fields])
+        return "<{} {}>".format(self.__class__.__name__, vals)
+
+class StructLayout(object):
+    """
+    A precompiled decoder for selected members of a structure
+
+    Resolving members through gdb.Value is expensive when done for
+    thousands of objects.  A StructLayout resolves the offset, size, and
+    format of each requested member once and decodes them from a raw
+    buffer into a lightweight record using a single struct.Struct.
+
+    Integer, enum, bool, pointer, and floating point members are decoded
+    to numbers.  Arrays of plain char are decoded to strings ending at the
+    first NUL, unless they are listed in integers, other arrays of scalars
+    to tuples, bitfields to integers, and embedded structs and unions to
+    bytes.
+
+    Args:
+        gdbtype (gdb.Type, gdb.Symbol, gdb.Value, or str): The structure
+            or union to decode.  Pointers are accepted as well.
+        members (list of str): The members to decode, using the same
+            specification as offsetof, e.g. 'se.exec_start'
+        names (list of str, optional, default=None): The attribute names
+            to use in the records.  By default, the member specification
+            with '.' replaced by '_' is used.
+        integers (list of str, optional, default=None): The names of
+            char array members to decode to tuples of integers instead of
+            strings
+
+    Raises:
+        InvalidArgumentTypeError: gdbtype is not a struct or union
+        InvalidComponentError: A member specification is not valid
+        ValueError: The number of names doesn't match the number of members
+    """
+    def __init__(self, gdbtype, members, names=None, integers=None):
+        gdbtype = resolve_type(gdbtype)
+        if gdbtype.code == gdb.TYPE_CODE_PTR:
+            gdbtype = gdbtype.target()
+        if gdbtype.strip_typedefs().code not in _aggregate_codes:
+            raise InvalidArgumentTypeError(gdbtype)
+
+        if names is None:
+            names = [ spec.replace('.', '_') for spec in members ]
+        elif len(names) != len(members):
+            raise ValueError("{} names provided for {} members"
+                             .format(len(names), len(members)))
+
+        if RawMemory.byte_order is None:
+            RawMemory.setup_byte_order()
+        self.big_endian = RawMemory.byte_order == 'big'
+        if self.big_endian:
+            self.prefix = '>'
+        else:
+            self.prefix = '<'
+
+        self.type = gdbtype
+        self.size = gdbtype.sizeof
+        self.names = list(names)
+        if integers is None:
+            integers = []
+        self.integers = frozenset(integers)
+
+        compiled = []
+        for spec, name in zip(members, names):
+            (bitpos, field) = self.__resolve(gdbtype, spec)
+            compiled.append(self.__compile_member(name, bitpos, field))
+
+        if compiled:
+            self.start = min([ m.offset for m in compiled ])
+            self.end = max([ m.offset + m.size for m in compiled ])
+        else:
+            self.start = 0
+            self.end = 0
+
+        self.__build_struct(compiled)
+
+        self.record_class = type(str(gdbtype.strip_typedefs().tag or
+                                     'anonymous') + '_record',
+                                 (LayoutRecord,),
+                                 { '__slots__' : tuple(self.names),
+                                   'fields' : tuple(['address'] +
+                                                    self.names) })
+
+    @staticmethod
+    def __resolve(gdbtype, spec):
+        bitpos = 0
+        field = None
+        parent = gdbtype.strip_typedefs()
+        for member in spec.split('.'):
+            if field is not None:
+                parent = field.type.strip_typedefs()
+            if parent.code not in _aggregate_codes:
+                raise InvalidComponentError(gdbtype, spec,
+                            "component `{}' in `{}' is not a struct or union"
+                            .format(member, spec))
+            res = _find_field(parent, member)
+            if res is None:
+                raise InvalidComponentError(gdbtype, spec,
+                                            "no such member `{}' in `{}'"
+                                            .format(member, str(parent)))
+            bitpos += res[0]
+            field = res[1]
+        return (bitpos, field)
+
+    def __compile_member(self, name, bitpos, field):
+        fieldtype = field.type.strip_typedefs()
+        m = _Member()
+        m.name = name
+        m.shift = 0
+        m.mask = 0
+        m.signed = False
+
+        if field.bitsize:
+            m.kind = _BITFIELD
+            m.offset = bitpos // 8
+            inbyte = bitpos % 8
+            nbytes = (inbyte + field.bitsize + 7) // 8
+            for size in (1, 2, 4, 8):
+                if size >= nbytes:
+                    nbytes = size
+                    break
+            m.size = nbytes
+            m.struct = struct.Struct(self.prefix + _unsigned_formats[nbytes])
+            if self.big_endian:
+                m.shift = nbytes * 8 - inbyte - field.bitsize
+            else:
+                m.shift = inbyte
+            m.mask = (1 << field.bitsize) - 1
+            m.signed = _is_signed(fieldtype)
+            return m
+
+        m.offset = bitpos // 8
+        m.size = fieldtype.sizeof
+
+        if fieldtype.code in _scalar_codes and m.size in _signed_formats:
+            m.kind = _SCALAR
+            if _is_signed(fieldtype):
+                m.struct = _signed_formats[m.size]
+            else:
+                m.struct = _unsigned_formats[m.size]
+        elif fieldtype.code == gdb.TYPE_CODE_FLT and m.size in (4, 8):
+            m.kind = _FLOAT
+            m.struct = { 4 : 'f', 8 : 'd' }[m.size]
+        elif fieldtype.code == gdb.TYPE_CODE_ARRAY and m.size > 0:
+            target = fieldtype.target().strip_typedefs()
+            count = m.size // target.sizeof
+            if _is_char(target) and name not in self.integers:
+                m.kind = _STRING
+                m.struct = struct.Struct("{}{}s".format(self.prefix, m.size))
+            elif (target.code in _scalar_codes and
+                  target.sizeof in _signed_formats):
+                m.kind = _ARRAY
+                if _is_signed(target):
+                    code = _signed_formats[target.sizeof]
+                else:
+                    code = _unsigned_formats[target.sizeof]
+                m.struct = struct.Struct("{}{}{}".format(self.prefix, count,
+                                                         code))
+            else:
+                m.kind = _BYTES
+                m.struct = struct.Struct("{}{}s".format(self.prefix, m.size))
+        else:
+            m.kind = _BYTES
+            m.struct = struct.Struct("{}{}s".format(self.prefix, m.size))
+        return m
+
+    def __build_struct(self, compiled):
+        # Plain scalars that don't overlap are decoded together with one
+        # struct.Struct.  Everything else is decoded on its own.
+        scalars = [ m for m in compiled if m.kind in (_SCALAR, _FLOAT) ]
+        scalars.sort(key=lambda m: m.offset)
+
+        fmt = self.prefix
+        pos = None
+        combined = []
+        for m in scalars:
+            if pos is not None and m.offset < pos:
+                m.struct = struct.Struct(self.prefix + m.struct)
+                continue
+            if pos is not None and m.offset > pos:
+                fmt += "{}x".format(m.offset - pos)
+            fmt += m.struct
+            pos = m.offset + m.size
+            combined.append(m)
+
+        self.combined_names = tuple([ m.name for m in combined ])
+        if combined:
+            self.combined_offset = combined[0].offset
+            self.struct = struct.Struct(fmt)
+        else:
+            self.combined_offset = 0
+            self.struct = None
+
+        self.others = [ m for m in compiled if m not in combined ]
+
+    def __decode(self, buf, base, address):
+        rec = self.record_class()
+        rec.address = address
+
+        if self.struct is not None:
+            values = self.struct.unpack_from(buf, base + self.combined_offset)
+            for name, value in zip(self.combined_names, values):
+                setattr(rec, name, value)
+
+        for m in self.others:
+            values = m.struct.unpack_from(buf, base + m.offset)
+            if m.kind == _BITFIELD:
+                value = (values[0] >> m.shift) & m.mask
+                if m.signed and value & ((m.mask + 1) >> 1):
+                    value -= m.mask + 1
+            elif m.kind == _STRING:
+                value = values[0].split(b'\0', 1)[0].decode('utf-8',
+                                                            'replace')
+            elif m.kind == _ARRAY:
+                value = values
+            else:
+                value = values[0]
+            setattr(rec, m.name, value)
+
+        return rec
+
+    def decode(self, buf, address=None, offset=0):
+        """
+        Decodes a record from a buffer
+
+        Args:
+            buf (bytes, bytearray, or memoryview): The buffer containing the
+                structure
+            address (int, optional, default=None): The address to record
+                as the origin of the structure
+            offset (int, optional, default=0): The offset within buf
+                where the structure starts
+
+        Returns:
+            LayoutRecord: The decoded record
+        """
+        return self.__decode(buf, offset, address)
+
+    def read(self, addr):
+        """
+        Reads and decodes the structure at an address
+
+        Only the bytes between the first and last requested members are
+        read.
+
+        Args:
+            addr (int): The address of the structure
+
+        Returns:
+            LayoutRecord: The decoded record
+
+        Raises:
+            gdb.MemoryError: The memory could not be read
+        """
+        addr = long(addr)
+        buf = read_memory(addr + self.start, self.end - self.start)
+        return self.__decode(buf, -self.start, addr)
+
+    def read_array(self, addr, count, stride=None):
+        """
+        Reads and decodes an array of structures with a single read
+
+        Args:
+            addr (int): The address of the first structure
+            count (int): The number of structures to decode
+            stride (int, optional, default=None): The distance between
+                structures.  Defaults to the size of the structure.
+
+        Yields:
+            LayoutRecord: The decoded records, in order
+
+        Raises:
+            gdb.MemoryError: The memory could not be read
+        """
+        if count <= 0:
+            return
+        if stride is None:
+            stride = self.size
+        addr = long(addr)
+        length = (count - 1) * stride + self.end - self.start
+        buf = read_memory(addr + self.start, length)
+        for i in range(count):
+            yield self.__decode(buf, i * stride - self.start,
+                                addr + i * stride)
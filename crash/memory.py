@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+import array
+import struct
+
+if sys.version_info.major >= 3:
+    long = int
+
+from kdumpfile.exceptions import EOFException, NoDataException
+from kdumpfile.exceptions import AddressTranslationException
+from crash.infra import CrashBaseClass, export
+
+def _array_typecodes():
+    codes = {}
+    for code in ('B', 'H', 'I', 'L', 'Q'):
+        try:
+            size = array.array(code).itemsize
+        except ValueError:
+            # Python 2 has no 'Q'
+            continue
+        if size not in codes:
+            codes[size] = code
+    return codes
+
+class RawMemory(CrashBaseClass):
+    """
+    Raw access to kernel virtual memory
+
+    These helpers read memory without building gdb.Value objects, which is
+    much faster when all the caller wants is integers or bytes.  When the
+    current target is a kdump Target, reads go straight to its page cache.
+    Otherwise they fall back to gdb.Inferior.read_memory so the helpers
+    also work on plain executables and live processes.
+
+    Values are decoded using the byte order of the target.
+    """
+    __types__ = [ 'unsigned long' ]
+
+    byte_order = None
+    typecodes = _array_typecodes()
+    formats = { 1 : 'B', 2 : 'H', 4 : 'I', 8 : 'Q' }
+
+    @classmethod
+    def setup_byte_order(cls):
+        out = gdb.execute("show endian", to_string=True)
+        if 'big endian' in out:
+            cls.byte_order = 'big'
+        else:
+            cls.byte_order = 'little'
+
+    @classmethod
+    def __read(cls, addr, length):
+        # Only the kdump Target has a page cache.  It isn't imported by
+        # name since it pulls in the architecture code, which uses us.
+        target = gdb.current_target()
+        if hasattr(target, 'read_cached'):
+            try:
+                return target.read_cached(addr, length)
+            except (EOFException, NoDataException,
+                    AddressTranslationException) as e:
+                raise gdb.MemoryError("Cannot access memory at address {:#x}: {}"
+                                      .format(addr, str(e)))
+        buf = gdb.selected_inferior().read_memory(addr, length)
+        if not isinstance(buf, memoryview):
+            buf = bytearray(buf)
+        return buf
+
+    @classmethod
+    def __format(cls, size, count=1):
+        if cls.byte_order is None:
+            cls.setup_byte_order()
+        try:
+            code = cls.formats[size]
+        except KeyError:
+            raise ValueError("Unsupported item size {}".format(size))
+        prefix = '<'
+        if cls.byte_order == 'big':
+            prefix = '>'
+        return "{}{}{}".format(prefix, count, code)
+
+    @export
+    @classmethod
+    def read_memory(cls, addr, length):
+        """
+        Reads a range of kernel virtual memory
+
+        Args:
+            addr (int): The address to read
+            length (int): The number of bytes to read
+
+        Returns:
+            memoryview: The contents of the range
+
+        Raises:
+            gdb.MemoryError: The memory could not be read
+        """
+        return memoryview(cls.__read(long(addr), length))
+
+    @export
+    @classmethod
+    def read_unsigned(cls, addr, size):
+        """
+        Reads an unsigned integer of the given size
+
+        Args:
+            addr (int): The address to read
+            size (int): The size of the integer in bytes: 1, 2, 4, or 8
+
+        Returns:
+            int: The value read
+
+        Raises:
+            gdb.MemoryError: The memory could not be read
+            ValueError: The size is not supported
+        """
+        fmt = cls.__format(size)
+        return struct.unpack_from(fmt, cls.__read(long(addr), size))[0]
+
+    @export
+    @classmethod
+    def read_u8(cls, addr):
+        """Reads an 8-bit unsigned integer; see read_unsigned"""
+        return cls.read_unsigned(addr, 1)
+
+    @export
+    @classmethod
+    def read_u16(cls, addr):
+        """Reads a 16-bit unsigned integer; see read_unsigned"""
+        return cls.read_unsigned(addr, 2)
+
+    @export
+    @classmethod
+    def read_u32(cls, addr):
+        """Reads a 32-bit unsigned integer; see read_unsigned"""
+        return cls.read_unsigned(addr, 4)
+
+    @export
+    @classmethod
+    def read_u64(cls, addr):
+        """Reads a 64-bit unsigned integer; see read_unsigned"""
+        return cls.read_unsigned(addr, 8)
+
+    @export
+    @classmethod
+    def read_ulong(cls, addr):
+        """
+        Reads an unsigned long, which is also the size of a pointer
+
+        Args:
+            addr (int): The address to read
+
+        Returns:
+            int: The value read
+
+        Raises:
+            gdb.MemoryError: The memory could not be read
+        """
+        return cls.read_unsigned(addr, cls.unsigned_long_type.sizeof)
+
+    @export
+    @classmethod
+    def read_array(cls, addr, count, size):
+        """
+        Reads an array of unsigned integers
+
+        Args:
+            addr (int): The address of the first element
+            count (int): The number of elements to read
+            size (int): The size of each element in bytes: 1, 2, 4, or 8
+
+        Returns:
+            array.array: The elements read, in host byte order
+
+        Raises:
+            gdb.MemoryError: The memory could not be read
+            ValueError: The size is not supported
+        """
+        if cls.byte_order is None:
+            cls.setup_byte_order()
+        try:
+            code = cls.typecodes[size]
+        except KeyError:
+            raise ValueError("Unsupported item size {}".format(size))
+
+        result = array.array(code)
+        if count <= 0:
+            return result
+
+        buf = cls.__read(long(addr), count * size)
+        if sys.version_info.major >= 3:
+            result.frombytes(bytes(buf))
+        else:
+            result.fromstring(bytes(buf))
+        if cls.byte_order != sys.byteorder:
+            result.byteswap()
+        return result
+
+    @export
+    @classmethod
+    def read_ulong_array(cls, addr, count):
+        """
+        Reads an array of unsigned longs; see read_array
+
+        Args:
+            addr (int): The address of the first element
+            count (int): The number of elements to read
+
+        Returns:
+            array.array: The elements read, in host byte order
+
+        Raises:
+            gdb.MemoryError: The memory could not be read
+        """
+        return cls.read_array(addr, count, cls.unsigned_long_type.sizeof)
+
+    @export
+    @staticmethod
+    def prefetch(addr, length):
+        """
+        Hints that a range of kernel virtual memory is about to be read
+
+        This does nothing unless the current target is a kdump Target.
+
+        Args:
+            addr (int): The address to start at
+            length (int): The number of bytes that will be read
+        """
+        target = gdb.current_target()
+        if hasattr(target, 'prefetch'):
+            target.prefetch(long(addr), length)
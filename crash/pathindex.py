@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import os
+import os.path
+import json
+import errno
+import hashlib
+import tempfile
+
+INDEX_VERSION = 1
+
+def default_cache_dir():
+    """
+    Returns the directory used to store path indexes
+
+    This is $XDG_CACHE_HOME/crash-python, or ~/.cache/crash-python.
+    """
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'crash-python')
+
+class PathIndex(object):
+    """
+    A persistent index of the files under a search path
+
+    Walking large module and debuginfo trees, especially over NFS, is
+    slow.  A PathIndex keeps the list of files and subdirectories of each
+    directory on disk, along with the directory's mtime.  When refreshed,
+    only directories whose mtime has changed are listed again; the others
+    only need to be stat'ed.
+
+    Separate debuginfo files under .build-id directories are also indexed
+    by the build-id encoded in their path.
+
+    Args:
+        root (str): The directory tree to index
+        cache_dir (str, optional, default=None): The directory to store the
+            index in.  Defaults to default_cache_dir().  If the index can't
+            be written, it is simply not persisted.
+    """
+    def __init__(self, root, cache_dir=None):
+        self.root = os.path.abspath(root)
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+
+        digest = hashlib.sha1(self.root.encode('utf-8')).hexdigest()
+        self.cache_file = os.path.join(cache_dir,
+                                       "pathindex-{}.json".format(digest))
+
+        self.dirs = {}
+        self.names = {}
+        self.build_ids = {}
+        self.rescanned = 0
+
+        self.__load()
+
+    def __load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        if (data.get('version') == INDEX_VERSION and
+                data.get('root') == self.root):
+            self.dirs = data.get('dirs', {})
+
+    def __save(self):
+        data = {
+            'version' : INDEX_VERSION,
+            'root' : self.root,
+            'dirs' : self.dirs,
+        }
+
+        # Write a temporary file and rename it so concurrent sessions
+        # never see a partial index.
+        try:
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            (fd, tmpname) = tempfile.mkstemp(dir=self.cache_dir,
+                                             prefix='.pathindex')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.rename(tmpname, self.cache_file)
+        except (IOError, OSError):
+            pass
+
+    def refresh(self):
+        """
+        Brings the index up to date with the file system
+
+        Directories whose mtime is unchanged are not listed again.  The
+        index is written back to disk if anything changed.
+
+        Returns:
+            int: The number of directories that had to be listed
+        """
+        old = self.dirs
+        new = {}
+        self.rescanned = 0
+
+        pending = [ self.root ]
+        while pending:
+            dirpath = pending.pop()
+            try:
+                mtime = os.stat(dirpath).st_mtime
+            except OSError:
+                continue
+
+            cached = old.get(dirpath)
+            if cached is not None and cached['mtime'] == mtime:
+                entry = cached
+            else:
+                entry = self.__list(dirpath, mtime)
+                self.rescanned += 1
+            new[dirpath] = entry
+
+            for subdir in reversed(entry['subdirs']):
+                pending.append(os.path.join(dirpath, subdir))
+
+        changed = self.rescanned > 0 or len(new) != len(old)
+        self.dirs = new
+        self.__build_maps()
+        if changed:
+            self.__save()
+        return self.rescanned
+
+    @staticmethod
+    def __list(dirpath, mtime):
+        files = []
+        subdirs = []
+        try:
+            entries = sorted(os.listdir(dirpath))
+        except OSError:
+            entries = []
+
+        # Like os.walk, symlinks to directories are neither descended
+        # into nor treated as files.
+        for name in entries:
+            full = os.path.join(dirpath, name)
+            if os.path.isdir(full):
+                if not os.path.islink(full):
+                    subdirs.append(name)
+            else:
+                files.append(name)
+
+        return { 'mtime' : mtime, 'files' : files, 'subdirs' : subdirs }
+
+    def __build_maps(self):
+        names = {}
+        build_ids = {}
+        for dirpath in sorted(self.dirs.keys()):
+            entry = self.dirs[dirpath]
+            parent = os.path.basename(os.path.dirname(dirpath))
+            prefix = os.path.basename(dirpath)
+            in_build_id_dir = parent == '.build-id' and len(prefix) == 2
+
+            for filename in entry['files']:
+                path = os.path.join(dirpath, filename)
+                names[filename.replace('-', '_')] = path
+                if in_build_id_dir and filename.endswith('.debug'):
+                    build_ids[prefix + filename[:-len('.debug')]] = path
+
+        self.names = names
+        self.build_ids = build_ids
+
+    def lookup(self, name):
+        """
+        Returns the path to a file with the given name
+
+        '-' and '_' are treated as equivalent, as they are in module names.
+
+        Args:
+            name (str): The file name to look up
+
+        Returns:
+            str: The full path to the file, or None if it was not found
+        """
+        return self.names.get(name.replace('-', '_'))
+
+    def lookup_build_id(self, build_id):
+        """
+        Returns the path to the debuginfo file for a build-id
+
+        Args:
+            build_id (str): The build-id as a hex string
+
+        Returns:
+            str: The full path to the debuginfo file, or None if it was not
+                found
+        """
+        return self.build_ids.get(build_id.lower())
@@ -29,11 +29,18 @@ class Session(object):
             search for kernel modules and debuginfo
         debug (bool, optional, default=False): Whether to enable verbose
             debugging output
+        lazy_modules (bool, optional, default=False): Whether to defer
+            loading each module's symbols and debuginfo until an address
+            within it is needed
+        lazy_tasks (bool, optional, default=False): Whether to register
+            only the tasks running on a CPU as threads at startup and the
+            others when they are first needed
     """
 
 
     def __init__(self, kernel_exec=None, vmcore=None, kernelpath=None,
-                 searchpath=None, debug=False):
+                 searchpath=None, debug=False, lazy_modules=False,
+                 lazy_tasks=False):
         self.vmcore_filename = vmcore
 
         print("crash-python initializing...")
@@ -50,7 +57,10 @@ class Session(object):
         autoload_submodules('crash.commands')
 
         if kernel_exec:
-            self.kernel.setup_tasks()
-            self.kernel.load_modules(searchpath)
+            self.kernel.setup_tasks(lazy_tasks)
+            if lazy_modules:
+                self.kernel.setup_module_index()
+            else:
+                self.kernel.load_modules()
 
 
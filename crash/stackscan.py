@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+import bisect
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.memory import read_ulong_array
+from crash.kernel import thread_size, kernel_text_ranges
+from crash.cache.tasks import get_task_table
+
+class StackScanner(object):
+    """
+    Searches the raw contents of task kernel stacks
+
+    Each stack is read with a single read of THREAD_SIZE bytes and
+    searched as an array of words, without unwinding.  Finding which
+    tasks have a given function or object on their stacks is then a
+    matter of one read and a set intersection per task.
+
+    Args:
+        addresses (iterable of int, optional, default=None): The values to
+            search for, e.g. the addresses of locked inodes or of a lock
+        text (bool, optional, default=False): Whether to also search for
+            values within kernel or module text, e.g. return addresses
+        stack_size (int, optional, default=None): The size of each stack.
+            Defaults to THREAD_SIZE.
+    """
+    def __init__(self, addresses=None, text=False, stack_size=None):
+        if addresses is None:
+            addresses = []
+        self.addresses = frozenset([ long(addr) for addr in addresses ])
+
+        self.text = text
+        self.text_starts = []
+        self.text_ends = []
+        if text:
+            ranges = kernel_text_ranges()
+            self.text_starts = [ r[0] for r in ranges ]
+            self.text_ends = [ r[1] for r in ranges ]
+
+        if stack_size is None:
+            stack_size = thread_size()
+        self.stack_size = stack_size
+        self.word_size = gdb.lookup_type('unsigned long').sizeof
+        self.failed = 0
+
+    def __in_text(self, value):
+        idx = bisect.bisect_right(self.text_starts, value) - 1
+        return idx >= 0 and value < self.text_ends[idx]
+
+    def scan_stack(self, stack_base):
+        """
+        Searches one kernel stack
+
+        Args:
+            stack_base (int): The address of the start of the stack
+
+        Returns:
+            list of (int, int): The offset within the stack and the value
+                of each match, in ascending order of offset
+
+        Raises:
+            gdb.MemoryError: The stack could not be read
+        """
+        words = read_ulong_array(stack_base, self.stack_size // self.word_size)
+
+        # Stacks repeat a lot of values, and most values match nothing.
+        # Decide which distinct values match first so that only the
+        # stacks with matches need to be walked word by word.
+        values = set(words)
+        matches = values & self.addresses
+        if self.text and self.text_starts:
+            lowest = self.text_starts[0]
+            highest = self.text_ends[-1]
+            matches.update([ value for value in values
+                             if lowest <= value < highest and
+                                self.__in_text(value) ])
+        if not matches:
+            return []
+
+        return [ (i * self.word_size, word) for (i, word) in enumerate(words)
+                 if word in matches ]
+
+    def scan(self, rows=None):
+        """
+        Searches the kernel stacks of a set of tasks
+
+        Stacks that can't be read are skipped and counted in the failed
+        attribute.
+
+        Args:
+            rows (list of int, optional, default=None): The task table
+                rows of the tasks.  Defaults to every task, in pid order.
+
+        Yields:
+            (int, int, int): The task table row, the offset within the
+                stack, and the value of each match
+        """
+        table = get_task_table()
+        if rows is None:
+            rows = table.order('pid')
+
+        for row in rows:
+            try:
+                hits = self.scan_stack(table.stack[row])
+            except gdb.error:
+                self.failed += 1
+                continue
+            for (offset, value) in hits:
+                yield (row, offset, value)
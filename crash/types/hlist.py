@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+from crash.util import resolve_type, offsetof
+from crash.infra import CrashBaseClass, export
+from crash.memory import read_ulong
+from crash.types.list import CorruptListError, ListCycleError
+
+if sys.version_info.major >= 3:
+    long = int
+
+class TypesHlistClass(CrashBaseClass):
+    __types__ = [ 'struct hlist_head', 'struct hlist_node' ]
+
+    def __hlist_head_address(self, hlist_head):
+        if isinstance(hlist_head, gdb.Symbol):
+            hlist_head = hlist_head.value()
+        if isinstance(hlist_head, (int, long)):
+            return long(hlist_head)
+        if not isinstance(hlist_head, gdb.Value):
+            raise TypeError("hlist_head must be gdb.Value representing 'struct hlist_head' or a 'struct hlist_head *' not {}"
+                            .format(type(hlist_head).__name__))
+        if hlist_head.type == self.hlist_head_type.pointer():
+            return long(hlist_head)
+        elif hlist_head.type == self.hlist_head_type:
+            return long(hlist_head.address)
+        raise TypeError("Must be struct hlist_head not {}"
+                        .format(str(hlist_head.type)))
+
+    @export
+    def hlist_for_each_raw(self, hlist_head, print_broken_links=True,
+                           exact_cycles=False):
+        """
+        Iterates over an hlist, yielding the address of each node
+
+        The list is walked by reading the first/next pointers directly from
+        memory.  Each node's pprev is checked against the pointer that led
+        to it.  Since an hlist is NULL-terminated, a cycle would make the
+        walk endless, so cycles are always detected, using Brent's algorithm
+        unless exact_cycles is set.
+
+        Args:
+            hlist_head (gdb.Value, gdb.Symbol, or int): The struct hlist_head
+                or pointer to it, or its address
+            print_broken_links (bool, optional, default=True): Whether to
+                print broken pprev links as they are encountered
+            exact_cycles (bool, optional, default=False): Whether to detect
+                cycles by remembering every node visited
+
+        Yields:
+            int: The address of each struct hlist_node in the list
+
+        Raises:
+            CorruptListError: The list contains broken pprev links
+            ListCycleError: The list contains a cycle
+            BufferError: A node could not be read
+        """
+        pending_exception = None
+        head = self.__hlist_head_address(hlist_head)
+        if head == 0:
+            raise CorruptListError("hlist_head is NULL pointer.")
+
+        first_off = offsetof(self.hlist_head_type, 'first')
+        next_off = offsetof(self.hlist_node_type, 'next')
+        pprev_off = offsetof(self.hlist_node_type, 'pprev')
+
+        if exact_cycles:
+            visited = set()
+        else:
+            brent_mark = 0
+            brent_power = 1
+            brent_steps = 0
+
+        link = head + first_off
+        try:
+            node = read_ulong(link)
+        except gdb.error as e:
+            raise BufferError("Failed to read hlist_head {:#x}: {}"
+                              .format(head, str(e)))
+
+        while node != 0:
+            if exact_cycles:
+                if node in visited:
+                    raise ListCycleError("Cycle in hlist detected.")
+                visited.add(node)
+            else:
+                if node == brent_mark:
+                    raise ListCycleError("Cycle in hlist detected.")
+                brent_steps += 1
+                if brent_steps == brent_power:
+                    brent_mark = node
+                    brent_power *= 2
+                    brent_steps = 0
+
+            try:
+                pprev = read_ulong(node + pprev_off)
+                if pprev != link:
+                    error = ("broken pprev link {:#x} -> {:#x} -pprev-> {:#x}"
+                             .format(link, node, pprev))
+                    pending_exception = CorruptListError(error)
+                    if print_broken_links:
+                        print(error)
+                nxt = read_ulong(node + next_off)
+            except gdb.error as e:
+                raise BufferError("Failed to read hlist_node {:#x} in hlist {:#x}: {}"
+                                  .format(node, head, str(e)))
+
+            yield node
+
+            link = node + next_off
+            node = nxt
+
+        if pending_exception is not None:
+            raise pending_exception
+
+    @export
+    def hlist_for_each_entry(self, hlist_head, gdbtype, member,
+                             print_broken_links=True, exact_cycles=False):
+        """
+        Iterates over an hlist, yielding the structure containing each node
+
+        Args:
+            hlist_head (gdb.Value, gdb.Symbol, or int): The struct hlist_head
+                or pointer to it, or its address
+            gdbtype (gdb.Type or str): The type of the entries
+            member (str): The member of gdbtype containing the hlist_node
+            print_broken_links, exact_cycles: see hlist_for_each_raw
+
+        Yields:
+            gdb.Value<gdbtype>: Each entry in the list
+        """
+        gdbtype = resolve_type(gdbtype)
+        offset = offsetof(gdbtype, member)
+        pointer_type = gdbtype.pointer()
+        for node in hlist_for_each_raw(hlist_head,
+                                       print_broken_links=print_broken_links,
+                                       exact_cycles=exact_cycles):
+            yield gdb.Value(node - offset).cast(pointer_type).dereference()
@@ -7,8 +7,9 @@ from __future__ import division
 
 import gdb
 import sys
-from crash.util import container_of
+from crash.util import resolve_type, offsetof
 from crash.infra import CrashBaseClass, export
+from crash.memory import read_ulong
 
 if sys.version_info.major >= 3:
     long = int
@@ -27,7 +28,7 @@ class TypesListClass(CrashBaseClass):
 
     @export
     def list_for_each(self, list_head, include_head=False, reverse=False,
-            print_broken_links=True, exact_cycles=False):
+            print_broken_links=True, exact_cycles=False, brent_cycles=False):
         pending_exception = None
         if isinstance(list_head, gdb.Symbol):
             list_head = list_head.value()
@@ -51,6 +52,10 @@ class TypesListClass(CrashBaseClass):
 
         if exact_cycles:
             visited = set()
+        elif brent_cycles:
+            brent_mark = long(list_head.address)
+            brent_power = 1
+            brent_steps = 0
 
         if include_head:
             yield list_head.address
@@ -71,6 +76,16 @@ class TypesListClass(CrashBaseClass):
                     raise ListCycleError("Cycle in list detected.")
                 else:
                     visited.add(long(node.address))
+            elif brent_cycles:
+                # Brent's algorithm: remember one node and compare every
+                # node against it, moving it forward at powers of two
+                if long(node.address) == brent_mark:
+                    raise ListCycleError("Cycle in list detected.")
+                brent_steps += 1
+                if brent_steps == brent_power:
+                    brent_mark = long(node.address)
+                    brent_power *= 2
+                    brent_steps = 0
             try:
                 if long(prev.address) != long(node[prev_]):
                     error = ("broken {} link {:#x} -{}-> {:#x} -{}-> {:#x}"
@@ -82,7 +97,7 @@ class TypesListClass(CrashBaseClass):
                     # broken prev link means there might be a cycle that
                     # does not include the initial head, so start detecting
                     # cycles
-                    if not exact_cycles and fast is not None:
+                    if not (exact_cycles or brent_cycles) and fast is None:
                         fast = node
                 nxt = node[next_]
                 # only yield after trying to read something from the node, no
@@ -115,10 +130,170 @@ class TypesListClass(CrashBaseClass):
         if pending_exception is not None:
             raise pending_exception
 
+    def __list_head_address(self, list_head):
+        if isinstance(list_head, gdb.Symbol):
+            list_head = list_head.value()
+        if isinstance(list_head, (int, long)):
+            return long(list_head)
+        if not isinstance(list_head, gdb.Value):
+            raise TypeError("list_head must be gdb.Value representing 'struct list_head' or a 'struct list_head *' not {}"
+                            .format(type(list_head).__name__))
+        if list_head.type == self.list_head_type.pointer():
+            return long(list_head)
+        elif list_head.type == self.list_head_type:
+            return long(list_head.address)
+        raise TypeError("Must be struct list_head not {}"
+                        .format(str(list_head.type)))
+
     @export
-    def list_for_each_entry(self, list_head, gdbtype, member, include_head=False, reverse=False):
-        for node in list_for_each(list_head, include_head=include_head, reverse=reverse):
-            if node.type != self.list_head_type.pointer():
-                raise TypeError("Type {} found. Expected struct list_head *."
-                                .format(str(node.type)))
-            yield container_of(node, gdbtype, member)
+    def list_for_each_raw(self, list_head, include_head=False, reverse=False,
+                          print_broken_links=True, exact_cycles=False,
+                          brent_cycles=False):
+        """
+        Iterates over a list, yielding the address of each node
+
+        This behaves like list_for_each, including the reporting of broken
+        links and cycle detection, but follows the links as plain integers
+        read directly from memory instead of through gdb.Value.
+
+        Args:
+            list_head (gdb.Value, gdb.Symbol, or int): The struct list_head
+                or pointer to it at the head of the list, or its address
+            include_head (bool, optional, default=False): Whether to yield
+                the head itself
+            reverse (bool, optional, default=False): Whether to walk the
+                list using the prev links
+            print_broken_links (bool, optional, default=True): Whether to
+                print broken links as they are encountered
+            exact_cycles (bool, optional, default=False): Whether to detect
+                cycles by remembering every node visited
+            brent_cycles (bool, optional, default=False): Whether to detect
+                cycles using Brent's algorithm, which needs constant memory
+                and no additional reads.  Ignored if exact_cycles is set.
+
+        Yields:
+            int: The address of each struct list_head in the list
+
+        Raises:
+            CorruptListError: The list contains broken links or NULL pointers
+            ListCycleError: The list contains a cycle
+            BufferError: A list_head could not be read
+        """
+        pending_exception = None
+        head = self.__list_head_address(list_head)
+        if head == 0:
+            raise CorruptListError("list_head is NULL pointer.")
+
+        next_ = 'next'
+        prev_ = 'prev'
+        if reverse:
+            next_ = 'prev'
+            prev_ = 'next'
+        next_off = offsetof(self.list_head_type, next_)
+        prev_off = offsetof(self.list_head_type, prev_)
+
+        fast = None
+        if exact_cycles:
+            visited = set()
+        elif brent_cycles:
+            brent_mark = head
+            brent_power = 1
+            brent_steps = 0
+
+        if include_head:
+            yield head
+
+        try:
+            node = read_ulong(head + next_off)
+        except gdb.error as e:
+            raise BufferError("Failed to read list_head {:#x}: {}"
+                              .format(head, str(e)))
+        if node == 0:
+            raise CorruptListError("{} pointer is NULL".format(next_))
+        prev = head
+
+        while node != head:
+            if exact_cycles:
+                if node in visited:
+                    raise ListCycleError("Cycle in list detected.")
+                else:
+                    visited.add(node)
+            elif brent_cycles:
+                if node == brent_mark:
+                    raise ListCycleError("Cycle in list detected.")
+                brent_steps += 1
+                if brent_steps == brent_power:
+                    brent_mark = node
+                    brent_power *= 2
+                    brent_steps = 0
+            try:
+                node_prev = read_ulong(node + prev_off)
+                if node_prev != prev:
+                    error = ("broken {} link {:#x} -{}-> {:#x} -{}-> {:#x}"
+                             .format(prev_, prev, next_, node, prev_,
+                                     node_prev))
+                    pending_exception = CorruptListError(error)
+                    if print_broken_links:
+                        print(error)
+                    # see list_for_each
+                    if not (exact_cycles or brent_cycles) and fast is None:
+                        fast = node
+                nxt = read_ulong(node + next_off)
+            except gdb.error as e:
+                raise BufferError("Failed to read list_head {:#x} in list {:#x}: {}"
+                                  .format(node, head, str(e)))
+
+            # only yield after trying to read something from the node, no
+            # point in giving out bogus list elements
+            yield node
+
+            try:
+                if fast is not None:
+                    # Floyd's Tortoise and Hare, see list_for_each
+                    for i in range(2):
+                        fast = read_ulong(fast + next_off)
+                        if node == fast:
+                            raise ListCycleError("Cycle in list detected.")
+            except gdb.error:
+                fast = None
+
+            prev = node
+            if nxt == 0:
+                raise CorruptListError("{:#x} -> {} pointer is NULL"
+                                       .format(node, next_))
+            node = nxt
+
+        if pending_exception is not None:
+            raise pending_exception
+
+    @export
+    def list_for_each_entry(self, list_head, gdbtype, member,
+                            include_head=False, reverse=False,
+                            print_broken_links=True, exact_cycles=False,
+                            brent_cycles=False):
+        """
+        Iterates over a list, yielding the structure containing each node
+
+        The list is walked using list_for_each_raw, so a gdb.Value is only
+        created for the entries themselves.
+
+        Args:
+            list_head (gdb.Value, gdb.Symbol, or int): The struct list_head
+                or pointer to it at the head of the list, or its address
+            gdbtype (gdb.Type or str): The type of the entries
+            member (str): The member of gdbtype containing the list_head
+            include_head, reverse, print_broken_links, exact_cycles,
+            brent_cycles: see list_for_each_raw
+
+        Yields:
+            gdb.Value<gdbtype>: Each entry in the list
+        """
+        gdbtype = resolve_type(gdbtype)
+        offset = offsetof(gdbtype, member)
+        pointer_type = gdbtype.pointer()
+        for node in list_for_each_raw(list_head, include_head=include_head,
+                                      reverse=reverse,
+                                      print_broken_links=print_broken_links,
+                                      exact_cycles=exact_cycles,
+                                      brent_cycles=brent_cycles):
+            yield gdb.Value(node - offset).cast(pointer_type).dereference()
@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+import array
+import struct
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.util import find_member_variant, offsetof_type
+from crash.memory import RawMemory, read_memory
+from crash.types.page import Page, for_each_present_pfn_range
+
+# Number of struct pages decoded with each read
+PAGES_PER_CHUNK = 4096
+
+_unsigned_formats = { 1 : 'B', 2 : 'H', 4 : 'I', 8 : 'Q' }
+
+class MemMapChunk(object):
+    """
+    The decoded struct pages of a range of PFNs
+
+    Each member is decoded into its own column.  Row i of every column
+    describes the struct page of PFN start_pfn + i.  The select methods
+    filter a set of rows in one pass and can be chained, e.g. to find
+    the slab pages on node 1:
+
+        rows = chunk.on_node(1, chunk.with_flags(Page.PG_slab))
+
+    Attributes:
+        start_pfn (int): The PFN of the first row
+        address (int): The address of the struct page of the first row
+        flags, mapping, private, compound_head, lru_next, lru_prev
+            (array.array): The raw values of those members.
+            compound_head is first_page on kernels that have it.
+        refcount, mapcount (array.array): The counters of _refcount (or
+            _count) and _mapcount
+        missing (list of (int, int)): The ranges of rows whose struct
+            pages couldn't be read.  Their columns are 0.
+    """
+    # The array typecode of each column
+    columns = ( ('flags', 'L'), ('mapping', 'L'), ('private', 'L'),
+                ('refcount', 'l'), ('mapcount', 'l'), ('compound_head', 'L'),
+                ('lru_next', 'L'), ('lru_prev', 'L') )
+
+    def __init__(self, start_pfn, address, count=0):
+        self.start_pfn = start_pfn
+        self.address = address
+        self.missing = []
+        for (name, typecode) in self.columns:
+            setattr(self, name, array.array(typecode, [ 0 ]) * count)
+
+    def __len__(self):
+        return len(self.flags)
+
+    def pfn(self, row):
+        return self.start_pfn + row
+
+    def page_address(self, row):
+        return self.address + row * Page.page_type.sizeof
+
+    def __rows(self, rows):
+        if rows is None:
+            return range(len(self.flags))
+        return rows
+
+    def with_flags(self, mask, rows=None):
+        """
+        Selects the rows with any of a set of page flags
+
+        Args:
+            mask (int): The page flags, e.g. Page.PG_slab
+            rows (iterable of int, optional, default=None): The rows to
+                select from.  Defaults to every row.
+
+        Returns:
+            list of int: The selected rows, in order
+        """
+        flags = self.flags
+        return [ row for row in self.__rows(rows) if flags[row] & mask ]
+
+    def without_flags(self, mask, rows=None):
+        """
+        Selects the rows with none of a set of page flags
+
+        See with_flags.
+        """
+        flags = self.flags
+        return [ row for row in self.__rows(rows) if not flags[row] & mask ]
+
+    def on_node(self, nid, rows=None):
+        """
+        Selects the rows of the pages on a NUMA node
+
+        Args:
+            nid (int): The node id
+            rows (iterable of int, optional, default=None): See with_flags
+
+        Returns:
+            list of int: The selected rows, in order
+        """
+        shift = Page.BITS_PER_LONG - Page.NODES_WIDTH
+        flags = self.flags
+        return [ row for row in self.__rows(rows)
+                 if flags[row] >> shift == nid ]
+
+    def in_zone(self, zid, rows=None):
+        """
+        Selects the rows of the pages in a zone, on any node
+
+        Args:
+            zid (int): The zone index
+            rows (iterable of int, optional, default=None): See with_flags
+
+        Returns:
+            list of int: The selected rows, in order
+        """
+        shift = Page.BITS_PER_LONG - Page.NODES_WIDTH - Page.ZONES_WIDTH
+        mask = (1 << Page.ZONES_WIDTH) - 1
+        flags = self.flags
+        return [ row for row in self.__rows(rows)
+                 if (flags[row] >> shift) & mask == zid ]
+
+    def anon(self, rows=None):
+        """
+        Selects the rows of anonymous pages
+
+        Args:
+            rows (iterable of int, optional, default=None): See with_flags
+
+        Returns:
+            list of int: The selected rows, in order
+        """
+        mapping = self.mapping
+        return [ row for row in self.__rows(rows) if mapping[row] & 1 ]
+
+class MemMapScanner(object):
+    """
+    Reads the mem_map in large chunks
+
+    Creating a gdb.Value for every PFN and reading its members one by one
+    makes a pass over the mem_map of a large system impractical.  The
+    scanner reads the struct pages of up to chunk_pages PFNs at a time
+    with a single read and decodes the members most callers need into
+    MemMapChunk columns.  Sections that mem_section says have no mem_map are
+    skipped without trying to read them.
+
+    A chunk that can't be read is read again one page of struct pages at
+    a time, so that one unreadable page only loses the struct pages on it.
+    The number of struct pages lost this way is counted in the missing
+    attribute.
+
+    Args:
+        chunk_pages (int, optional, default=PAGES_PER_CHUNK): The maximum
+            number of struct pages to decode with each read
+    """
+    def __init__(self, chunk_pages=PAGES_PER_CHUNK):
+        self.chunk_pages = chunk_pages
+        self.missing = 0
+
+        page_type = Page.page_type
+        self.page_size = page_type.sizeof
+        refcount = find_member_variant(page_type, ('_refcount', '_count'))
+        members = { 'flags' : 'flags',
+                    'mapping' : 'mapping',
+                    'private' : 'private',
+                    'refcount' : refcount + '.counter',
+                    'mapcount' : '_mapcount.counter',
+                    'compound_head' : Page.compound_head_name,
+                    'lru_next' : 'lru.next',
+                    'lru_prev' : 'lru.prev' }
+        self.__build_structs(page_type, members)
+
+    def __build_structs(self, page_type, members):
+        # Each struct.Struct spans a whole struct page, so that a buffer
+        # of struct pages is decoded by iterating over it.  Members that
+        # overlap others, e.g. compound_head and lru.next, need a Struct
+        # of their own.  Members that are the same memory are decoded once.
+        if RawMemory.byte_order is None:
+            RawMemory.setup_byte_order()
+        if RawMemory.byte_order == 'big':
+            prefix = '>'
+        else:
+            prefix = '<'
+
+        fields = []
+        for (name, typecode) in MemMapChunk.columns:
+            (offset, gdbtype) = offsetof_type(page_type, members[name])
+            fields.append((offset, gdbtype.sizeof, name, typecode))
+        fields.sort()
+
+        passes = []
+        self.aliases = []
+        seen = {}
+        for (offset, size, name, typecode) in fields:
+            if (offset, size) in seen:
+                self.aliases.append((name, seen[(offset, size)]))
+                continue
+            seen[(offset, size)] = name
+
+            code = _unsigned_formats[size]
+            if typecode.islower():
+                code = code.lower()
+            for p in passes:
+                if p[0] <= offset:
+                    break
+            else:
+                p = [ 0, prefix, [] ]
+                passes.append(p)
+            if offset > p[0]:
+                p[1] += "{}x".format(offset - p[0])
+            p[1] += code
+            p[0] = offset + size
+            p[2].append(name)
+
+        self.structs = []
+        for (end, fmt, names) in passes:
+            if end < self.page_size:
+                fmt += "{}x".format(self.page_size - end)
+            self.structs.append((struct.Struct(fmt), tuple(names)))
+
+    def __read(self, chunk, row, addr, count):
+        try:
+            buf = read_memory(addr, count * self.page_size)
+        except gdb.error:
+            return False
+
+        end = row + count
+        for (decoder, names) in self.structs:
+            if hasattr(decoder, 'iter_unpack'):
+                records = decoder.iter_unpack(buf)
+            else:
+                records = [ decoder.unpack_from(buf, i * self.page_size)
+                            for i in range(count) ]
+            for (name, values) in zip(names, zip(*records)):
+                column = getattr(chunk, name)
+                column[row:end] = array.array(column.typecode, values)
+        for (name, source) in self.aliases:
+            getattr(chunk, name)[row:end] = getattr(chunk, source)[row:end]
+        return True
+
+    def read_chunk(self, start_pfn, count):
+        """
+        Reads the struct pages of a range of PFNs within one section
+
+        Rows for struct pages that can't be read are kept, with every
+        column 0, so that rows still map directly to PFNs.
+
+        Args:
+            start_pfn (int): The first PFN
+            count (int): The number of PFNs
+
+        Returns:
+            MemMapChunk: The decoded struct pages
+        """
+        addr = Page.pfn_to_page_address(start_pfn)
+        chunk = MemMapChunk(start_pfn, addr, count)
+        if self.__read(chunk, 0, addr, count):
+            return chunk
+
+        done = 0
+        while done < count:
+            # Stay within one page of struct pages
+            pos = addr + done * self.page_size
+            n = (Page.PAGE_SIZE - pos % Page.PAGE_SIZE) // self.page_size
+            n = min(max(n, 1), count - done)
+            if not self.__read(chunk, done, pos, n):
+                chunk.missing.append((done, done + n))
+                self.missing += n
+            done += n
+        return chunk
+
+    def scan(self, start_pfn=0, end_pfn=None):
+        """
+        Reads the mem_map in chunks
+
+        Args:
+            start_pfn (int, optional, default=0): The first PFN to read
+            end_pfn (int, optional, default=None): The PFN to stop at.
+                Defaults to max_pfn.
+
+        Yields:
+            MemMapChunk: The decoded struct pages, in PFN order
+        """
+        for (start, end) in for_each_present_pfn_range():
+            start = max(start, start_pfn)
+            if end_pfn is not None:
+                end = min(end, end_pfn)
+            while start < end:
+                count = min(self.chunk_pages, end - start)
+                yield self.read_chunk(start, count)
+                start += count
+
+# Value of _mapcount for free buddy pages before page_type existed
+PAGE_BUDDY_MAPCOUNT_VALUE = -128
+# page_type bits marking free buddy pages, which are cleared when set
+PAGE_TYPE_BASE = 0xf0000000
+PAGE_TYPE_BUDDY = 0x80
+
+# Larger values in page.private of a buddy page aren't an order
+MAX_BUDDY_ORDER = 20
+
+class PageCensus(object):
+    """
+    Classifies every page while streaming over the mem_map
+
+    Each allocation is classified by its first page and all of its pages
+    are counted in its category, in this order of precedence: reserved,
+    free (in the buddy allocator), slab, anon, file, and other.  The
+    pages are also counted by node and zone, by the combination of page
+    flags set on each page, and by compound order.
+
+    Args:
+        scanner (MemMapScanner, optional, default=None): The scanner to
+            read the mem_map with
+
+    Attributes:
+        categories (tuple of str): The names of the categories
+        totals (list of int): The number of pages in each category
+        zones (dict): Maps (nid, zid) to the number of pages in each
+            category
+        flag_combinations (dict): Maps each combination of page flags to
+            the number of pages with it
+        orders (dict): Maps each compound order to the number of
+            allocations of that order.  Pages that aren't part of a
+            compound page are order 0.
+        free_orders (dict): Maps each order to the number of free blocks
+            of that order
+        pages (int): The number of pages classified
+        missing (int): The number of struct pages that couldn't be read
+    """
+    categories = ( 'reserved', 'free', 'slab', 'anon', 'file', 'other' )
+
+    def __init__(self, scanner=None):
+        if scanner is None:
+            scanner = MemMapScanner()
+        self.scanner = scanner
+
+        self.totals = [ 0 ] * len(self.categories)
+        self.zones = {}
+        self.flag_combinations = {}
+        self.orders = {}
+        self.free_orders = {}
+        self.pages = 0
+        self.missing = 0
+
+        pageflags = Page.pageflags
+        if '__NR_PAGEFLAGS' in pageflags:
+            self.flag_mask = (1 << pageflags['__NR_PAGEFLAGS']) - 1
+        else:
+            self.flag_mask = (1 << (max(pageflags.values()) + 1)) - 1
+
+        self.PG_reserved = 1 << pageflags['PG_reserved']
+        self.PG_buddy = None
+        if 'PG_buddy' in pageflags:
+            self.PG_buddy = 1 << pageflags['PG_buddy']
+        self.PG_slab = Page.PG_slab
+        self.PG_tail = Page.PG_tail
+
+        self.node_shift = Page.BITS_PER_LONG - Page.NODES_WIDTH
+        self.zone_shift = self.node_shift - Page.ZONES_WIDTH
+        self.zone_mask = (1 << Page.ZONES_WIDTH) - 1
+
+        # The allocation being counted
+        self.head = None
+        self.head_pages = 0
+        self.free_left = 0
+
+    def flag_names(self, flags):
+        """
+        Returns the names of a combination of page flags
+
+        Args:
+            flags (int): The page flags
+
+        Returns:
+            list of str: The names of the flags, without the PG_ prefix
+        """
+        names = []
+        for (name, bit) in sorted(Page.pageflags.items(),
+                                  key=lambda item: (item[1], item[0])):
+            # Skip the aliases of flags that were already named
+            if name.startswith('PG_') and flags & (1 << bit):
+                names.append(name[3:])
+                flags &= ~(1 << bit)
+        return names
+
+    def __is_buddy(self, flags, mapcount):
+        if self.PG_buddy is not None:
+            return bool(flags & self.PG_buddy)
+        if mapcount == PAGE_BUDDY_MAPCOUNT_VALUE:
+            return True
+        return ((mapcount & 0xffffffff) & (PAGE_TYPE_BASE | PAGE_TYPE_BUDDY)
+                == PAGE_TYPE_BASE)
+
+    def __zone_counts(self, flags):
+        key = (flags >> self.node_shift,
+               (flags >> self.zone_shift) & self.zone_mask)
+        try:
+            return self.zones[key]
+        except KeyError:
+            counts = [ 0 ] * len(self.categories)
+            self.zones[key] = counts
+            return counts
+
+    def __finish(self):
+        if self.head is None:
+            return
+        (flags, mapping, private, mapcount) = self.head
+        run = self.head_pages
+        self.head = None
+
+        if flags & self.PG_reserved:
+            category = 0
+        elif self.__is_buddy(flags, mapcount):
+            category = 1
+            order = private
+            if order > MAX_BUDDY_ORDER:
+                order = 0
+            self.free_orders[order] = self.free_orders.get(order, 0) + 1
+            # The rest of the block follows and isn't marked
+            self.free_left = (1 << order) - run
+        elif flags & self.PG_slab:
+            category = 2
+        elif mapping & 1:
+            category = 3
+        elif mapping != 0 and not mapping & 2:
+            category = 4
+        else:
+            category = 5
+
+        order = run.bit_length() - 1
+        self.orders[order] = self.orders.get(order, 0) + 1
+        self.totals[category] += run
+        self.__zone_counts(flags)[category] += run
+
+    def __add_free(self, flags):
+        self.free_left -= 1
+        self.totals[1] += 1
+        self.__zone_counts(flags)[1] += 1
+
+    def add(self, chunk):
+        """
+        Classifies the pages of a chunk
+
+        Chunks must be added in PFN order, since allocations may span
+        chunks.
+
+        Args:
+            chunk (MemMapChunk): The chunk
+        """
+        skip = set()
+        for (start, end) in chunk.missing:
+            skip.update(range(start, end))
+            self.missing += end - start
+
+        PG_tail = self.PG_tail
+        flag_mask = self.flag_mask
+        combinations = self.flag_combinations
+        columns = zip(chunk.flags, chunk.mapping, chunk.private,
+                      chunk.mapcount, chunk.compound_head)
+        for (row, (flags, mapping, private, mapcount, head)) in \
+                enumerate(columns):
+            if skip and row in skip:
+                self.__finish()
+                self.free_left = 0
+                continue
+
+            self.pages += 1
+            combination = flags & flag_mask
+            combinations[combination] = combinations.get(combination, 0) + 1
+
+            if PG_tail is None:
+                tail = head & 1
+            else:
+                tail = (flags & PG_tail) == PG_tail
+            if tail and self.head is not None:
+                self.head_pages += 1
+                continue
+
+            self.__finish()
+            if self.free_left > 0:
+                self.__add_free(flags)
+                continue
+
+            self.head = (flags, mapping, private, mapcount)
+            self.head_pages = 1
+
+    def run(self, start_pfn=0, end_pfn=None):
+        """
+        Classifies the pages of a range of PFNs
+
+        Args:
+            start_pfn (int, optional, default=0): The first PFN
+            end_pfn (int, optional, default=None): The PFN to stop at.
+                Defaults to max_pfn.
+
+        Returns:
+            PageCensus: This census
+        """
+        for chunk in self.scanner.scan(start_pfn, end_pfn):
+            self.add(chunk)
+        self.__finish()
+        self.free_left = 0
+        return self
@@ -4,13 +4,22 @@
 from math import log, ceil
 import gdb
 import types
+import array
 from crash.infra import CrashBaseClass, export
 from crash.util import container_of, find_member_variant
 from crash.cache.syscache import config
+from crash.memory import prefetch
+from crash.layout import StructLayout
 
 #TODO debuginfo won't tell us, depends on version?
 PAGE_MAPPING_ANON = 1
 
+# Number of struct pages to ask the target to read ahead in for_each_page
+PREFETCH_PAGES = 512
+
+# Flag in mem_section.section_mem_map for sections with a mem_map
+SECTION_HAS_MEM_MAP = 2
+
 class Page(CrashBaseClass):
     __types__ = [ 'unsigned long', 'struct page', 'enum pageflags',
                     'enum zone_type', 'struct mem_section']
@@ -48,6 +57,13 @@ class Page(CrashBaseClass):
 
     sparsemem = False
 
+    # Encoded mem_map of each section, indexed by section number.  The
+    # sections under a root are read together, the first time one of
+    # them is needed.  0 means the section has no mem_map.
+    section_mem_maps = array.array('L')
+    section_roots_read = set()
+    section_layout = None
+
     @classmethod
     def setup_page_type(cls, gdbtype):
         # TODO: should check config, but that failed to work on ppc64, hardcode
@@ -62,6 +78,9 @@ class Page(CrashBaseClass):
         else:
             cls.PAGE_SHIFT = 12
             cls.PAGE_SIZE = 4096
+            # x86_64 addresses the mem_map through vmemmap, but still
+            # tracks which sections are present
+            cls.SECTION_SIZE_BITS = 27
 
         cls.PAGE_SIZE = 1 << cls.PAGE_SHIFT
 
@@ -78,17 +97,101 @@ class Page(CrashBaseClass):
     def setup_mem_section(cls, gdbtype):
         # TODO assumes SPARSEMEM_EXTREME
         cls.SECTIONS_PER_ROOT = cls.PAGE_SIZE / gdbtype.sizeof
+        cls.section_layout = StructLayout(gdbtype, ['section_mem_map'])
+        cls.section_mem_maps = array.array('L')
+        cls.section_roots_read = set()
 
     @classmethod
-    def pfn_to_page(cls, pfn):
+    def __read_section_root(cls, root_idx):
+        per_root = cls.SECTIONS_PER_ROOT
+        end = (root_idx + 1) * per_root
+        if len(cls.section_mem_maps) < end:
+            cls.section_mem_maps.extend([0] * (end - len(cls.section_mem_maps)))
+
+        # Sections under a root that can't be read are reported once and
+        # left without a mem_map rather than being read again for every
+        # lookup
+        cls.section_roots_read.add(root_idx)
+
+        try:
+            root = cls.mem_section[root_idx]
+            if root.type.strip_typedefs().code == gdb.TYPE_CODE_PTR:
+                addr = long(root)
+            else:
+                addr = long(root.address)
+            if addr == 0:
+                return
+            records = list(cls.section_layout.read_array(addr, per_root))
+        except gdb.error as e:
+            print("Couldn't read mem_section root {}: {}".format(root_idx, e))
+            return
+
+        base = root_idx * per_root
+        for (i, rec) in enumerate(records):
+            mem_map = rec.section_mem_map
+            if mem_map & SECTION_HAS_MEM_MAP:
+                cls.section_mem_maps[base + i] = mem_map & ~3L
+
+    @classmethod
+    def has_mem_section(cls):
+        """
+        Returns whether the kernel tracks present sections in mem_section
+
+        This is independent of how the mem_map is addressed.  Kernels with
+        SPARSEMEM_VMEMMAP have mem_section as well.
+
+        Returns:
+            bool: Whether section_mem_map can be used
+        """
+        if cls.section_layout is None:
+            return False
+        try:
+            cls.mem_section
+        except AttributeError:
+            return False
+        return True
+
+    @classmethod
+    def section_mem_map(cls, section_nr):
+        """
+        Returns the encoded mem_map of a sparsemem section
+
+        The struct page for pfn is at this address plus pfn struct pages,
+        as with the kernel's __section_mem_map_addr.
+
+        Args:
+            section_nr (int): The section number
+
+        Returns:
+            long: The encoded mem_map address, or None if the section
+                has no mem_map
+        """
+        root_idx = section_nr / cls.SECTIONS_PER_ROOT
+        if root_idx not in cls.section_roots_read:
+            cls.__read_section_root(root_idx)
+
+        mem_map = cls.section_mem_maps[section_nr]
+        if mem_map == 0:
+            return None
+        return mem_map
+
+    @classmethod
+    def pfn_to_page_address(cls, pfn):
         if cls.sparsemem:
             section_nr = pfn >> (cls.SECTION_SIZE_BITS - cls.PAGE_SHIFT)
-            root_idx = section_nr / cls.SECTIONS_PER_ROOT
-            offset = section_nr & (cls.SECTIONS_PER_ROOT - 1)
-            section = cls.mem_section[root_idx][offset]
+            pagemap = cls.section_mem_map(section_nr)
+            if pagemap is None:
+                raise gdb.MemoryError("No mem_map for pfn {:#x}".format(pfn))
+        else:
+            pagemap = cls.vmemmap_base
+
+        return pagemap + pfn * cls.page_type.sizeof
 
-            pagemap = section["section_mem_map"] & ~3L
-            return (pagemap.cast(cls.page_type.pointer()) + pfn).dereference()
+    @classmethod
+    def pfn_to_page(cls, pfn):
+        if cls.sparsemem:
+            addr = cls.pfn_to_page_address(pfn)
+            return gdb.Value(addr).cast(cls.page_type.pointer()).dereference()
         else:
             return cls.vmemmap[pfn]
 
@@ -208,6 +311,7 @@ class Page(CrashBaseClass):
         self.flags = long(obj["flags"])
 
 class Pages(CrashBaseClass):
+    missing = 0
 
     @export
     def pfn_to_page(cls, pfn):
@@ -224,14 +328,64 @@ class Pages(CrashBaseClass):
         return Page(gdb_obj, pfn)
 
     @export
-    def for_each_page():
-        # TODO works only on x86?
-        max_pfn = long(gdb.lookup_global_symbol("max_pfn").value())
-        for pfn in range(max_pfn):
+    def max_pfn(cls):
+        return long(gdb.lookup_global_symbol("max_pfn").value())
+
+    @export
+    def for_each_present_pfn_range(cls):
+        """
+        Yields the ranges of PFNs that have a mem_map
+
+        When the kernel has mem_section, sections without a mem_map are
+        skipped, whether the mem_map is addressed through the sections or
+        through vmemmap.  Otherwise there is a single range up to max_pfn.
+
+        Yields:
+            (long, long): The first PFN of each range and the PFN following
+                it
+        """
+        end_pfn = max_pfn()
+        if not Page.has_mem_section():
+            if end_pfn > 0:
+                yield (0L, end_pfn)
+            return
+
+        shift = Page.SECTION_SIZE_BITS - Page.PAGE_SHIFT
+        nr_sections = (end_pfn + (1 << shift) - 1) >> shift
+        for section_nr in range(nr_sections):
             try:
-                yield Page.pfn_to_page(pfn)
-            except gdb.error, e:
-                # TODO: distinguish pfn_valid() and report failures for those?
-                pass
+                if Page.section_mem_map(section_nr) is None:
+                    continue
+            except gdb.error:
+                continue
+            start = section_nr << shift
+            yield (start, min(start + (1 << shift), end_pfn))
+
+    @export
+    def for_each_page(cls):
+        """
+        Iterates over the struct pages of every present PFN
+
+        Struct pages that can't be read are skipped.  They are counted in
+        the missing attribute, which is reset on each call, and reported
+        once the iteration is complete.
+
+        Yields:
+            gdb.Value<struct page>: The struct page of each PFN
+        """
+        cls.missing = 0
+        for (start, end) in for_each_present_pfn_range():
+            for pfn in range(start, end):
+                try:
+                    page = Page.pfn_to_page(pfn)
+                    if pfn % PREFETCH_PAGES == 0:
+                        prefetch(long(page.address),
+                                 PREFETCH_PAGES * Page.page_type.sizeof)
+                except gdb.error:
+                    cls.missing += 1
+                    continue
+                yield page
+        if cls.missing:
+            print("Couldn't read the struct pages of {} PFNs".format(cls.missing))
 
 
@@ -7,9 +7,12 @@ from __future__ import division
 
 import gdb
 import sys
+import bisect
 from crash.infra import CrashBaseClass, export
-from crash.util import array_size
-from crash.types.list import list_for_each_entry
+from crash.util import array_size, offsetof
+from crash.types.list import list_for_each_raw
+from crash.layout import StructLayout
+from crash.memory import read_array, read_ulong_array
 from crash.exceptions import DelayedAttributeError
 
 if sys.version_info.major >= 3:
@@ -24,7 +27,11 @@ class TypesPerCPUClass(CrashBaseClass):
                              ('__per_cpu_end', 'setup_per_cpu_size') ]
     __symbol_callbacks__ = [ ('__per_cpu_offset', 'setup_nr_cpus') ]
 
+    # Sorted, merged [start, end) ranges of the dynamically allocated
+    # percpu areas
     dynamic_offset_cache = None
+    dynamic_offset_starts = None
+    per_cpu_offsets = None
 
     # TODO: put this somewhere else - arch?
     @classmethod
@@ -48,75 +55,123 @@ class TypesPerCPUClass(CrashBaseClass):
         # their callback yield offset of 0
         cls.setup_kaslr_offset()
 
-    @classmethod
-    def __add_to_offset_cache(cls, base, start, end):
-        cls.dynamic_offset_cache.append((base + start, base + end))
+    @staticmethod
+    def _map_used_areas(values, used_is_negative):
+        """
+        Decodes the used areas from a pcpu_chunk map
+
+        Prior to 3.14 commit 723ad1d90b56 ("percpu: store offsets instead
+        of lengths in ->map[]"), negative values in map meant the area is
+        used, and the absolute value is area size.  After the commit, the
+        value is area offset for unused, and offset | 1 for used (all
+        offsets have to be even).  The value at index 'map_used' is a
+        'sentry' which is the total size | 1.
+
+        Args:
+            values (list of int): The first map_used + 1 entries of map
+            used_is_negative (bool): Whether the map uses the old format
+
+        Returns:
+            list of (int, int): The [start, end) offsets of the used areas
+                within the chunk
+        """
+        areas = []
+        map_used = len(values) - 1
+        start = None
+        off = 0
+        if used_is_negative:
+            for val in values[:map_used]:
+                if val < 0:
+                    if start is None:
+                        start = off
+                else:
+                    if start is not None:
+                        areas.append((start, off))
+                        start = None
+                off += abs(val)
+            if start is not None:
+                areas.append((start, off))
+        else:
+            for off in values[:map_used]:
+                if off & 1 == 1:
+                    off -= 1
+                    if start is None:
+                        start = off
+                else:
+                    if start is not None:
+                        areas.append((start, off))
+                        start = None
+            if start is not None:
+                areas.append((start, values[map_used] - 1))
+        return areas
+
+    @staticmethod
+    def _merge_intervals(intervals):
+        """
+        Sorts a list of intervals and merges the overlapping or adjacent
+        ones
+
+        Args:
+            intervals (list of (int, int)): The [start, end) intervals
+
+        Returns:
+            list of (int, int): The merged intervals, in ascending order
+        """
+        merged = []
+        for (start, end) in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def __read_ints(addr, count):
+        # map is an array of signed ints
+        return [ val - (1 << 32) if val & 0x80000000 else val
+                 for val in read_array(addr, count, 4) ]
 
     @classmethod
     def __setup_dynamic_offset_cache(cls):
-        # TODO: interval tree would be more efficient, but this adds no 3rd
-        # party module dependency...
-        cls.dynamic_offset_cache = list()
+        layout = StructLayout(cls.pcpu_chunk_type,
+                              [ 'base_addr', 'map', 'map_used' ])
+        list_offset = offsetof(cls.pcpu_chunk_type, 'list')
+        base_addr = long(cls.pcpu_base_addr)
+
+        intervals = []
         used_is_negative = None
         for slot in range(cls.pcpu_nr_slots):
-            for chunk in list_for_each_entry(cls.pcpu_slot[slot], cls.pcpu_chunk_type, 'list'):
-                chunk_base = long(chunk["base_addr"]) - long(cls.pcpu_base_addr)
+            for node in list_for_each_raw(cls.pcpu_slot[slot]):
+                chunk = layout.read(node - list_offset)
+                chunk_base = chunk.base_addr - base_addr
                 # __per_cpu_start is adjusted by KASLR, but dynamic offsets are
                 # not, so we have to subtract the offset
                 chunk_base += long(cls.__per_cpu_start) - cls.kaslr_offset
 
-                off = 0
-                start = None
-                _map = chunk['map']
-                map_used = long(chunk['map_used'])
-
-                # Prior to 3.14 commit 723ad1d90b56 ("percpu: store offsets
-                # instead of lengths in ->map[]"), negative values in map
-                # meant the area is used, and the absolute value is area size.
-                # After the commit, the value is area offset for unused, and
-                # offset | 1 for used (all offsets have to be even). The value
-                # at index 'map_used' is a 'sentry' which is the total size |
-                # 1. There is no easy indication of whether kernel includes
-                # the commit, unless we want to rely on version numbers and
-                # risk breakage in case of backport to older version. Instead
-                # employ a heuristic which scans the first chunk, and if no
-                # negative value is found, assume the kernel includes the
-                # commit.
+                # The whole map, including the sentry, in one read
+                values = cls.__read_ints(chunk.map, chunk.map_used + 1)
+
+                # There is no easy indication of whether kernel includes
+                # the commit described in _map_used_areas, unless we want
+                # to rely on version numbers and risk breakage in case of
+                # backport to older version. Instead employ a heuristic
+                # which scans the first chunk, and if no negative value is
+                # found, assume the kernel includes the commit.
                 if used_is_negative is None:
                     used_is_negative = False
-                    for i in range(map_used):
-                        val = long(_map[i])
+                    for val in values[:chunk.map_used]:
                         if val < 0:
                             used_is_negative = True
                             break
 
-                if used_is_negative:
-                    for i in range(map_used):
-                        val = long(_map[i])
-                        if val < 0:
-                            if start is None:
-                                start = off
-                        else:
-                            if start is not None:
-                                cls.__add_to_offset_cache(chunk_base, start, off)
-                                start = None
-                        off += abs(val)
-                    if start is not None:
-                        cls.__add_to_offset_cache(chunk_base, start, off)
-                else:
-                    for i in range(map_used):
-                        off = long(_map[i])
-                        if off & 1 == 1:
-                            off -= 1
-                            if start is None:
-                                start = off
-                        else:
-                            if start is not None:
-                                cls.__add_to_offset_cache(chunk_base, start, off)
-                                start = None
-                    if start is not None:
-                        off = long(_map[map_used]) - 1
-                        cls.__add_to_offset_cache(chunk_base, start, off)
+                for (start, end) in cls._map_used_areas(values,
+                                                        used_is_negative):
+                    intervals.append((chunk_base + start, chunk_base + end))
+
+        cls.dynamic_offset_cache = cls._merge_intervals(intervals)
+        cls.dynamic_offset_starts = [ start for (start, end)
+                                      in cls.dynamic_offset_cache ]
 
     def __is_percpu_var(self, var):
         if long(var) < self.__per_cpu_start:
@@ -129,12 +184,8 @@ class TypesPerCPUClass(CrashBaseClass):
             self.__setup_dynamic_offset_cache()
 
         var = long(var)
-        # TODO: we could sort the list...
-        for (start, end) in self.dynamic_offset_cache:
-            if var >= start and var < end:
-                return True
-
-        return False
+        idx = bisect.bisect_right(self.dynamic_offset_starts, var) - 1
+        return idx >= 0 and var < self.dynamic_offset_cache[idx][1]
 
     @export
     def is_percpu_var(self, var):
@@ -167,8 +218,7 @@ class TypesPerCPUClass(CrashBaseClass):
         vartype = var.type
         return addr.cast(vartype).dereference()
 
-    @export
-    def get_percpu_var(self, var, cpu=None):
+    def __resolve_percpu_var(self, var):
         # Percpus can be:
         # - actual objects, where we'll need to use the address.
         # - pointers to objects, where we'll need to use the target
@@ -186,4 +236,72 @@ class TypesPerCPUClass(CrashBaseClass):
             var = var.address
         if not self.is_percpu_var(var):
             raise TypeError("Argument {} does not correspond to a percpu pointer.".format(var))
+        return (var, is_symbol)
+
+    @export
+    def get_percpu_var(self, var, cpu=None):
+        (var, is_symbol) = self.__resolve_percpu_var(var)
         return self.get_percpu_var_nocheck(var, cpu, is_symbol)
+
+    def __get_per_cpu_offsets(self):
+        if self.per_cpu_offsets is None:
+            addr = long(self.__per_cpu_offset.address)
+            TypesPerCPUClass.per_cpu_offsets = read_ulong_array(addr,
+                                                                self.nr_cpus)
+        return self.per_cpu_offsets
+
+    @export
+    def get_percpu_array(self, var, member, cpus=None):
+        """
+        Reads an array member of a percpu variable for a set of CPUs
+
+        The member is read as raw memory with one read per CPU rather than
+        through a gdb.Value for every element.
+
+        Args:
+            var (gdb.Symbol or gdb.Value): The percpu variable, as accepted
+                by get_percpu_var
+            member (str): The array member of the variable to read, e.g.
+                'vm_stat_diff'.  Members of embedded structures may be
+                specified as with offsetof, e.g. 'pcp.count'.
+            cpus (iterable of int, optional, default=None): The CPUs to read.
+                Defaults to every possible CPU.
+
+        Returns:
+            list of tuple: The elements of the array for each CPU, in the
+                order of cpus
+
+        Raises:
+            TypeError: var is not a percpu variable
+            gdb.MemoryError: The memory could not be read
+        """
+        (var, is_symbol) = self.__resolve_percpu_var(var)
+        if cpus is None:
+            cpus = range(0, self.nr_cpus)
+
+        layout = StructLayout(var.type.target(), [ member ], [ 'values' ],
+                              integers=[ 'values' ])
+
+        # See get_percpu_var_nocheck
+        base = long(var) - long(self.__per_cpu_start)
+        if not is_symbol:
+            base += self.kaslr_offset
+
+        offsets = self.__get_per_cpu_offsets()
+        return [ layout.read(offsets[cpu] + base).values for cpu in cpus ]
+
+    @export
+    def sum_percpu_array(self, var, member, cpus=None):
+        """
+        Sums an array member of a percpu variable across a set of CPUs
+
+        Args:
+            var, member, cpus: See get_percpu_array
+
+        Returns:
+            list of int: The sum of each element across the CPUs
+        """
+        rows = self.get_percpu_array(var, member, cpus)
+        if not rows:
+            return []
+        return [ sum(column) for column in zip(*rows) ]
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+from crash.util import resolve_type, offsetof, offsetof_type
+from crash.infra import CrashBaseClass, export
+from crash.memory import read_ulong, read_u8, read_ulong_array
+from crash.memory import read_unsigned
+from crash.exceptions import CorruptedError
+from crash.types.xarray import xarray_for_each_raw
+
+if sys.version_info.major >= 3:
+    long = int
+
+# Since v4.7, every pointer to a node has this bit set.  Before that, only
+# the root pointer did and it was called RADIX_TREE_INDIRECT_PTR.
+RADIX_TREE_INTERNAL_NODE = 1
+RADIX_TREE_EXCEPTIONAL_ENTRY = 2
+
+class RadixTreeCorruptedError(CorruptedError):
+    pass
+
+class TypesRadixTreeClass(CrashBaseClass):
+    __types__ = [ 'struct radix_tree_root', 'struct radix_tree_node' ]
+
+    map_size = None
+    map_shift = None
+    slots_offset = None
+    slots_size = None
+    shift_offset = None
+
+    def __setup_node_layout(self):
+        (offset, slots_type) = offsetof_type(self.radix_tree_node_type,
+                                             'slots')
+        self.slots_offset = offset
+        self.slots_size = slots_type.sizeof
+        self.map_size = slots_type.sizeof // slots_type.target().sizeof
+        self.map_shift = self.map_size.bit_length() - 1
+        # v4.7 and later store the shift in each node
+        self.shift_offset = offsetof(self.radix_tree_node_type, 'shift',
+                                     error=False)
+
+    @export
+    @staticmethod
+    def radix_tree_exceptional_entry(entry):
+        """
+        Returns whether an entry is an exceptional entry
+
+        Exceptional entries are used e.g. for shadow and swap entries in
+        the page cache and are not pointers.
+
+        Args:
+            entry (int): The entry
+
+        Returns:
+            bool: Whether the entry is exceptional
+        """
+        return (entry & RADIX_TREE_EXCEPTIONAL_ENTRY) != 0
+
+    def __walk(self, root, node, base, shift, first, last, depth):
+        if depth > 16:
+            raise RadixTreeCorruptedError("radix tree {:#x} is too deep at node {:#x}"
+                                          .format(root, node))
+        if self.shift_offset is not None:
+            shift = read_u8(node + self.shift_offset)
+        slots_start = node + self.slots_offset
+        slots_end = slots_start + self.slots_size
+        slots = read_ulong_array(slots_start, self.map_size)
+
+        for (i, entry) in enumerate(slots):
+            index = base + (i << shift)
+            if last is not None and index > last:
+                return
+            if index + (1 << shift) - 1 < first:
+                continue
+            if entry == 0:
+                continue
+
+            child = None
+            if self.shift_offset is not None:
+                if entry & RADIX_TREE_INTERNAL_NODE:
+                    child = entry & ~RADIX_TREE_INTERNAL_NODE
+                    # Retry entries and siblings of multi-order entries
+                    if child == 0 or slots_start <= child < slots_end:
+                        continue
+            elif shift > 0:
+                child = entry
+
+            if child is not None:
+                if shift == 0:
+                    raise RadixTreeCorruptedError("node pointer {:#x} in leaf node {:#x}"
+                                                  .format(entry, node))
+                for item in self.__walk(root, child, index,
+                                        shift - self.map_shift,
+                                        first, last, depth + 1):
+                    yield item
+            else:
+                yield (index, entry)
+
+    @export
+    def radix_tree_for_each_raw(self, root, first=0, last=None):
+        """
+        Iterates over the present entries of a radix tree in index order
+
+        Only the nodes that may contain indices within [first, last] are
+        read, and each node's slots are read with a single read.  Since
+        v4.20 the radix tree is implemented with an xarray, and a
+        struct xarray may be passed as well.
+
+        Args:
+            root (gdb.Value, gdb.Symbol, or int): The struct radix_tree_root
+                or pointer to it, or its address
+            first (int, optional, default=0): The first index to include
+            last (int, optional, default=None): The last index to include.
+                If None, iterate to the end.
+
+        Yields:
+            (int, int): The index and the raw entry.  The entry is either
+                a pointer or an exceptional entry; see
+                radix_tree_exceptional_entry.
+
+        Raises:
+            RadixTreeCorruptedError: The tree is corrupted
+            BufferError: A node could not be read
+        """
+        if isinstance(root, gdb.Symbol):
+            root = root.value()
+        if isinstance(root, gdb.Value):
+            gdbtype = root.type
+            if gdbtype.code == gdb.TYPE_CODE_PTR:
+                gdbtype = gdbtype.target()
+            if gdbtype.tag == 'xarray':
+                for item in xarray_for_each_raw(root, first, last):
+                    yield item
+                return
+            if gdbtype != self.radix_tree_root_type:
+                raise TypeError("Must be struct radix_tree_root not {}"
+                                .format(str(root.type)))
+            if root.type.code == gdb.TYPE_CODE_PTR:
+                addr = long(root)
+            else:
+                addr = long(root.address)
+        elif isinstance(root, (int, long)):
+            addr = long(root)
+        else:
+            raise TypeError("root must be gdb.Value representing 'struct radix_tree_root' or a 'struct radix_tree_root *' not {}"
+                            .format(type(root).__name__))
+
+        if self.map_size is None:
+            self.__setup_node_layout()
+
+        try:
+            rnode = read_ulong(addr + offsetof(self.radix_tree_root_type,
+                                               'rnode'))
+            if self.shift_offset is None:
+                (offset, height_type) = offsetof_type(self.radix_tree_root_type,
+                                                      'height')
+                height = read_unsigned(addr + offset, height_type.sizeof)
+        except gdb.error as e:
+            raise BufferError("Failed to read radix_tree_root {:#x}: {}"
+                              .format(addr, str(e)))
+
+        if rnode == 0:
+            return
+
+        if not rnode & RADIX_TREE_INTERNAL_NODE:
+            # A single entry at index 0 is stored in the root itself
+            if first == 0:
+                yield (0, rnode)
+            return
+
+        node = rnode & ~RADIX_TREE_INTERNAL_NODE
+        shift = 0
+        if self.shift_offset is None:
+            shift = (height - 1) * self.map_shift
+        try:
+            for item in self.__walk(addr, node, 0, shift, first, last, 0):
+                yield item
+        except gdb.error as e:
+            raise BufferError("Failed to read node in radix tree {:#x}: {}"
+                              .format(addr, str(e)))
+
+    @export
+    def radix_tree_for_each_entry(self, root, gdbtype, first=0, last=None):
+        """
+        Iterates over the pointer entries of a radix tree in index order
+
+        Exceptional entries are skipped.
+
+        Args:
+            root (gdb.Value, gdb.Symbol, or int): The struct radix_tree_root
+                or pointer to it, or its address
+            gdbtype (gdb.Type or str): The type the entries point to
+            first, last: see radix_tree_for_each_raw
+
+        Yields:
+            (int, gdb.Value<gdbtype>): The index and the entry
+        """
+        gdbtype = resolve_type(gdbtype)
+        pointer_type = gdbtype.pointer()
+        for (index, entry) in radix_tree_for_each_raw(root, first, last):
+            if self.radix_tree_exceptional_entry(entry):
+                continue
+            yield (index, gdb.Value(entry).cast(pointer_type).dereference())
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+from crash.util import resolve_type, offsetof, offsetof_type
+from crash.infra import CrashBaseClass, export
+from crash.memory import read_ulong, read_unsigned
+from crash.exceptions import CorruptedError
+
+if sys.version_info.major >= 3:
+    long = int
+
+# No balanced tree can get this deep; we're in a loop
+MAX_DEPTH = 128
+
+class RBTreeCorruptedError(CorruptedError):
+    pass
+
+class TypesRBTreeClass(CrashBaseClass):
+    __types__ = [ 'struct rb_root', 'struct rb_node' ]
+
+    def __rb_root_address(self, root):
+        if isinstance(root, gdb.Symbol):
+            root = root.value()
+        if isinstance(root, (int, long)):
+            return long(root)
+        if not isinstance(root, gdb.Value):
+            raise TypeError("root must be gdb.Value representing 'struct rb_root' or a 'struct rb_root *' not {}"
+                            .format(type(root).__name__))
+        if root.type == self.rb_root_type.pointer():
+            return long(root)
+        elif root.type == self.rb_root_type:
+            return long(root.address)
+        raise TypeError("Must be struct rb_root not {}"
+                        .format(str(root.type)))
+
+    def __walk(self, root, reverse, key=None, low=None, high=None):
+        addr = self.__rb_root_address(root)
+        if addr == 0:
+            raise RBTreeCorruptedError("rb_root is NULL pointer.")
+
+        first_ = 'rb_left'
+        second_ = 'rb_right'
+        if reverse:
+            first_ = 'rb_right'
+            second_ = 'rb_left'
+        first_off = offsetof(self.rb_node_type, first_)
+        second_off = offsetof(self.rb_node_type, second_)
+
+        try:
+            node = read_ulong(addr + offsetof(self.rb_root_type, 'rb_node'))
+        except gdb.error as e:
+            raise BufferError("Failed to read rb_root {:#x}: {}"
+                              .format(addr, str(e)))
+
+        # An iterative in-order walk.  Only the path back to the root is
+        # kept, so memory use is bounded by the depth of the tree.  No
+        # node may be yielded twice, which is checked with Brent's
+        # algorithm, as list_for_each does: each node is compared
+        # against a mark that moves forward at powers of two.
+        brent_mark = 0
+        brent_power = 1
+        brent_steps = 0
+        stack = []
+        while stack or node != 0:
+            try:
+                skipped = 0
+                while node != 0:
+                    if len(stack) + skipped > MAX_DEPTH:
+                        raise RBTreeCorruptedError("rbtree {:#x} is deeper than {} levels, likely a cycle"
+                                                   .format(addr, MAX_DEPTH))
+                    if key is not None:
+                        k = key(node)
+                        # Everything before this node is out of range too
+                        if low is not None and k < low:
+                            node = read_ulong(node + second_off)
+                            skipped += 1
+                            continue
+                    else:
+                        k = None
+                    stack.append((node, k))
+                    node = read_ulong(node + first_off)
+
+                if not stack:
+                    return
+                (node, k) = stack.pop()
+                if high is not None and k >= high:
+                    return
+
+                nxt = read_ulong(node + second_off)
+            except gdb.error as e:
+                raise BufferError("Failed to read rb_node {:#x} in rbtree {:#x}: {}"
+                                  .format(node, addr, str(e)))
+
+            if node == brent_mark:
+                raise RBTreeCorruptedError("rbtree {:#x} visits node {:#x} twice, likely a cycle"
+                                           .format(addr, node))
+            brent_steps += 1
+            if brent_steps == brent_power:
+                brent_mark = node
+                brent_power *= 2
+                brent_steps = 0
+
+            yield node
+            node = nxt
+
+    @export
+    def rbtree_for_each_raw(self, root, reverse=False):
+        """
+        Iterates over an rbtree in order, yielding the address of each node
+
+        Args:
+            root (gdb.Value, gdb.Symbol, or int): The struct rb_root or
+                pointer to it, or its address
+            reverse (bool, optional, default=False): Whether to iterate
+                from the last node to the first
+
+        Yields:
+            int: The address of each struct rb_node in the tree
+
+        Raises:
+            RBTreeCorruptedError: The tree is corrupted
+            BufferError: A node could not be read
+        """
+        for node in self.__walk(root, reverse):
+            yield node
+
+    @export
+    def rbtree_for_each_entry(self, root, gdbtype, member, reverse=False):
+        """
+        Iterates over an rbtree in order, yielding each entry
+
+        Args:
+            root (gdb.Value, gdb.Symbol, or int): The struct rb_root or
+                pointer to it, or its address
+            gdbtype (gdb.Type or str): The type of the entries
+            member (str): The member of gdbtype containing the rb_node
+            reverse (bool, optional, default=False): Whether to iterate
+                from the last node to the first
+
+        Yields:
+            gdb.Value<gdbtype>: Each entry in the tree
+        """
+        gdbtype = resolve_type(gdbtype)
+        offset = offsetof(gdbtype, member)
+        pointer_type = gdbtype.pointer()
+        for node in self.__walk(root, reverse):
+            yield gdb.Value(node - offset).cast(pointer_type).dereference()
+
+    @export
+    def rbtree_for_each_entry_range(self, root, gdbtype, member, key,
+                                    low=None, high=None):
+        """
+        Iterates in order over the entries of an rbtree within a key range
+
+        The tree must be sorted by an integer member of the entries, e.g.
+        vm_start for the VMAs of an mm_struct.  Subtrees that lie entirely
+        outside of the range are not visited.
+
+        Args:
+            root (gdb.Value, gdb.Symbol, or int): The struct rb_root or
+                pointer to it, or its address
+            gdbtype (gdb.Type or str): The type of the entries
+            member (str): The member of gdbtype containing the rb_node
+            key (str): The integer member of gdbtype the tree is sorted by
+            low (int, optional, default=None): The first key to include
+            high (int, optional, default=None): The first key beyond the
+                range.  The range is [low, high).
+
+        Yields:
+            gdb.Value<gdbtype>: Each entry within the range
+        """
+        gdbtype = resolve_type(gdbtype)
+        offset = offsetof(gdbtype, member)
+        (key_offset, key_type) = offsetof_type(gdbtype, key)
+        key_offset -= offset
+        key_size = key_type.sizeof
+        pointer_type = gdbtype.pointer()
+
+        def read_key(node):
+            return read_unsigned(node + key_offset, key_size)
+
+        for node in self.__walk(root, False, read_key, low, high):
+            yield gdb.Value(node - offset).cast(pointer_type).dereference()
@@ -5,15 +5,21 @@ import gdb
 import crash
 import sys
 import traceback
+import array
+import bisect
 from crash.util import container_of, find_member_variant, get_symbol_value
+from crash.util import offsetof
 from crash.util import safe_get_symbol_value
 from percpu import get_percpu_var
 from crash.infra import CrashBaseClass, export
-from crash.types.list import list_for_each, list_for_each_entry
+from crash.types.list import list_for_each_raw, list_for_each_entry
+from crash.types.list import ListError
 from crash.types.page import Page, page_from_gdb_obj, page_from_addr
 from crash.types.node import for_each_nid
 from crash.types.cpu import for_each_online_cpu
 from crash.types.node import numa_node_id
+from crash.memory import prefetch, read_array
+from crash.layout import StructLayout
 
 AC_PERCPU = "percpu"
 AC_SHARED = "shared"
@@ -84,6 +90,9 @@ class Slab(CrashBaseClass):
 
     @classmethod
     def from_list_head(cls, list_head, kmem_cache):
+        if isinstance(list_head, (int, long)):
+            offset = offsetof(cls.real_slab_type, cls.slab_list_head)
+            return cls.from_addr(list_head - offset, kmem_cache)
         gdb_obj = container_of(list_head, cls.real_slab_type, cls.slab_list_head)
         return Slab(gdb_obj, kmem_cache)
 
@@ -116,8 +125,11 @@ class Slab(CrashBaseClass):
         if self.page_slab:
             page = self.gdb_obj
             freelist = page["freelist"].cast(self.bufctl_type.pointer())
-            for i in range(self.inuse, objs_per_slab):
-                obj_idx  = int(freelist[i])
+            idx_size = self.bufctl_type.sizeof
+            # Read all the free indexes at once instead of one gdb.Value each
+            indexes = read_array(long(freelist) + self.inuse * idx_size,
+                                 objs_per_slab - self.inuse, idx_size)
+            for obj_idx in indexes:
                 self.__add_free_obj_by_idx(obj_idx)
             # XXX not generally useful and reliable
             if False and objs_per_slab > 1:
@@ -183,15 +195,19 @@ class Slab(CrashBaseClass):
         self.__error(": is on list %s, but has %d of %d objects allocated" %
                 (list_name, self.inuse, self.kmem_cache.objs_per_slab), misplaced = True)
 
-    def get_objects(self):
+    def get_objects(self, prefetch_objs=False):
         bufsize = self.kmem_cache.buffer_size
         obj = self.s_mem
+        # Callers that read the objects themselves can ask for the whole
+        # slab to be read at once instead of one object at a time
+        if prefetch_objs:
+            prefetch(obj, bufsize * self.kmem_cache.objs_per_slab)
         for i in range(self.kmem_cache.objs_per_slab):
             yield obj
             obj += bufsize
 
-    def get_allocated_objects(self):
-        for obj in self.get_objects():
+    def get_allocated_objects(self, prefetch_objs=False):
+        for obj in self.get_objects(prefetch_objs):
             c = self.contains_obj(obj)
             if c[0]:
                 yield obj
@@ -327,7 +343,7 @@ class KmemCache(CrashBaseClass):
     def __get_nodelist(self, node):
         return self.gdb_obj[KmemCache.nodelists_name][node]
         
-    def __get_nodelists(self):
+    def get_nodelists(self):
         for nid in for_each_nid():
             node = self.__get_nodelist(nid)
             if long(node) == 0L:
@@ -426,7 +442,7 @@ class KmemCache(CrashBaseClass):
         self.__fill_percpu_caches()
 
         # TODO check and report collisions
-        for (nid, node) in self.__get_nodelists():
+        for (nid, node) in self.get_nodelists():
             shared_cache = node["shared"]
             if long(shared_cache) != 0:
                 self.__fill_array_cache(shared_cache.dereference(), AC_SHARED, nid, nid)
@@ -439,26 +455,31 @@ class KmemCache(CrashBaseClass):
 
         return self.array_caches
 
-    def __get_allocated_objects(self, node, slabtype):
+    def __get_allocated_objects(self, node, slabtype, prefetch_objs):
         for slab in self.get_slabs_of_type(node, slabtype):
-            for obj in slab.get_allocated_objects():
+            for obj in slab.get_allocated_objects(prefetch_objs):
                 yield obj
 
-    def get_allocated_objects(self):
-        for (nid, node) in self.__get_nodelists():
-            for obj in self.__get_allocated_objects(node, slab_partial):
+    def get_allocated_objects(self, prefetch_objs=False):
+        for (nid, node) in self.get_nodelists():
+            for obj in self.__get_allocated_objects(node, slab_partial,
+                                                    prefetch_objs):
                 yield obj
-            for obj in self.__get_allocated_objects(node, slab_full):
+            for obj in self.__get_allocated_objects(node, slab_full,
+                                                    prefetch_objs):
                 yield obj
 
-    def get_slabs_of_type(self, node, slabtype, reverse=False, exact_cycles=False):
+    def get_slabs_of_type(self, node, slabtype, reverse=False,
+                          exact_cycles=False, brent_cycles=True):
         wrong_list_nodes = dict()
         for stype in range(3):
             if stype != slabtype:
                 wrong_list_nodes[long(node[slab_list_fullname[stype]].address)] = stype
 
         slab_list = node[slab_list_fullname[slabtype]]
-        for list_head in list_for_each(slab_list, reverse=reverse, exact_cycles=exact_cycles):
+        for list_head in list_for_each_raw(slab_list, reverse=reverse,
+                                           exact_cycles=exact_cycles,
+                                           brent_cycles=brent_cycles):
             try:
                 if long(list_head) in wrong_list_nodes.keys():
                     wrong_type = wrong_list_nodes[long(list_head)]
@@ -520,7 +541,7 @@ class KmemCache(CrashBaseClass):
                     'first_misplaced': None, 'last_misplaced': None, 'num_misplaced': 0}
 
         try:
-            for slab in self.get_slabs_of_type(node, slabtype, reverse, exact_cycles=True):
+            for slab in self.get_slabs_of_type(node, slabtype, reverse):
                 try:
                     free += self.__check_slab(slab, slabtype, nid, errors)
                 except Exception as e:
@@ -568,10 +589,21 @@ class KmemCache(CrashBaseClass):
 
         return free
 
-    def check_array_caches(self):
+    def check_array_caches(self, index=None):
         acs = self.get_array_caches()
-        for ac_ptr in acs.keys():
-            ac_obj_slab = slab_from_obj_addr(ac_ptr)
+        if index is not None:
+            found = []
+            for (ptr, row) in index.classify(acs.keys()):
+                if row is not None:
+                    slab = index.slab(row)
+                else:
+                    # The slab may be on a list the index couldn't read
+                    slab = slab_from_obj_addr(ptr)
+                found.append((ptr, slab))
+        else:
+            found = [ (ptr, slab_from_obj_addr(ptr)) for ptr in acs.keys() ]
+
+        for (ac_ptr, ac_obj_slab) in found:
             if not ac_obj_slab:
                 print("cached pointer {:#x} in {} not found in slab".format(
                         ac_ptr, acs[ac_ptr]))
@@ -587,8 +619,8 @@ class KmemCache(CrashBaseClass):
                     print("cached pointer {:#x} in {} has wrong offset: {}".format(
                         ac_ptr, acs[ac_ptr], ac_obj_obj))
 
-    def check_all(self):
-        for (nid, node) in self.__get_nodelists():
+    def check_all(self, index=None):
+        for (nid, node) in self.get_nodelists():
             try:
                 # This is version and architecture specific
                 lock = long(node["list_lock"]["rlock"]["raw_lock"]["slock"])
@@ -604,7 +636,172 @@ class KmemCache(CrashBaseClass):
             if free_declared != free_counted:
                 print (col_error("free objects mismatch on node %d: declared=%d counted=%d" %
                                                 (nid, free_declared, free_counted)))
-        self.check_array_caches()
+        self.check_array_caches(index)
+
+class SlabIndex(object):
+    """
+    Maps addresses to the slabs of all kmem caches
+
+    Finding the slab of an address through its struct page takes several
+    gdb reads, and a new Slab whose free list must be read again for every
+    address.  The index walks the slab lists of every cache once, reading
+    only s_mem and the number of objects in use of each slab, and records
+    the address range of the objects of each slab in sorted arrays.  The
+    slab containing an address is then found by bisection, and the Slab
+    of each slab that is looked up is only built once.
+
+    Args:
+        caches (list of KmemCache, optional, default=None): The caches to
+            index.  Defaults to all of them.
+
+    Attributes:
+        starts, ends (array.array): The address of the first object of
+            each slab and the address following its last object, sorted
+        slabs (array.array): The address of the slab descriptor of each
+            slab
+        inuse (array.array): The number of objects in use in each slab
+        slab_types (array.array): The list each slab was found on:
+            slab_partial, slab_full, or slab_free
+        caches (list of KmemCache): The cache of each slab
+        failed (int): The number of slab lists that couldn't be read
+            completely
+    """
+    def __init__(self, caches=None):
+        if caches is None:
+            caches = kmem_cache_get_all()
+
+        inuse_name = find_member_variant(Slab.real_slab_type,
+                                         ('active', 'inuse'))
+        self.layout = StructLayout(Slab.real_slab_type,
+                                   [ 's_mem', inuse_name ],
+                                   [ 's_mem', 'inuse' ])
+        self.list_offset = offsetof(Slab.real_slab_type, Slab.slab_list_head)
+        self.failed = 0
+
+        entries = []
+        for cache in caches:
+            for (nid, node) in cache.get_nodelists():
+                for slabtype in range(3):
+                    self.__read_slabs(entries, cache, node, slabtype)
+        entries.sort(key=lambda entry: entry[0])
+
+        self.starts = array.array('L', [ e[0] for e in entries ])
+        self.ends = array.array('L', [ e[1] for e in entries ])
+        self.slabs = array.array('L', [ e[2] for e in entries ])
+        self.inuse = array.array('l', [ e[3] for e in entries ])
+        self.slab_types = array.array('b', [ e[4] for e in entries ])
+        self.caches = [ e[5] for e in entries ]
+        self.slab_objs = {}
+
+    def __read_slabs(self, entries, cache, node, slabtype):
+        heads = set([ long(node[name].address)
+                      for name in slab_list_fullname.values() ])
+        size = cache.buffer_size * cache.objs_per_slab
+        try:
+            for list_head in list_for_each_raw(node[slab_list_fullname[slabtype]],
+                                               print_broken_links=False,
+                                               brent_cycles=True):
+                if list_head in heads:
+                    continue
+                rec = self.layout.read(list_head - self.list_offset)
+                entries.append((rec.s_mem, rec.s_mem + size, rec.address,
+                                rec.inuse, slabtype, cache))
+        except (gdb.error, ListError, BufferError):
+            self.failed += 1
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, addr):
+        """
+        Returns the row of the slab whose objects contain an address
+
+        Args:
+            addr (int): The address
+
+        Returns:
+            int: The row, or None if the address isn't within an indexed slab
+        """
+        row = bisect.bisect_right(self.starts, addr) - 1
+        if row >= 0 and addr < self.ends[row]:
+            return row
+        return None
+
+    def classify(self, addrs):
+        """
+        Finds the slabs containing a set of addresses in one pass
+
+        Args:
+            addrs (iterable of int): The addresses
+
+        Returns:
+            list of (int, int): Each address, in ascending order, and the
+                row of the slab containing it, or None
+        """
+        result = []
+        row = 0
+        nr = len(self.starts)
+        for addr in sorted(addrs):
+            while row < nr and self.ends[row] <= addr:
+                row += 1
+            if row < nr and self.starts[row] <= addr:
+                result.append((addr, row))
+            else:
+                result.append((addr, None))
+        return result
+
+    def object_address(self, row, addr):
+        """
+        Returns the address of the object containing an address
+
+        Args:
+            row (int): The row of the slab containing addr
+            addr (int): The address
+
+        Returns:
+            int: The address of the object
+        """
+        bufsize = self.caches[row].buffer_size
+        start = self.starts[row]
+        return start + (addr - start) // bufsize * bufsize
+
+    def slab(self, row):
+        """
+        Returns the Slab of a row, which is only built once
+
+        Args:
+            row (int): The row
+
+        Returns:
+            Slab: The slab
+        """
+        try:
+            return self.slab_objs[row]
+        except KeyError:
+            pass
+        slab = Slab.from_addr(self.slabs[row], self.caches[row])
+        self.slab_objs[row] = slab
+        return slab
+
+    def contains_obj(self, addr):
+        """
+        Finds the cache and object containing an address
+
+        Args:
+            addr (int): The address
+
+        Returns:
+            (KmemCache, (bool, int, dict)): The cache, and the result of
+                Slab.contains_obj for the address, or None if the address
+                isn't within an indexed slab
+        """
+        row = self.find(addr)
+        if row is None:
+            return None
+        cache = self.caches[row]
+        if self.slab_types[row] == slab_free:
+            return (cache, (False, self.object_address(row, addr), None))
+        return (cache, self.slab(row).contains_obj(addr))
 
 class KmemCaches(CrashBaseClass):
 
@@ -613,6 +810,7 @@ class KmemCaches(CrashBaseClass):
 
     kmem_caches = None
     kmem_caches_by_addr = None
+    slab_index = None
 
     @classmethod
     def setup_slab_caches(cls, slab_caches):
@@ -648,6 +846,36 @@ class KmemCaches(CrashBaseClass):
     def kmem_cache_get_all(cls):
         return cls.kmem_caches.values()
 
+    @export
+    def get_slab_index(cls):
+        if cls.slab_index is None:
+            cls.slab_index = SlabIndex()
+        return cls.slab_index
+
+    @export
+    def check_kmem_cache(cls, name):
+        """
+        Checks the consistency of a kmem cache
+
+        This is the function the workers of a parallel kmem -s call.  Only
+        the slabs of the cache itself are indexed, so that a worker
+        doesn't have to index every cache before checking its first one.
+        Objects found outside of them are looked up through their pages.
+
+        Args:
+            name (str): The name of the cache
+
+        Raises:
+            KeyError: There is no cache with that name
+        """
+        cache = kmem_cache_from_name(name)
+        if cache is None:
+            raise KeyError("Cache {} not found.".format(name))
+        index = SlabIndex([ cache ])
+        if index.failed:
+            print("%d slab lists could not be read completely" % index.failed)
+        cache.check_all(index)
+
     @export
     def slab_from_obj_addr(cls, addr):
         page = page_from_addr(addr).compound_head()
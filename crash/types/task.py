@@ -7,12 +7,17 @@ from __future__ import division
 
 import gdb
 import sys
+import re
+import array
+import struct
 
 if sys.version_info.major >= 3:
     long = int
 
-from crash.util import array_size
+from crash.util import array_size, offsetof_type
 from crash.infra import CrashBaseClass
+from crash.layout import StructLayout
+from crash.memory import RawMemory, read_unsigned
 from crash.infra.lookup import DelayedValue, ClassProperty, get_delayed_lookup
 
 PF_EXITING = long(0x4)
@@ -89,6 +94,93 @@ class TaskStateFlags(CrashBaseClass):
 
 TF = TaskStateFlags
 
+def state_maybe_dead(state):
+    """
+    Returns whether a task state has none of the known sleep states set
+
+    Args:
+        state (int): The task state, including the exit state
+
+    Returns:
+        bool: Whether the task may be dead
+    """
+    known = TF.TASK_INTERRUPTIBLE
+    known |= TF.TASK_UNINTERRUPTIBLE
+    known |= TF.TASK_ZOMBIE
+    known |= TF.TASK_STOPPED
+
+    if hasattr(TF, 'TASK_SWAPPING'):
+        known |= TF.TASK_SWAPPING
+    return (state & known) == 0
+
+task_state_strings = None
+
+def setup_task_state_strings():
+    """
+    Builds the map of task states to the abbreviations ps uses
+
+    Raises:
+        AttributeError: The task states are not known yet
+    """
+    global task_state_strings
+    if task_state_strings is not None:
+        return
+
+    strings = {
+        TF.TASK_RUNNING         : "RU",
+        TF.TASK_INTERRUPTIBLE   : "IN",
+        TF.TASK_UNINTERRUPTIBLE : "UN",
+        TF.TASK_ZOMBIE          : "ZO",
+        TF.TASK_STOPPED         : "ST",
+    }
+
+    if hasattr(TF, 'TASK_EXCLUSIVE'):
+        strings[TF.TASK_EXCLUSIVE] = "EX"
+    if hasattr(TF, 'TASK_SWAPPING'):
+        strings[TF.TASK_SWAPPING] = "SW"
+    if hasattr(TF, 'TASK_DEAD'):
+        strings[TF.TASK_DEAD] = "DE"
+    if hasattr(TF, 'TASK_TRACING_STOPPED'):
+        strings[TF.TASK_TRACING_STOPPED] = "TR"
+
+    task_state_strings = strings
+
+def task_state_string(state):
+    """
+    Returns the abbreviation ps uses for a task state, e.g. 'RU'
+
+    Args:
+        state (int): The task state, including the exit state
+
+    Returns:
+        str: The abbreviation, or '??' if the state isn't known
+    """
+    setup_task_state_strings()
+
+    buf = None
+    exclusive = False
+
+    try:
+        exclusive = (state & TF.TASK_EXCLUSIVE) == TF.TASK_EXCLUSIVE
+        state &= ~TF.TASK_EXCLUSIVE
+    except AttributeError:
+        pass
+
+    buf = '??'
+    if hasattr(TF, 'TASK_DEAD'):
+        try:
+            buf = task_state_strings[state & ~TF.TASK_DEAD]
+        except KeyError:
+            pass
+
+        if state & TF.TASK_DEAD and state_maybe_dead(state):
+            buf = task_state_strings[TF.TASK_DEAD]
+
+    if buf is not None and exclusive:
+        buf += "EX"
+
+    return buf
+
 class BadTaskError(TypeError):
     msgtemplate = "task_struct must be gdb.Value describing struct task_struct not {}"
     def __init__(self, task):
@@ -123,6 +215,7 @@ class LinuxTask(object):
 
         self.thread_info = None
         self.stack_pointer = None
+        self.saved_frame = None
         self.thread = None
 
         # mem data
@@ -176,16 +269,7 @@ class LinuxTask(object):
         return state
 
     def maybe_dead(self):
-        state = self.task_state()
-
-        known = TF.TASK_INTERRUPTIBLE
-        known |= TF.TASK_UNINTERRUPTIBLE
-        known |= TF.TASK_ZOMBIE
-        known |= TF.TASK_STOPPED
-
-        if hasattr(TF, 'TASK_SWAPPING'):
-            known |= TF.TASK_SWAPPING
-        return (state & known) == 0
+        return state_maybe_dead(self.task_state())
 
     def task_flags(self):
         return long(self.task_struct['flags'])
@@ -307,3 +391,349 @@ class LinuxTask(object):
             cls.last_run = cls.last_run__timestamp
         else:
             raise RuntimeError("No method to retrieve last run from task found.")
+
+class TaskTable(object):
+    """
+    A snapshot of the task fields used to list, sort, and filter tasks
+
+    Reading these fields through gdb.Value for every task on every ps
+    invocation is slow on systems with tens of thousands of tasks.  A
+    TaskTable decodes them once, with a single read per task_struct and
+    per mm_struct, into one array per field.  Row i of every column
+    describes the same task.
+
+    Args:
+        addrs (list of int): The addresses of the task_structs
+        active (dict, optional, default=None): Maps the address of each task
+            that was running to the CPU it was running on
+
+    Attributes:
+        address, pid, ppid, tgid, state, flags, cpu, rss, total_vm,
+            last_run, mm, stack (array.array): The columns.  state includes the
+            exit state.  rss and total_vm are in pages and are 0 for tasks
+            without an mm or that are exiting.
+        comm (list of str): The command names
+        active (array.array): 1 for tasks that were running
+        kernel (array.array): 1 for kernel threads
+
+    The rows are also indexed by pid, address, tgid, parent pid, and
+    command name, so that tasks can be selected without scanning the
+    table.
+    """
+    def __init__(self, addrs, active=None):
+        if active is None:
+            active = {}
+
+        self.__setup_layouts()
+
+        init_mm = get_value('init_mm')
+        if init_mm is not None:
+            init_mm_addr = long(init_mm.address)
+        else:
+            init_mm_addr = 0
+
+        self.address = array.array('L')
+        self.pid = array.array('l')
+        self.ppid = array.array('l')
+        self.tgid = array.array('l')
+        self.state = array.array('l')
+        self.flags = array.array('L')
+        self.cpu = array.array('l')
+        self.rss = array.array('L')
+        self.total_vm = array.array('L')
+        self.last_run = array.array('L')
+        self.mm = array.array('L')
+        self.stack = array.array('L')
+        self.active = array.array('b')
+        self.kernel = array.array('b')
+        self.comm = []
+
+        parents = []
+        mm_usage = {}
+        for addr in addrs:
+            try:
+                rec = self.task_layout.read(addr)
+            except gdb.error as e:
+                print("Failed to read task @{:#x}: {}".format(addr, str(e)))
+                continue
+
+            state = rec.state
+            if self.has_exit_state:
+                state |= rec.exit_state
+            exiting = ((state & TF.TASK_ZOMBIE) != 0 or
+                       (rec.flags & PF_EXITING) != 0)
+
+            if addr in active:
+                cpu = active[addr]
+            else:
+                cpu = self.__last_cpu(rec)
+
+            (rss, total_vm) = (0, 0)
+            if rec.mm != 0 and not exiting:
+                try:
+                    (rss, total_vm) = mm_usage[rec.mm]
+                except KeyError:
+                    (rss, total_vm) = self.__mm_usage(rec.mm)
+                    mm_usage[rec.mm] = (rss, total_vm)
+
+            if rec.pid == 0:
+                kernel = 1
+            elif exiting:
+                kernel = 0
+            else:
+                kernel = int(rec.mm == 0 or rec.mm == init_mm_addr)
+
+            self.address.append(addr)
+            self.pid.append(rec.pid)
+            self.tgid.append(rec.tgid)
+            self.state.append(state)
+            self.flags.append(rec.flags)
+            self.cpu.append(cpu)
+            self.rss.append(rss)
+            self.total_vm.append(total_vm)
+            self.last_run.append(rec.last_run)
+            self.mm.append(rec.mm)
+            self.stack.append(rec.stack)
+            self.active.append(int(addr in active))
+            self.kernel.append(kernel)
+            self.comm.append(rec.comm)
+            parents.append(rec.parent)
+
+        # Parents are nearly always in the table themselves
+        pids = dict(zip(self.address, self.pid))
+        for parent in parents:
+            try:
+                ppid = pids[parent]
+            except KeyError:
+                try:
+                    ppid = read_unsigned(parent + self.pid_offset,
+                                         self.pid_size)
+                except gdb.error:
+                    ppid = -1
+            self.ppid.append(ppid)
+
+        self.__build_indexes()
+
+    def __setup_layouts(self):
+        task_struct_type = gdb.lookup_type('struct task_struct')
+        fields = task_struct_type.keys()
+
+        members = [ 'pid', 'tgid', 'flags', 'comm', 'mm', 'parent', 'stack' ]
+        names = list(members)
+
+        if 'state' in fields:
+            members.append('state')
+        else:
+            members.append('__state')
+        names.append('state')
+
+        self.has_exit_state = 'exit_state' in fields
+        if self.has_exit_state:
+            members.append('exit_state')
+            names.append('exit_state')
+
+        self.thread_info_layout = None
+        if 'cpu' in fields:
+            members.append('cpu')
+            names.append('cpu')
+        else:
+            self.thread_info_layout = StructLayout('struct thread_info',
+                                                   [ 'cpu' ])
+
+        if ('sched_info' in fields and
+                'last_arrival' in task_struct_type['sched_info'].type.keys()):
+            members.append('sched_info.last_arrival')
+        elif 'last_run' in fields:
+            members.append('last_run')
+        elif 'timestamp' in fields:
+            members.append('timestamp')
+        else:
+            raise RuntimeError("No method to retrieve last run from task found.")
+        names.append('last_run')
+
+        self.task_layout = StructLayout(task_struct_type, members, names)
+        (self.pid_offset, pid_type) = offsetof_type(task_struct_type, 'pid')
+        self.pid_size = pid_type.sizeof
+
+        mm_struct_type = gdb.lookup_type('struct mm_struct')
+        fields = mm_struct_type.keys()
+        members = [ 'total_vm' ]
+        self.rss_array = None
+        if 'rss' in fields:
+            members.append(self.__counter(mm_struct_type, 'rss'))
+        elif '_rss' in fields:
+            members.append(self.__counter(mm_struct_type, '_rss'))
+        elif 'rss_stat' in fields:
+            (offset, count_type) = offsetof_type(mm_struct_type,
+                                                 'rss_stat.count')
+            size = count_type.target().sizeof
+            if size not in (4, 8):
+                raise RuntimeError("No method to retrieve RSS from task found.")
+            prefix = '<'
+            if RawMemory.byte_order == 'big':
+                prefix = '>'
+            self.rss_array = struct.Struct("{}{}{}".format(prefix,
+                                            count_type.sizeof // size,
+                                            { 4 : 'i', 8 : 'q' }[size]))
+            members.append('rss_stat.count')
+        elif '_anon_rss' in fields or '_file_rss' in fields:
+            for name in [ '_anon_rss', '_file_rss' ]:
+                if name in fields:
+                    members.append(self.__counter(mm_struct_type, name))
+        else:
+            raise RuntimeError("No method to retrieve RSS from task found.")
+
+        self.rss_names = [ spec.replace('.', '_') for spec in members[1:] ]
+        self.mm_layout = StructLayout(mm_struct_type, members)
+
+    def __build_indexes(self):
+        self.pid_rows = {}
+        self.address_rows = {}
+        self.tgid_rows = {}
+        self.ppid_rows = {}
+        self.comm_rows = {}
+        for row in range(len(self.address)):
+            self.pid_rows[self.pid[row]] = row
+            self.address_rows[self.address[row]] = row
+            self.tgid_rows.setdefault(self.tgid[row], []).append(row)
+            self.ppid_rows.setdefault(self.ppid[row], []).append(row)
+            self.comm_rows.setdefault(self.comm[row], []).append(row)
+
+    @staticmethod
+    def __counter(gdbtype, name):
+        if gdbtype[name].type.strip_typedefs().code == gdb.TYPE_CODE_STRUCT:
+            return name + '.counter'
+        return name
+
+    def __last_cpu(self, rec):
+        if self.thread_info_layout is None:
+            return rec.cpu
+        try:
+            return self.thread_info_layout.read(rec.stack).cpu
+        except gdb.error:
+            return -1
+
+    def __mm_usage(self, mm):
+        try:
+            rec = self.mm_layout.read(mm)
+        except gdb.error:
+            return (0, 0)
+
+        if self.rss_array is not None:
+            rss = sum(self.rss_array.unpack(rec.rss_stat_count))
+        else:
+            rss = sum([ getattr(rec, name) for name in self.rss_names ])
+        return (max(rss, 0), rec.total_vm)
+
+    def __len__(self):
+        return len(self.address)
+
+    def order(self, column, reverse=False):
+        """
+        Returns the rows sorted by the values in a column
+
+        Args:
+            column (str): The name of the column to sort by
+            reverse (bool, optional, default=False): Whether to sort in
+                descending order
+
+        Returns:
+            list of int: The row numbers in sorted order
+        """
+        values = getattr(self, column)
+        return sorted(range(len(self.address)), key=values.__getitem__,
+                      reverse=reverse)
+
+    def maybe_dead(self, row):
+        """
+        Returns whether the task in a row may be dead
+
+        Args:
+            row (int): The row number
+
+        Returns:
+            bool: Whether the task may be dead
+        """
+        return state_maybe_dead(self.state[row])
+
+    def row_of_pid(self, pid):
+        """
+        Returns the row describing the task with a pid
+
+        Args:
+            pid (int): The pid
+
+        Returns:
+            int: The row number, or None if there is no such task
+        """
+        return self.pid_rows.get(pid)
+
+    def row_of_address(self, addr):
+        """
+        Returns the row describing the task_struct at an address
+
+        Args:
+            addr (int): The address of the task_struct
+
+        Returns:
+            int: The row number, or None if there is no such task
+        """
+        return self.address_rows.get(addr)
+
+    def thread_group(self, tgid):
+        """
+        Returns the rows describing the threads in a thread group
+
+        Args:
+            tgid (int): The thread group id, the pid of the group leader
+
+        Returns:
+            list of int: The row numbers
+        """
+        return list(self.tgid_rows.get(tgid, []))
+
+    def children(self, pid):
+        """
+        Returns the rows describing the children of a task
+
+        Args:
+            pid (int): The pid of the parent
+
+        Returns:
+            list of int: The row numbers
+        """
+        return list(self.ppid_rows.get(pid, []))
+
+    def rows_with_comm(self, comm):
+        """
+        Returns the rows describing the tasks with a command name
+
+        Args:
+            comm (str): The command name
+
+        Returns:
+            list of int: The row numbers
+        """
+        return list(self.comm_rows.get(comm, []))
+
+    def search_comm(self, pattern):
+        """
+        Returns the rows describing the tasks whose command names match a
+        regular expression
+
+        Each distinct command name is only matched once.
+
+        Args:
+            pattern (str or compiled regular expression): The regular
+                expression, matched with search
+
+        Returns:
+            list of int: The row numbers, in ascending order
+        """
+        if not hasattr(pattern, 'search'):
+            pattern = re.compile(pattern)
+        rows = []
+        for (comm, comm_rows) in self.comm_rows.items():
+            if pattern.search(comm):
+                rows += comm_rows
+        return sorted(rows)
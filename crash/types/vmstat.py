@@ -5,7 +5,7 @@ import gdb
 from crash.infra import CrashBaseClass, export
 from crash.util import container_of, find_member_variant
 import crash.types.node
-from crash.types.percpu import get_percpu_var
+from crash.types.percpu import sum_percpu_array
 from cpu import for_each_online_cpu
 
 class VmStat(CrashBaseClass):
@@ -62,12 +62,7 @@ class VmStat(CrashBaseClass):
     def get_events():
         states_sym = gdb.lookup_global_symbol("vm_event_states")
         nr = VmStat.nr_event_items
-        events = [0L] * nr
 
-        for cpu in for_each_online_cpu():
-            states = get_percpu_var(states_sym, cpu)
-            for item in range(0, nr):
-                events[item] += long(states["event"][item])
-
-        return events
+        events = sum_percpu_array(states_sym, "event", for_each_online_cpu())
+        return events[:nr]
 
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import gdb
+import sys
+from crash.util import resolve_type, offsetof, offsetof_type
+from crash.infra import CrashBaseClass, export
+from crash.memory import read_ulong, read_u8, read_ulong_array
+from crash.exceptions import CorruptedError
+
+if sys.version_info.major >= 3:
+    long = int
+
+# Entries with the low two bits set to 2 are internal to the xarray:
+# pointers to child nodes, sibling entries, and retry/zero entries.
+# Only node pointers are above XA_NODE_MIN.
+XA_INTERNAL_MASK = 3
+XA_INTERNAL = 2
+XA_NODE_MIN = 4096
+
+class XArrayCorruptedError(CorruptedError):
+    pass
+
+class TypesXArrayClass(CrashBaseClass):
+    __types__ = [ 'struct xarray', 'struct xa_node' ]
+
+    chunk_size = None
+    slots_offset = None
+    shift_offset = None
+
+    def __xarray_address(self, xa):
+        if isinstance(xa, gdb.Symbol):
+            xa = xa.value()
+        if isinstance(xa, (int, long)):
+            return long(xa)
+        if not isinstance(xa, gdb.Value):
+            raise TypeError("xa must be gdb.Value representing 'struct xarray' or a 'struct xarray *' not {}"
+                            .format(type(xa).__name__))
+        if xa.type == self.xarray_type.pointer():
+            return long(xa)
+        elif xa.type == self.xarray_type:
+            return long(xa.address)
+        raise TypeError("Must be struct xarray not {}".format(str(xa.type)))
+
+    @export
+    @staticmethod
+    def xa_is_value(entry):
+        """
+        Returns whether an entry is a value entry rather than a pointer
+
+        Value entries are used e.g. for shadow and swap entries in the page
+        cache.
+
+        Args:
+            entry (int): The entry
+
+        Returns:
+            bool: Whether the entry is a value entry
+        """
+        return (entry & 1) == 1
+
+    @export
+    @staticmethod
+    def xa_to_value(entry):
+        """
+        Returns the integer stored in a value entry
+
+        Args:
+            entry (int): The value entry
+
+        Returns:
+            int: The stored value
+        """
+        return entry >> 1
+
+    def __walk(self, xa, node, base, first, last, depth):
+        if depth > 16:
+            raise XArrayCorruptedError("xarray {:#x} is too deep at node {:#x}"
+                                       .format(xa, node))
+        shift = read_u8(node + self.shift_offset)
+        slots = read_ulong_array(node + self.slots_offset, self.chunk_size)
+
+        for (i, entry) in enumerate(slots):
+            index = base + (i << shift)
+            if last is not None and index > last:
+                return
+            if index + (1 << shift) - 1 < first:
+                continue
+            if entry == 0:
+                continue
+            if (entry & XA_INTERNAL_MASK) == XA_INTERNAL:
+                if entry < XA_NODE_MIN:
+                    # sibling, retry, or zero entry
+                    continue
+                if shift == 0:
+                    raise XArrayCorruptedError("node pointer {:#x} in leaf node {:#x}"
+                                               .format(entry, node))
+                for item in self.__walk(xa, entry - XA_INTERNAL, index,
+                                        first, last, depth + 1):
+                    yield item
+            else:
+                yield (index, entry)
+
+    def __setup_node_layout(self):
+        (offset, slots_type) = offsetof_type(self.xa_node_type, 'slots')
+        self.slots_offset = offset
+        self.chunk_size = slots_type.sizeof // slots_type.target().sizeof
+        self.shift_offset = offsetof(self.xa_node_type, 'shift')
+
+    @export
+    def xarray_for_each_raw(self, xa, first=0, last=None):
+        """
+        Iterates over the present entries of an xarray in index order
+
+        Only the nodes that may contain indices within [first, last] are
+        read, and each node's slots are read with a single read.
+
+        Args:
+            xa (gdb.Value, gdb.Symbol, or int): The struct xarray or pointer
+                to it, or its address
+            first (int, optional, default=0): The first index to include
+            last (int, optional, default=None): The last index to include.
+                If None, iterate to the end.
+
+        Yields:
+            (int, int): The index and the raw entry.  The entry is either
+                a pointer or a value entry; see xa_is_value.
+
+        Raises:
+            XArrayCorruptedError: The xarray is corrupted
+            BufferError: A node could not be read
+        """
+        addr = self.__xarray_address(xa)
+        try:
+            head = read_ulong(addr + offsetof(self.xarray_type, 'xa_head'))
+        except gdb.error as e:
+            raise BufferError("Failed to read xarray {:#x}: {}"
+                              .format(addr, str(e)))
+
+        if head == 0:
+            return
+
+        if self.chunk_size is None:
+            self.__setup_node_layout()
+
+        if ((head & XA_INTERNAL_MASK) == XA_INTERNAL and
+                head >= XA_NODE_MIN):
+            try:
+                for item in self.__walk(addr, head - XA_INTERNAL, 0,
+                                        first, last, 0):
+                    yield item
+            except gdb.error as e:
+                raise BufferError("Failed to read node in xarray {:#x}: {}"
+                                  .format(addr, str(e)))
+        elif first == 0 and (head & XA_INTERNAL_MASK) != XA_INTERNAL:
+            # A single entry at index 0 is stored in the head itself
+            yield (0, head)
+
+    @export
+    def xarray_for_each_entry(self, xa, gdbtype, first=0, last=None):
+        """
+        Iterates over the pointer entries of an xarray in index order
+
+        Value entries are skipped.
+
+        Args:
+            xa (gdb.Value, gdb.Symbol, or int): The struct xarray or pointer
+                to it, or its address
+            gdbtype (gdb.Type or str): The type the entries point to
+            first, last: see xarray_for_each_raw
+
+        Yields:
+            (int, gdb.Value<gdbtype>): The index and the entry
+        """
+        gdbtype = resolve_type(gdbtype)
+        pointer_type = gdbtype.pointer()
+        for (index, entry) in xarray_for_each_raw(xa, first, last):
+            if self.xa_is_value(entry):
+                continue
+            yield (index, gdb.Value(entry).cast(pointer_type).dereference())
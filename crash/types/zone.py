@@ -5,7 +5,7 @@ import gdb
 from crash.infra import CrashBaseClass, export
 from crash.util import container_of, find_member_variant, array_for_each
 import crash.types.node
-from crash.types.percpu import get_percpu_var
+from crash.types.percpu import get_percpu_var, sum_percpu_array
 from crash.types.vmstat import VmStat
 from cpu import for_each_online_cpu
 from crash.types.list import list_for_each_entry
@@ -37,11 +37,11 @@ class Zone(CrashBaseClass):
         return stats
 
     def add_vmstat_diffs(self, diffs):
-        for cpu in for_each_online_cpu():
-            pageset = get_percpu_var(self.gdb_obj["pageset"], cpu)
-            vmdiff = pageset["vm_stat_diff"]
-            for item in range (0, VmStat.nr_stat_items):
-                diffs[item] += int(vmdiff[item])
+        sums = sum_percpu_array(self.gdb_obj["pageset"], "vm_stat_diff",
+                                for_each_online_cpu())
+        # No online CPUs means no diffs
+        for (item, diff) in enumerate(sums[:VmStat.nr_stat_items]):
+            diffs[item] += diff
 
     def get_vmstat_diffs(self):
         diffs = [0L] * VmStat.nr_stat_items
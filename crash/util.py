@@ -6,7 +6,9 @@ from __future__ import print_function
 from __future__ import division
 
 import gdb
+from future.utils import string_types
 from crash.infra import CrashBaseClass, export
+from crash.infra.callback import ObjfileEventCallback
 from crash.exceptions import MissingTypeError, MissingSymbolError
 
 class OffsetOfError(Exception):
@@ -69,9 +71,31 @@ class _InvalidComponentNameError(_InvalidComponentBaseError):
         self.member = member
         self.type = gdbtype
 
+class _OffsetCacheFlushCallback(ObjfileEventCallback):
+    """
+    Flushes the offsetof cache whenever a new objfile is loaded
+
+    A newly loaded objfile may provide a different definition for a type
+    name we've already resolved, so the cached offsets can't be trusted
+    anymore.
+    """
+    def check_ready(self):
+        return True
+
+    def callback(self, result):
+        TypesUtilClass.flush_offsetof_cache()
+        # Stay connected for future objfile loads
+        return False
+
 class TypesUtilClass(CrashBaseClass):
     __types__ = [ 'char *' ]
 
+    offset_cache = {}
+    type_offset_cache = {}
+    offset_cache_hits = 0
+    offset_cache_misses = 0
+    lookup_fallbacks = []
+
     @export
     def container_of(self, val, gdbtype, member):
         """
@@ -101,11 +125,49 @@ class TypesUtilClass(CrashBaseClass):
         return (val.cast(charp) - offset).cast(gdbtype.pointer()).dereference()
 
     @export
+    @classmethod
+    def add_lookup_fallback(cls, callback):
+        """
+        Registers a callback to retry failed symbol and type lookups
+
+        When get_symbol_value or resolve_type can't find a name, the
+        callbacks are called in turn until one returns True to say it made
+        new symbols available, and the lookup is retried.  Modules that are
+        loaded on demand use this to be loaded when one of their symbols
+        or types is needed.  The safe_* variants, which are used to probe
+        for optional symbols and types, don't call the callbacks.
+
+        Args:
+            callback (function): Called without arguments.  Returns
+                whether anything new was loaded.
+        """
+        cls.lookup_fallbacks.append(callback)
+
+    @classmethod
+    def __lookup_fallback(cls):
+        for callback in cls.lookup_fallbacks:
+            if callback():
+                return True
+        return False
+
     @staticmethod
-    def get_symbol_value(symname, block=None, domain=None):
+    def __lookup_symbol_value(symname, block, domain):
+        if domain is None:
+            domain = gdb.SYMBOL_VAR_DOMAIN
+        sym = gdb.lookup_symbol(symname, block, domain)[0]
+        if sym:
+            return sym.value()
+        return None
+
+    @export
+    @classmethod
+    def get_symbol_value(cls, symname, block=None, domain=None):
         """
         Returns the value associated with a named symbol
 
+        If the symbol can't be found, the lookup fallbacks are given a
+        chance to load it; see add_lookup_fallback.
+
         Args:
             symname (str): Name of the symbol to resolve
             block (gdb.Block, optional, default=None): The block to resolve
@@ -117,11 +179,12 @@ class TypesUtilClass(CrashBaseClass):
         Raises:
             MissingSymbolError: The symbol or value cannot be located
         """
-        if domain is None:
-            domain = gdb.SYMBOL_VAR_DOMAIN
-        sym = gdb.lookup_symbol(symname, block, domain)[0]
-        if sym:
-            return sym.value()
+        while True:
+            val = cls.__lookup_symbol_value(symname, block, domain)
+            if val is not None:
+                return val
+            if block is not None or not cls.__lookup_fallback():
+                break
         raise MissingSymbolError("Cannot locate symbol {}".format(symname))
 
     @export
@@ -141,17 +204,17 @@ class TypesUtilClass(CrashBaseClass):
             None: if the symbol or value cannot be found
 
         """
-        try:
-            return cls.get_symbol_value(symname, block, domain)
-        except MissingSymbolError:
-            return None
+        return cls.__lookup_symbol_value(symname, block, domain)
 
     @export
-    @staticmethod
-    def resolve_type(val):
+    @classmethod
+    def resolve_type(cls, val):
         """
         Resolves a gdb.Type given a type, value, string, or symbol
 
+        If a type named by a string can't be found, the lookup fallbacks
+        are given a chance to load it; see add_lookup_fallback.
+
         Args:
             val (gdb.Type, gdb.Value, str, gdb.Symbol): The object for which
                 to resolve the type
@@ -166,12 +229,15 @@ class TypesUtilClass(CrashBaseClass):
             gdbtype = val
         elif isinstance(val, gdb.Value):
             gdbtype = val.type
-        elif isinstance(val, str):
-            try:
-                gdbtype = gdb.lookup_type(val)
-            except gdb.error:
-                raise MissingTypeError("Could not resolve type {}"
-                                       .format(val))
+        elif isinstance(val, string_types):
+            while True:
+                try:
+                    gdbtype = gdb.lookup_type(val)
+                    break
+                except gdb.error:
+                    if not cls.__lookup_fallback():
+                        raise MissingTypeError("Could not resolve type {}"
+                                               .format(val))
         elif isinstance(val, gdb.Symbol):
             gdbtype = val.value().type
         else:
@@ -219,6 +285,8 @@ class TypesUtilClass(CrashBaseClass):
         """
         Returns the offset and type of a named member of a structure
 
+        Successful lookups are cached until the next objfile is loaded.
+
         Args:
             val (gdb.Type, gdb.Symbol, gdb.Value, or str): The type that
                 contains the specified member, must be a struct or union
@@ -235,6 +303,17 @@ class TypesUtilClass(CrashBaseClass):
             InvalidArgumentError: val is not a valid type
             InvalidComponentError: spec is not valid for the type
         """
+        # Types named by string can be found without asking gdb at all
+        namekey = None
+        if isinstance(val, string_types):
+            namekey = (val, spec)
+            try:
+                res = cls.offset_cache[namekey]
+                cls.offset_cache_hits += 1
+                return res
+            except KeyError:
+                pass
+
         gdbtype = None
         try:
             gdbtype = resolve_type(val)
@@ -254,14 +333,40 @@ class TypesUtilClass(CrashBaseClass):
            gdbtype.code != gdb.TYPE_CODE_UNION:
             raise InvalidArgumentTypeError(gdbtype)
 
+        # gdb.Type isn't hashable and a new object is returned for every
+        # lookup, so entries are filed under the tag and matched against
+        # the type itself.  Different objfiles may define the same tag
+        # differently.  Anonymous types can't be cached.
+        typekey = None
+        objfile = getattr(gdbtype, 'objfile', None)
+        if gdbtype.tag is not None:
+            typekey = (gdbtype.code, gdbtype.tag, spec)
+            for (cached, cached_objfile, res) in \
+                    cls.type_offset_cache.get(typekey, []):
+                if cached_objfile == objfile and cached == gdbtype:
+                    cls.offset_cache_hits += 1
+                    if namekey is not None:
+                        cls.offset_cache[namekey] = res
+                    return res
+
+        cls.offset_cache_misses += 1
         try:
-            return cls.__offsetof(gdbtype, spec, error)
+            res = cls.__offsetof(gdbtype, spec, error)
         except _InvalidComponentBaseError as e:
             if error:
                 raise InvalidComponentError(gdbtype, spec, e.message)
             else:
                 return None
 
+        # Failed lookups aren't cached so that they raise every time
+        if res is not None:
+            if typekey is not None:
+                entries = cls.type_offset_cache.setdefault(typekey, [])
+                entries.append((gdbtype, objfile, res))
+            if namekey is not None:
+                cls.offset_cache[namekey] = res
+        return res
+
     @export
     @classmethod
     def offsetof(cls, val, spec, error=True):
@@ -288,6 +393,36 @@ class TypesUtilClass(CrashBaseClass):
             return res[0]
         return None
 
+    @export
+    @classmethod
+    def flush_offsetof_cache(cls):
+        """
+        Discards all cached member offsets
+
+        This is done automatically when a new objfile is loaded.
+        """
+        cls.offset_cache.clear()
+        cls.type_offset_cache.clear()
+
+    @export
+    @classmethod
+    def offsetof_cache_stats(cls):
+        """
+        Returns statistics for the member offset cache
+
+        Returns:
+            dict: The number of cached entries ('entries') and the number
+                of lookups that were answered from the cache ('hits') or
+                had to resolve the member ('misses')
+        """
+        return {
+            'entries' : len(cls.offset_cache) +
+                        sum([ len(entries) for entries
+                              in cls.type_offset_cache.values() ]),
+            'hits' : cls.offset_cache_hits,
+            'misses' : cls.offset_cache_misses,
+        }
+
     @export
     @classmethod
     def find_member_variant(cls, gdbtype, variants):
@@ -381,3 +516,4 @@ class TypesUtilClass(CrashBaseClass):
         for i in range(array_size(value)):
             yield value[i]
 
+_OffsetCacheFlushCallback()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import sys
+import os
+import json
+import time
+import errno
+import shutil
+import tempfile
+import importlib
+import traceback
+import subprocess
+import multiprocessing
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# The gdb executables to run workers with, in order of preference
+GDB_EXECUTABLES = [ 'crash-python-gdb', 'gdb' ]
+
+# Lines of a worker's log to include when it didn't finish an item
+LOG_TAIL_LINES = 20
+
+WORKER_SCRIPT = """
+import sys
+sys.path[:0] = {path!r}
+import crash.workers
+crash.workers.worker_main({jobdir!r}, {worker!r})
+"""
+
+class WorkerResult(object):
+    """
+    The outcome of one work item
+
+    Attributes:
+        item (str): The work item
+        output (str): What was printed while processing the item
+        error (str): The traceback if processing failed, or None
+        seconds (float): How long processing the item took
+        value: What the function returned, or None
+        worker (int): The worker that processed the item, or None if no
+            worker finished it
+    """
+    __slots__ = [ 'item', 'output', 'error', 'seconds', 'value', 'worker' ]
+
+    def __init__(self, item, output="", error=None, seconds=0.0, value=None,
+                 worker=None):
+        self.item = item
+        self.output = output
+        self.error = error
+        self.seconds = seconds
+        self.value = value
+        self.worker = worker
+
+class DumpWorkerPool(object):
+    """
+    Processes work items in separate gdb processes
+
+    Python code running in gdb can only use one CPU.  Work that splits
+    into independent items, like checking each kmem cache, can instead
+    be spread across worker processes.  Each worker is a gdb instance
+    running crash-python in batch mode that opens the same kernel and
+    vmcore read-only, with modules and tasks loaded lazily to keep
+    startup short.
+
+    Workers claim the next unclaimed item in order each time they finish
+    one, so a few large items don't hold up the rest.  Claims and results
+    are exchanged through files in a temporary job directory.
+
+    Args:
+        workers (int, optional, default=None): The number of workers.
+            Defaults to the number of CPUs.
+        gdb_path (str, optional, default=None): The gdb executable to run.
+            Defaults to the first of GDB_EXECUTABLES in PATH.
+
+    Raises:
+        RuntimeError: No gdb executable could be found
+    """
+    def __init__(self, workers=None, gdb_path=None):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = max(workers, 1)
+
+        if gdb_path is None:
+            for name in GDB_EXECUTABLES:
+                gdb_path = which(name)
+                if gdb_path is not None:
+                    break
+        if gdb_path is None:
+            raise RuntimeError("No gdb executable found for the workers")
+        self.gdb_path = gdb_path
+
+    def __start(self, jobdir, worker):
+        script = os.path.join(jobdir, "worker-{}.py".format(worker))
+        with open(script, 'w') as f:
+            f.write(WORKER_SCRIPT.format(path=list(sys.path), jobdir=jobdir,
+                                         worker=worker))
+        # The log keeps what the session prints while starting up
+        log = open(os.path.join(jobdir, "worker-{}.log".format(worker)), 'w')
+        null = open(os.devnull)
+        try:
+            return subprocess.Popen([ self.gdb_path, '-nh', '-q', '-batch',
+                                      '-x', script ],
+                                    stdin=null, stdout=log,
+                                    stderr=subprocess.STDOUT)
+        finally:
+            null.close()
+            log.close()
+
+    def run(self, function, items):
+        """
+        Processes a list of work items
+
+        Args:
+            function (str): The function to call with each item, as
+                'module:function'.  It is called in the workers and what it
+                returns must be serializable to JSON.
+            items (list of str): The work items
+
+        Returns:
+            list of WorkerResult: The result of each item, in the order of
+                the items.  The error of an item that no worker finished
+                gives the exit status and the end of the log of the
+                worker that claimed it, or of every worker if none did.
+        """
+        # Imported here so that the rest of this module can be used
+        # without a session
+        from crash.kernel import dump_files
+
+        items = list(items)
+        (vmlinux, vmcore, searchpath) = dump_files()
+
+        jobdir = tempfile.mkdtemp(prefix="crash-workers.")
+        procs = []
+        try:
+            with open(os.path.join(jobdir, "job.json"), 'w') as f:
+                json.dump({ 'function' : function, 'items' : items,
+                            'vmlinux' : vmlinux, 'vmcore' : vmcore,
+                            'searchpath' : searchpath }, f)
+
+            nr_workers = min(self.workers, len(items))
+            for worker in range(nr_workers):
+                procs.append(self.__start(jobdir, worker))
+            exit_codes = [ proc.wait() for proc in procs ]
+
+            return _results(jobdir, items, exit_codes)
+        finally:
+            # Don't leave workers behind if we were interrupted
+            for proc in procs:
+                if proc.poll() is None:
+                    proc.terminate()
+                    proc.wait()
+            shutil.rmtree(jobdir, ignore_errors=True)
+
+def _claim(jobdir, index, worker):
+    path = os.path.join(jobdir, "claim-{}".format(index))
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            return False
+        raise
+    # Record the claimant in case it never finishes the item
+    try:
+        os.write(fd, str(worker).encode('ascii'))
+    finally:
+        os.close(fd)
+    return True
+
+def _claimant(jobdir, index):
+    try:
+        with open(os.path.join(jobdir, "claim-{}".format(index))) as f:
+            return int(f.read())
+    except (IOError, ValueError):
+        return None
+
+def _log_tail(jobdir, worker):
+    try:
+        with open(os.path.join(jobdir, "worker-{}.log".format(worker))) as f:
+            lines = f.readlines()
+    except IOError:
+        lines = []
+    return "".join(lines[-LOG_TAIL_LINES:])
+
+def _results(jobdir, items, exit_codes):
+    workers = {}
+    for (worker, code) in enumerate(exit_codes):
+        workers[worker] = ("Worker {} exited with status {}:\n{}"
+                           .format(worker, code, _log_tail(jobdir, worker)))
+
+    results = []
+    for (index, item) in enumerate(items):
+        try:
+            with open(os.path.join(jobdir, "result-{}".format(index))) as f:
+                res = json.load(f)
+        except (IOError, ValueError):
+            worker = _claimant(jobdir, index)
+            if worker in workers:
+                error = ("Worker {} didn't finish this item\n{}"
+                         .format(worker, workers[worker]))
+            else:
+                error = ("No worker claimed this item\n{}"
+                         .format("".join([ workers[w]
+                                           for w in sorted(workers) ])))
+            results.append(WorkerResult(item, error=error))
+            continue
+        results.append(WorkerResult(item, res['output'], res['error'],
+                                    res['seconds'], res['value'],
+                                    res['worker']))
+    return results
+
+def _process(func, item):
+    output = StringIO()
+    (value, error) = (None, None)
+    stdout = sys.stdout
+    sys.stdout = output
+    start = time.time()
+    try:
+        value = func(item)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        seconds = time.time() - start
+        sys.stdout = stdout
+    return (output.getvalue(), error, seconds, value)
+
+def worker_main(jobdir, worker):
+    """
+    The entry point of a worker process started by DumpWorkerPool
+
+    Args:
+        jobdir (str): The job directory
+        worker (int): The number of this worker
+    """
+    import crash.session
+
+    with open(os.path.join(jobdir, "job.json")) as f:
+        job = json.load(f)
+
+    crash.session.Session(job['vmlinux'], job['vmcore'], job['vmlinux'],
+                          job['searchpath'], lazy_modules=True,
+                          lazy_tasks=True)
+
+    (modname, funcname) = job['function'].split(':')
+    func = getattr(importlib.import_module(modname), funcname)
+
+    for (index, item) in enumerate(job['items']):
+        if not _claim(jobdir, index, worker):
+            continue
+        (output, error, seconds, value) = _process(func, item)
+
+        path = os.path.join(jobdir, "result-{}".format(index))
+        with open(path + ".tmp", 'w') as f:
+            json.dump({ 'output' : output, 'error' : error,
+                        'seconds' : seconds, 'value' : value,
+                        'worker' : worker }, f)
+        os.rename(path + ".tmp", path)
@@ -34,6 +34,12 @@ struct test_struct {
 	void *ptr;
 };
 
+struct test_array_struct {
+	int count;
+	signed char diffs[4];
+	unsigned long events[3];
+};
+
 unsigned long __per_cpu_offset[NR_CPUS];
 
 DEFINE_PER_CPU(struct test_struct, struct_test);
@@ -41,6 +47,7 @@ DEFINE_PER_CPU(unsigned long, ulong_test);
 DEFINE_PER_CPU(void *, voidp_test);
 DEFINE_PER_CPU(struct test_struct *, ptr_to_struct_test);
 DEFINE_PER_CPU(unsigned long *, ptr_to_ulong_test);
+DEFINE_PER_CPU(struct test_array_struct, array_test);
 
 extern unsigned long __per_cpu_start;
 extern unsigned long __per_cpu_end;
@@ -52,13 +59,14 @@ struct test_struct *non_percpu_test;
 int
 main(void)
 {
-	int i;
+	int i, j;
 	unsigned long size = (void *)&__per_cpu_end - (void *)&__per_cpu_start;
 
 	for (i = 0; i < NR_CPUS; i++)
 	{
 		int ret;
 		struct test_struct *f;
+		struct test_array_struct *a;
 		void *ptr;
 		unsigned long *l;
 
@@ -77,6 +85,13 @@ main(void)
 		raw_cpu_write(&voidp_test, i, (void *)0xdeadbeef);
 		raw_cpu_write(&ptr_to_struct_test, i, f);
 		raw_cpu_write(&ptr_to_ulong_test, i, &f->ulong);
+
+		a = per_cpu_ptr(&array_test, i);
+		a->count = i;
+		for (j = 0; j < 4; j++)
+			a->diffs[j] = -j;
+		for (j = 0; j < 3; j++)
+			a->events[j] = i + j;
 	}
 
 	percpu_test = &struct_test;
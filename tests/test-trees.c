@@ -0,0 +1,236 @@
+#include <stdio.h>
+
+struct hlist_node {
+	struct hlist_node *next;
+	struct hlist_node **pprev;
+};
+
+struct hlist_head {
+	struct hlist_node *first;
+};
+
+extern struct hlist_head normal_hlist;
+extern struct hlist_head cycle_hlist;
+
+struct hlist_node short_hlist[] = {
+	{
+		.next = &short_hlist[1],
+		.pprev = &normal_hlist.first,
+	},
+	{
+		.next = &short_hlist[2],
+		.pprev = &short_hlist[0].next,
+	},
+	{
+		.next = NULL,
+		.pprev = &short_hlist[1].next,
+	},
+};
+
+struct hlist_head normal_hlist = {
+	.first = &short_hlist[0],
+};
+
+struct hlist_head empty_hlist = {
+	.first = NULL,
+};
+
+struct hlist_node short_hlist_with_cycle[] = {
+	{
+		.next = &short_hlist_with_cycle[1],
+		.pprev = &cycle_hlist.first,
+	},
+	{
+		.next = &short_hlist_with_cycle[2],
+		.pprev = &short_hlist_with_cycle[0].next,
+	},
+	{
+		.next = &short_hlist_with_cycle[1],
+		.pprev = &short_hlist_with_cycle[1].next,
+	},
+};
+
+struct hlist_head cycle_hlist = {
+	.first = &short_hlist_with_cycle[0],
+};
+
+struct rb_node {
+	unsigned long __rb_parent_color;
+	struct rb_node *rb_right;
+	struct rb_node *rb_left;
+};
+
+struct rb_root {
+	struct rb_node *rb_node;
+};
+
+struct keyed_node {
+	unsigned long key;
+	struct rb_node node;
+};
+
+/*
+ *          40
+ *        /    \
+ *      20      60
+ *     /  \    /  \
+ *   10   30  50   70
+ */
+struct keyed_node tree_nodes[] = {
+	{ .key = 10, },
+	{ .key = 20, .node = { .rb_left = &tree_nodes[0].node,
+			       .rb_right = &tree_nodes[2].node, }, },
+	{ .key = 30, },
+	{ .key = 40, .node = { .rb_left = &tree_nodes[1].node,
+			       .rb_right = &tree_nodes[5].node, }, },
+	{ .key = 50, },
+	{ .key = 60, .node = { .rb_left = &tree_nodes[4].node,
+			       .rb_right = &tree_nodes[6].node, }, },
+	{ .key = 70, },
+};
+
+struct rb_root keyed_tree = {
+	.rb_node = &tree_nodes[3].node,
+};
+
+struct rb_root empty_tree = {
+	.rb_node = NULL,
+};
+
+/* Its right link leads back to itself */
+struct keyed_node self_loop_node = {
+	.key = 1,
+	.node = { .rb_right = &self_loop_node.node, },
+};
+
+struct rb_root self_loop_tree = {
+	.rb_node = &self_loop_node.node,
+};
+
+unsigned long tree_items[4] = { 0xdead0000, 0xdead0001, 0xdead0002,
+				0xdead0003 };
+
+/* Small nodes: 4 slots, so each level covers 2 bits of the index */
+#define TEST_CHUNK_SIZE 4
+
+struct xarray {
+	unsigned int xa_lock;
+	unsigned int xa_flags;
+	void *xa_head;
+};
+
+struct xa_node {
+	unsigned char shift;
+	unsigned char offset;
+	unsigned char count;
+	unsigned char nr_values;
+	struct xa_node *parent;
+	struct xarray *array;
+	void *slots[TEST_CHUNK_SIZE];
+};
+
+/* xa_mk_node() and xa_mk_value() */
+#define XA_NODE(node) ((void *)((char *)(node) + 2))
+#define XA_VALUE(v) ((void *)(((unsigned long)(v) << 1) | 1))
+
+extern struct xarray test_xarray;
+extern struct xa_node xa_root_node;
+
+/*
+ * index 0: tree_items[0], index 2: tree_items[1],
+ * index 8: value 7, index 13: tree_items[2]
+ */
+struct xa_node xa_leaf_nodes[] = {
+	{
+		.shift = 0,
+		.offset = 0,
+		.parent = &xa_root_node,
+		.array = &test_xarray,
+		.slots = { &tree_items[0], NULL, &tree_items[1], NULL },
+	},
+	{
+		.shift = 0,
+		.offset = 3,
+		.parent = &xa_root_node,
+		.array = &test_xarray,
+		.slots = { NULL, &tree_items[2], NULL, NULL },
+	},
+};
+
+struct xa_node xa_root_node = {
+	.shift = 2,
+	.array = &test_xarray,
+	.slots = { XA_NODE(&xa_leaf_nodes[0]), NULL, XA_VALUE(7),
+		   XA_NODE(&xa_leaf_nodes[1]) },
+};
+
+struct xarray test_xarray = {
+	.xa_head = XA_NODE(&xa_root_node),
+};
+
+struct xarray single_xarray = {
+	.xa_head = &tree_items[3],
+};
+
+struct xarray empty_xarray = {
+	.xa_head = NULL,
+};
+
+struct radix_tree_node {
+	unsigned char shift;
+	unsigned char offset;
+	unsigned char count;
+	unsigned char exceptional;
+	struct radix_tree_node *parent;
+	void *slots[TEST_CHUNK_SIZE];
+};
+
+struct radix_tree_root {
+	unsigned int gfp_mask;
+	struct radix_tree_node *rnode;
+};
+
+/* RADIX_TREE_INTERNAL_NODE and an exceptional entry */
+#define RADIX_NODE(node) ((void *)((char *)(node) + 1))
+#define RADIX_EXCEPTIONAL(v) ((void *)(((unsigned long)(v) << 2) | 2))
+
+extern struct radix_tree_node radix_root_node;
+
+/*
+ * index 1: tree_items[0], index 3: tree_items[1],
+ * index 4: exceptional 5, index 12: tree_items[3]
+ */
+struct radix_tree_node radix_leaf_node = {
+	.shift = 0,
+	.offset = 0,
+	.parent = &radix_root_node,
+	.slots = { NULL, &tree_items[0], NULL, &tree_items[1] },
+};
+
+struct radix_tree_node radix_root_node = {
+	.shift = 2,
+	.slots = { RADIX_NODE(&radix_leaf_node), RADIX_EXCEPTIONAL(5), NULL,
+		   &tree_items[3] },
+};
+
+struct radix_tree_root test_radix_tree = {
+	.rnode = RADIX_NODE(&radix_root_node),
+};
+
+struct radix_tree_root single_radix_tree = {
+	.rnode = (struct radix_tree_node *)&tree_items[2],
+};
+
+struct radix_tree_root empty_radix_tree = {
+	.rnode = NULL,
+};
+
+int
+main(void)
+{
+	printf("normal_hlist = %p\n", &normal_hlist);
+	printf("keyed_tree = %p\n", &keyed_tree);
+	printf("test_xarray = %p\n", &test_xarray);
+	printf("test_radix_tree = %p\n", &test_radix_tree);
+	return 0;
+}
@@ -60,6 +60,18 @@ union {
 	void *member2;
 } global_union_symbol;
 
+struct char_arrays {
+	char name[8];
+	signed char diffs[4];
+	unsigned char bytes[4];
+};
+
+struct char_arrays char_arrays_symbol = {
+	.name = "chars",
+	.diffs = { 0, -32, -64, -96 },
+	.bytes = { 1, 2, 0, 4 },
+};
+
 static int test_function_pointer(struct test *test, int errval)
 {
 	return 0;
@@ -169,6 +181,16 @@ unsigned long *embedded_struct_member1_container = &test_struct.embedded_struct_
 unsigned long *embedded_struct_member2_container = &test_struct.embedded_struct_member.embedded_member2;
 struct list_head *embedded_struct_list_container = &test_struct.embedded_struct_member.embedded_list;
 
+/* A second definition of struct test, only visible in this function */
+unsigned long shadow_struct_function(void)
+{
+	static struct test {
+		char shadow_member;
+		unsigned long test_member;
+	} shadow_struct_symbol;
+
+	return shadow_struct_symbol.test_member;
+}
 
 int
 main(void)
@@ -178,5 +200,7 @@ main(void)
 	printf("global_symbol.test_member = %lx\n", global_struct_symbol.test_member);
 	printf("global_ulong_symbol = %lx\n", global_ulong_symbol);
 	printf("global_void_pointer_symbol = %lx\n", global_void_pointer_symbol);
+	printf("shadow_struct_function() = %lx\n", shadow_struct_function());
+	printf("char_arrays_symbol.name = %s\n", char_arrays_symbol.name);
 	return 0;
 }
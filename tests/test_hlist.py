@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.types.hlist import hlist_for_each_raw
+from crash.types.list import ListCycleError
+
+def get_symbol(name):
+    return gdb.lookup_symbol(name, None)[0].value()
+
+class TestHlist(unittest.TestCase):
+    def setUp(self):
+        gdb.execute("file tests/test-trees")
+
+    def test_invalid_value(self):
+        with self.assertRaises(TypeError):
+            for node in hlist_for_each_raw(None):
+                pass
+
+    def test_normal_hlist(self):
+        head = get_symbol("normal_hlist")
+        short_hlist = get_symbol("short_hlist")
+        nodes = list(hlist_for_each_raw(head))
+        expected = [ long(short_hlist[i].address) for i in range(3) ]
+        self.assertTrue(nodes == expected)
+
+    def test_empty_hlist(self):
+        head = get_symbol("empty_hlist")
+        nodes = list(hlist_for_each_raw(head))
+        self.assertTrue(len(nodes) == 0)
+
+    def test_cycle_hlist(self):
+        head = get_symbol("cycle_hlist")
+        with self.assertRaises(ListCycleError):
+            for node in hlist_for_each_raw(head, print_broken_links=False):
+                pass
+
+    def test_cycle_hlist_exact(self):
+        head = get_symbol("cycle_hlist")
+        with self.assertRaises(ListCycleError):
+            for node in hlist_for_each_raw(head, print_broken_links=False,
+                                           exact_cycles=True):
+                pass
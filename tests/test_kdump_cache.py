@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+
+from crash.kdump.cache import PageCache, MissingPageCache
+
+class TestPageCache(unittest.TestCase):
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            x = PageCache(16, 'random')
+
+    def test_bad_size(self):
+        with self.assertRaises(ValueError):
+            x = PageCache(-1)
+
+    def test_miss_then_hit(self):
+        cache = PageCache(4)
+        self.assertTrue(cache.lookup(1) is None)
+        cache.insert(1, bytearray(b'a'))
+        self.assertTrue(cache.lookup(1) == bytearray(b'a'))
+        stats = cache.stats()
+        self.assertTrue(stats['hits'] == 1)
+        self.assertTrue(stats['misses'] == 1)
+
+    def test_lru_eviction(self):
+        cache = PageCache(2, 'lru')
+        cache.insert(1, bytearray(b'a'))
+        cache.insert(2, bytearray(b'b'))
+        cache.lookup(1)
+        cache.insert(3, bytearray(b'c'))
+        self.assertTrue(1 in cache)
+        self.assertFalse(2 in cache)
+        self.assertTrue(3 in cache)
+        self.assertTrue(cache.stats()['evictions'] == 1)
+
+    def test_fifo_eviction(self):
+        cache = PageCache(2, 'fifo')
+        cache.insert(1, bytearray(b'a'))
+        cache.insert(2, bytearray(b'b'))
+        cache.lookup(1)
+        cache.insert(3, bytearray(b'c'))
+        self.assertFalse(1 in cache)
+        self.assertTrue(2 in cache)
+        self.assertTrue(3 in cache)
+
+    def test_disabled(self):
+        cache = PageCache(0)
+        cache.insert(1, bytearray(b'a'))
+        self.assertTrue(len(cache) == 0)
+
+    def test_shrink(self):
+        cache = PageCache(4)
+        for i in range(4):
+            cache.insert(i, bytearray(b'x'))
+        cache.resize(2)
+        self.assertTrue(len(cache) == 2)
+        self.assertTrue(3 in cache)
+        self.assertFalse(0 in cache)
+
+class TestMissingPageCache(unittest.TestCase):
+    def test_miss(self):
+        cache = MissingPageCache(4)
+        self.assertTrue(cache.lookup(1) is None)
+        self.assertTrue(cache.stats()['hits'] == 0)
+
+    def test_hit(self):
+        cache = MissingPageCache(4)
+        cache.insert(1, IOError("no data"))
+        error = cache.lookup(1)
+        self.assertTrue(error[0] == IOError)
+        self.assertTrue(error[1] == "no data")
+        self.assertTrue(cache.stats()['hits'] == 1)
+
+    def test_bounded(self):
+        cache = MissingPageCache(2)
+        for i in range(3):
+            cache.insert(i, IOError("no data"))
+        self.assertTrue(len(cache) == 2)
+        self.assertFalse(0 in cache)
+
+    def test_disabled(self):
+        cache = MissingPageCache(0)
+        cache.insert(1, IOError("no data"))
+        self.assertTrue(cache.lookup(1) is None)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.layout import StructLayout
+from crash.util import InvalidArgumentTypeError, InvalidComponentError
+
+def getsym(sym):
+    return gdb.lookup_symbol(sym, None)[0].value()
+
+class TestLayout(unittest.TestCase):
+    def setUp(self):
+        gdb.execute("file tests/test-util")
+        self.addr = long(getsym('test_struct').address)
+
+    def test_read_members(self):
+        layout = StructLayout('struct test',
+                              [ 'test_member', 'anon_struct_member2',
+                                'named_struct.named_struct_member1',
+                                'enum_member' ])
+        rec = layout.read(self.addr)
+        self.assertTrue(rec.address == self.addr)
+        self.assertTrue(rec.test_member == 0xdeadbe00)
+        self.assertTrue(rec.anon_struct_member2 == 0xdeadbe02)
+        self.assertTrue(rec.named_struct_named_struct_member1 == 0xdeadbe07)
+        self.assertTrue(rec.enum_member == 3)
+
+    def test_custom_names(self):
+        layout = StructLayout('struct test',
+                              [ 'embedded_struct_member.embedded_list.prev' ],
+                              [ 'prev' ])
+        rec = layout.read(self.addr)
+        self.assertTrue(rec.prev == 0xdeadbe18)
+
+    def test_overlapping_members(self):
+        layout = StructLayout('struct test',
+                              [ 'anon_union_member1',
+                                'anon_union_embedded_struct.embedded_member1' ])
+        rec = layout.read(self.addr)
+        self.assertTrue(rec.anon_union_member1 == 0xdeadbe0d)
+        self.assertTrue(rec.anon_union_embedded_struct_embedded_member1 ==
+                        0xdeadbe0d)
+
+    def test_embedded_struct_bytes(self):
+        layout = StructLayout('struct test', [ 'embedded_struct_member' ])
+        rec = layout.read(self.addr)
+        size = gdb.lookup_type('struct embedded').sizeof
+        self.assertTrue(len(rec.embedded_struct_member) == size)
+
+    def test_read_array(self):
+        layout = StructLayout('struct test', [ 'test_member' ])
+        recs = list(layout.read_array(self.addr, 1))
+        self.assertTrue(len(recs) == 1)
+        self.assertTrue(recs[0].test_member == 0xdeadbe00)
+
+    def test_not_a_struct(self):
+        with self.assertRaises(InvalidArgumentTypeError):
+            layout = StructLayout('unsigned long', [ 'x' ])
+
+    def test_invalid_member(self):
+        with self.assertRaises(InvalidComponentError):
+            layout = StructLayout('struct test', [ 'no_such_member' ])
+
+    def test_name_count_mismatch(self):
+        with self.assertRaises(ValueError):
+            layout = StructLayout('struct test', [ 'test_member' ], [])
+
+    def test_char_array_string(self):
+        addr = long(getsym('char_arrays_symbol').address)
+        layout = StructLayout('struct char_arrays', [ 'name' ])
+        self.assertTrue(layout.read(addr).name == "chars")
+
+    def test_signed_char_array(self):
+        addr = long(getsym('char_arrays_symbol').address)
+        layout = StructLayout('struct char_arrays', [ 'diffs', 'bytes' ])
+        rec = layout.read(addr)
+        self.assertTrue(rec.diffs == (0, -32, -64, -96))
+        self.assertTrue(rec.bytes == (1, 2, 0, 4))
+
+    def test_char_array_integers(self):
+        addr = long(getsym('char_arrays_symbol').address)
+        layout = StructLayout('struct char_arrays', [ 'name' ],
+                              integers=[ 'name' ])
+        rec = layout.read(addr)
+        self.assertTrue(rec.name == (ord('c'), ord('h'), ord('a'), ord('r'),
+                                     ord('s'), 0, 0, 0))
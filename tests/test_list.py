@@ -7,8 +7,13 @@ from __future__ import division
 
 import unittest
 import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
 
 from crash.types.list import list_for_each, list_for_each_entry
+from crash.types.list import list_for_each_raw
 from crash.types.list import ListCycleError, CorruptListError
 
 def get_symbol(name):
@@ -151,3 +156,63 @@ class TestList(unittest.TestCase):
             for node in list_for_each_entry(bad_list, struct_container,
                                             'list'):
                 count += 1
+
+    def test_raw_normal_list(self):
+        normal_list = get_symbol("normal_head")
+        short_list = get_symbol("short_list")
+        expected_count = short_list.type.sizeof // short_list[0].type.sizeof
+        nodes = list(list_for_each_raw(normal_list))
+
+        self.assertTrue(len(nodes) == expected_count)
+        self.assertTrue(nodes[0] == long(short_list[0].address))
+
+    def test_raw_list_by_address(self):
+        normal_list = get_symbol("normal_head")
+        nodes = list(list_for_each_raw(long(normal_list.address),
+                                       include_head=True))
+        self.assertTrue(nodes[0] == long(normal_list.address))
+
+    def test_raw_matches_value_walk(self):
+        normal_list = get_symbol("normal_head")
+        raw = list(list_for_each_raw(normal_list, reverse=True))
+        values = [ long(n) for n in list_for_each(normal_list, reverse=True) ]
+        self.assertTrue(raw == values)
+
+    def test_raw_cycle_list(self):
+        normal_list = get_symbol("cycle_head")
+        with self.assertRaises(ListCycleError):
+            for node in list_for_each_raw(normal_list):
+                pass
+
+    def test_raw_cycle_list_exact(self):
+        normal_list = get_symbol("cycle_head")
+        with self.assertRaises(ListCycleError):
+            for node in list_for_each_raw(normal_list, exact_cycles=True):
+                pass
+
+    def test_raw_bad_next_pointer_list(self):
+        head = get_symbol("bad_next_ptr_list")
+        with self.assertRaises(BufferError):
+            for node in list_for_each_raw(head):
+                pass
+
+    def test_brent_cycle_list(self):
+        normal_list = get_symbol("cycle_head")
+        with self.assertRaises(ListCycleError):
+            for node in list_for_each(normal_list, brent_cycles=True,
+                                      print_broken_links=False):
+                pass
+
+    def test_raw_brent_cycle_list(self):
+        normal_list = get_symbol("cycle_head")
+        with self.assertRaises(ListCycleError):
+            for node in list_for_each_raw(normal_list, brent_cycles=True,
+                                          print_broken_links=False):
+                pass
+
+    def test_raw_brent_normal_list(self):
+        normal_list = get_symbol("normal_head")
+        short_list = get_symbol("short_list")
+        expected_count = short_list.type.sizeof // short_list[0].type.sizeof
+        nodes = list(list_for_each_raw(normal_list, brent_cycles=True))
+        self.assertTrue(len(nodes) == expected_count)
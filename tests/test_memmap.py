@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.types.page import Page
+from crash.types.memmap import MemMapChunk, PageCensus
+
+PG_locked = 1 << 0
+PG_reserved = 1 << 1
+PG_slab = 1 << 2
+PG_head = 1 << 3
+PG_tail = 1 << 4
+PG_buddy = 1 << 5
+
+# page_type of a free buddy page: PAGE_TYPE_BUDDY cleared
+BUDDY_PAGE_TYPE = -129
+
+def make_chunk(start_pfn, pages, missing=None):
+    chunk = MemMapChunk(start_pfn, 0, len(pages))
+    for (row, page) in enumerate(pages):
+        for (name, value) in page.items():
+            getattr(chunk, name)[row] = value
+    if missing is not None:
+        chunk.missing = missing
+    return chunk
+
+class FakeScanner(object):
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def scan(self, start_pfn=0, end_pfn=None):
+        for chunk in self.chunks:
+            yield chunk
+
+class TestPageCensus(unittest.TestCase):
+    def setUp(self):
+        self.pageflags = { 'PG_locked' : 0, 'PG_reserved' : 1,
+                           'PG_slab' : 2, 'PG_head' : 3, 'PG_tail' : 4,
+                           'PG_buddy' : 5, '__NR_PAGEFLAGS' : 6 }
+        attrs = { 'pageflags' : self.pageflags, 'PG_slab' : PG_slab,
+                  'PG_tail' : PG_tail, 'BITS_PER_LONG' : 64,
+                  'NODES_WIDTH' : 6, 'ZONES_WIDTH' : 2 }
+        for (name, value) in attrs.items():
+            self.addCleanup(setattr, Page, name, getattr(Page, name))
+            setattr(Page, name, value)
+
+    def census(self, *chunks):
+        return PageCensus(FakeScanner(list(chunks))).run()
+
+    def total(self, census, category):
+        return census.totals[census.categories.index(category)]
+
+    def test_flag_mask(self):
+        census = PageCensus(FakeScanner([]))
+        self.assertTrue(census.flag_mask == 0x3f)
+
+    def test_flag_mask_without_nr_pageflags(self):
+        del self.pageflags['__NR_PAGEFLAGS']
+        census = PageCensus(FakeScanner([]))
+        self.assertTrue(census.flag_mask == 0x3f)
+
+    def test_categories(self):
+        census = self.census(make_chunk(0, [
+                    { 'flags' : PG_reserved },
+                    { 'flags' : PG_slab },
+                    { 'mapping' : 0x1001 },
+                    { 'mapping' : 0x1000 },
+                    { 'mapping' : 0x1002 },
+                    { } ]))
+        self.assertTrue(census.pages == 6)
+        self.assertTrue(census.totals == [ 1, 0, 1, 1, 1, 2 ])
+        self.assertTrue(census.orders == { 0 : 6 })
+
+    def test_buddy_flag(self):
+        census = self.census(make_chunk(0, [
+                    { 'flags' : PG_buddy, 'private' : 2 },
+                    { }, { }, { },
+                    { 'mapping' : 0x1001 } ]))
+        self.assertTrue(self.total(census, 'free') == 4)
+        self.assertTrue(self.total(census, 'anon') == 1)
+        self.assertTrue(census.free_orders == { 2 : 1 })
+
+    def test_buddy_mapcount(self):
+        del self.pageflags['PG_buddy']
+        census = self.census(make_chunk(0, [
+                    { 'mapcount' : -128, 'private' : 1 },
+                    { },
+                    { 'mapcount' : -1 } ]))
+        self.assertTrue(self.total(census, 'free') == 2)
+        self.assertTrue(self.total(census, 'other') == 1)
+        self.assertTrue(census.free_orders == { 1 : 1 })
+
+    def test_buddy_page_type(self):
+        del self.pageflags['PG_buddy']
+        census = self.census(make_chunk(0, [
+                    { 'mapcount' : BUDDY_PAGE_TYPE, 'private' : 1 },
+                    { },
+                    { 'mapcount' : BUDDY_PAGE_TYPE, 'private' : 0 } ]))
+        self.assertTrue(self.total(census, 'free') == 3)
+        self.assertTrue(census.free_orders == { 0 : 1, 1 : 1 })
+
+    def test_buddy_bad_order(self):
+        census = self.census(make_chunk(0, [
+                    { 'flags' : PG_buddy, 'private' : 0xffff },
+                    { } ]))
+        self.assertTrue(self.total(census, 'free') == 1)
+        self.assertTrue(self.total(census, 'other') == 1)
+        self.assertTrue(census.free_orders == { 0 : 1 })
+
+    def test_compound_across_chunks(self):
+        census = self.census(
+                    make_chunk(0, [ { 'flags' : PG_slab | PG_head },
+                                    { 'flags' : PG_tail },
+                                    { 'flags' : PG_tail } ]),
+                    make_chunk(3, [ { 'flags' : PG_tail },
+                                    { 'mapping' : 0x1001 } ]))
+        self.assertTrue(self.total(census, 'slab') == 4)
+        self.assertTrue(self.total(census, 'anon') == 1)
+        self.assertTrue(census.orders == { 2 : 1, 0 : 1 })
+
+    def test_compound_head_tail(self):
+        # Without PG_tail, tail pages point to their head with bit 0 set
+        Page.PG_tail = None
+        census = self.census(make_chunk(0, [
+                    { 'mapping' : 0x1001 },
+                    { 'compound_head' : 0x1001 },
+                    { 'mapping' : 0x1000 } ]))
+        self.assertTrue(self.total(census, 'anon') == 2)
+        self.assertTrue(self.total(census, 'file') == 1)
+        self.assertTrue(census.orders == { 1 : 1, 0 : 1 })
+
+    def test_free_left_across_chunks(self):
+        census = self.census(
+                    make_chunk(0, [ { 'mapping' : 0x1001 },
+                                    { 'flags' : PG_buddy, 'private' : 2 } ]),
+                    make_chunk(2, [ { }, { }, { },
+                                    { 'flags' : PG_slab } ]))
+        self.assertTrue(self.total(census, 'free') == 4)
+        self.assertTrue(self.total(census, 'slab') == 1)
+        self.assertTrue(self.total(census, 'anon') == 1)
+
+    def test_missing_rows(self):
+        census = self.census(make_chunk(0, [
+                    { 'flags' : PG_buddy, 'private' : 2 },
+                    { },
+                    { },
+                    { 'mapping' : 0x1000 } ],
+                    missing=[ (1, 3) ]))
+        self.assertTrue(census.pages == 2)
+        self.assertTrue(census.missing == 2)
+        # The free block ends at the missing rows
+        self.assertTrue(self.total(census, 'free') == 1)
+        self.assertTrue(self.total(census, 'file') == 1)
+
+    def test_zones(self):
+        node1_zone2 = (1 << 58) | (2 << 56)
+        census = self.census(make_chunk(0, [
+                    { 'flags' : node1_zone2 | PG_slab },
+                    { 'flags' : node1_zone2 },
+                    { } ]))
+        self.assertTrue(census.zones[(1, 2)] == [ 0, 0, 1, 0, 0, 1 ])
+        self.assertTrue(census.zones[(0, 0)] == [ 0, 0, 0, 0, 0, 1 ])
+
+    def test_flag_combinations(self):
+        census = self.census(make_chunk(0, [
+                    { 'flags' : (1 << 58) | PG_slab | PG_locked },
+                    { 'flags' : PG_slab | PG_locked },
+                    { 'flags' : PG_slab } ]))
+        self.assertTrue(census.flag_combinations ==
+                        { PG_slab | PG_locked : 2, PG_slab : 1 })
+        self.assertTrue(census.flag_names(PG_slab | PG_locked) ==
+                        [ 'locked', 'slab' ])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.memory import read_memory, read_u64, read_ulong, read_array
+from crash.memory import read_ulong_array
+
+def getsym(sym):
+    return gdb.lookup_symbol(sym, None)[0].value()
+
+class TestMemory(unittest.TestCase):
+    def setUp(self):
+        gdb.execute("file tests/test-util")
+        self.ulong = gdb.lookup_type('unsigned long')
+        self.addr = long(getsym('global_array').address)
+
+    def test_read_memory(self):
+        buf = read_memory(self.addr, self.ulong.sizeof)
+        self.assertTrue(isinstance(buf, memoryview))
+        self.assertTrue(len(buf) == self.ulong.sizeof)
+
+    def test_read_ulong(self):
+        self.assertTrue(read_ulong(self.addr) == 0xdeadbeef)
+        self.assertTrue(read_ulong(self.addr + self.ulong.sizeof) == 0xdeadbef0)
+
+    def test_read_u64(self):
+        self.assertTrue(read_u64(self.addr) == 0xdeadbeef)
+
+    def test_read_array(self):
+        vals = read_array(self.addr, 5, self.ulong.sizeof)
+        self.assertTrue(list(vals) == [ 0xdeadbeef, 0xdeadbef0, 0xdeadbef1,
+                                        0xdeadbef2, 0xdeadbef3 ])
+
+    def test_read_ulong_array(self):
+        vals = read_ulong_array(self.addr + self.ulong.sizeof, 2)
+        self.assertTrue(list(vals) == [ 0xdeadbef0, 0xdeadbef1 ])
+
+    def test_read_empty_array(self):
+        vals = read_array(self.addr, 0, self.ulong.sizeof)
+        self.assertTrue(len(vals) == 0)
+
+    def test_bad_size(self):
+        with self.assertRaises(ValueError):
+            vals = read_array(self.addr, 1, 3)
+
+    def test_bad_address(self):
+        with self.assertRaises(gdb.MemoryError):
+            val = read_ulong(0xdead0000)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import array
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+import crash.types.page
+from crash.types.page import Page, for_each_present_pfn_range
+
+PAGE_STRUCT_SIZE = 64
+
+# Four sections of four pages under each root
+SECTIONS_PER_ROOT = 4
+SECTION_SIZE_BITS = 14
+PAGE_SHIFT = 12
+
+class FakeType(object):
+    def __init__(self, code, sizeof=0):
+        self.code = code
+        self.sizeof = sizeof
+
+    def strip_typedefs(self):
+        return self
+
+class FakeRoot(object):
+    type = FakeType(gdb.TYPE_CODE_PTR)
+
+    def __init__(self, addr):
+        self.addr = addr
+
+    def __int__(self):
+        return self.addr
+
+    __long__ = __int__
+
+class FakeRecord(object):
+    def __init__(self, section_mem_map):
+        self.section_mem_map = section_mem_map
+
+class FakeSectionLayout(object):
+    def __init__(self, roots):
+        self.roots = roots
+        self.reads = []
+
+    def read_array(self, addr, count):
+        self.reads.append(addr)
+        if addr not in self.roots:
+            raise gdb.MemoryError("Cannot access memory at address {:#x}"
+                                  .format(addr))
+        for mem_map in self.roots[addr][:count]:
+            yield FakeRecord(mem_map)
+
+class TestSparsemem(unittest.TestCase):
+    def setUp(self):
+        self.layout = FakeSectionLayout({
+            # sections 0-3: with, without, not present, and with a mem_map
+            0x1000 : [ 0x10000 | 2, 0, 0x20000 | 1, 0x30000 | 2 ],
+            # sections 8-11
+            0x2000 : [ 0, 0, 0x40000 | 3, 0 ],
+        })
+        attrs = { 'mem_section' : [ FakeRoot(0x1000), FakeRoot(0),
+                                    FakeRoot(0x2000), FakeRoot(0xbad0) ],
+                  'section_layout' : self.layout,
+                  'section_mem_maps' : array.array('L'),
+                  'section_roots_read' : set(),
+                  'SECTIONS_PER_ROOT' : SECTIONS_PER_ROOT,
+                  'SECTION_SIZE_BITS' : SECTION_SIZE_BITS,
+                  'PAGE_SHIFT' : PAGE_SHIFT,
+                  'page_type' : FakeType(gdb.TYPE_CODE_STRUCT,
+                                         PAGE_STRUCT_SIZE),
+                  'sparsemem' : True }
+        for (name, value) in attrs.items():
+            self.save(name)
+            setattr(Page, name, value)
+
+    def save(self, name):
+        # Keep the delayed lookups themselves, not what they resolve to
+        if name in Page.__dict__:
+            self.addCleanup(setattr, Page, name, Page.__dict__[name])
+        else:
+            self.addCleanup(delattr, Page, name)
+
+    def test_section_mem_map(self):
+        self.assertTrue(Page.section_mem_map(0) == 0x10000)
+        self.assertTrue(Page.section_mem_map(1) is None)
+        self.assertTrue(Page.section_mem_map(2) is None)
+        self.assertTrue(Page.section_mem_map(3) == 0x30000)
+        self.assertTrue(Page.section_mem_map(10) == 0x40000)
+        # Each root is read once
+        self.assertTrue(self.layout.reads == [ 0x1000, 0x2000 ])
+
+    def test_empty_root(self):
+        self.assertTrue(Page.section_mem_map(5) is None)
+        self.assertTrue(self.layout.reads == [])
+
+    def test_unreadable_root(self):
+        self.assertTrue(Page.section_mem_map(12) is None)
+        self.assertTrue(Page.section_mem_map(13) is None)
+        self.assertTrue(self.layout.reads == [ 0xbad0 ])
+
+    def test_pfn_to_page_address(self):
+        self.assertTrue(Page.pfn_to_page_address(0) == 0x10000)
+        self.assertTrue(Page.pfn_to_page_address(3) ==
+                        0x10000 + 3 * PAGE_STRUCT_SIZE)
+        self.assertTrue(Page.pfn_to_page_address(13) ==
+                        0x30000 + 13 * PAGE_STRUCT_SIZE)
+        self.assertTrue(Page.pfn_to_page_address(41) ==
+                        0x40000 + 41 * PAGE_STRUCT_SIZE)
+
+    def test_pfn_to_page_address_no_mem_map(self):
+        with self.assertRaises(gdb.MemoryError):
+            Page.pfn_to_page_address(4)
+        with self.assertRaises(gdb.MemoryError):
+            Page.pfn_to_page_address(50)
+
+    def test_pfn_to_page_address_flat(self):
+        Page.sparsemem = False
+        self.assertTrue(Page.pfn_to_page_address(10) ==
+                        Page.vmemmap_base + 10 * PAGE_STRUCT_SIZE)
+        self.assertTrue(self.layout.reads == [])
+
+    def set_max_pfn(self, pfn):
+        self.addCleanup(setattr, crash.types.page, 'max_pfn',
+                        crash.types.page.max_pfn)
+        crash.types.page.max_pfn = lambda: pfn
+
+    def test_present_pfn_ranges(self):
+        self.set_max_pfn(48)
+        ranges = list(for_each_present_pfn_range())
+        self.assertTrue(ranges == [ (0, 4), (12, 16), (40, 44) ])
+
+    def test_present_pfn_ranges_vmemmap(self):
+        # The mem_map is addressed through vmemmap but holes are skipped
+        Page.sparsemem = False
+        self.set_max_pfn(48)
+        ranges = list(for_each_present_pfn_range())
+        self.assertTrue(ranges == [ (0, 4), (12, 16), (40, 44) ])
+
+    def test_present_pfn_ranges_without_mem_section(self):
+        Page.sparsemem = False
+        Page.section_layout = None
+        self.set_max_pfn(48)
+        self.assertTrue(list(for_each_present_pfn_range()) == [ (0, 48) ])
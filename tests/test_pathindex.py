@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+from crash.pathindex import PathIndex
+
+class TestPathIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'tree')
+        self.cache = os.path.join(self.tmpdir, 'cache')
+        os.makedirs(os.path.join(self.root, 'kernel', 'fs'))
+        os.makedirs(os.path.join(self.root, '.build-id', 'ab'))
+        self.touch('kernel', 'fs', 'btrfs.ko')
+        self.touch('kernel', 'dm-mod.ko')
+        self.touch('.build-id', 'ab', 'cdef.debug')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def touch(self, *path):
+        with open(os.path.join(self.root, *path), 'w') as f:
+            f.write('')
+
+    def test_lookup(self):
+        index = PathIndex(self.root, self.cache)
+        index.refresh()
+        self.assertTrue(index.lookup('btrfs.ko') ==
+                        os.path.join(self.root, 'kernel', 'fs', 'btrfs.ko'))
+        self.assertTrue(index.lookup('dm_mod.ko') ==
+                        os.path.join(self.root, 'kernel', 'dm-mod.ko'))
+        self.assertTrue(index.lookup('xfs.ko') is None)
+
+    def test_build_id(self):
+        index = PathIndex(self.root, self.cache)
+        index.refresh()
+        self.assertTrue(index.lookup_build_id('ABCDEF') ==
+                        os.path.join(self.root, '.build-id', 'ab',
+                                     'cdef.debug'))
+
+    def test_persistent(self):
+        index = PathIndex(self.root, self.cache)
+        self.assertTrue(index.refresh() > 0)
+
+        index = PathIndex(self.root, self.cache)
+        self.assertTrue(index.refresh() == 0)
+        self.assertTrue(index.lookup('btrfs.ko') is not None)
+
+    def test_incremental(self):
+        index = PathIndex(self.root, self.cache)
+        index.refresh()
+
+        fsdir = os.path.join(self.root, 'kernel', 'fs')
+        self.touch('kernel', 'fs', 'xfs.ko')
+        # Make sure the change is visible even with coarse timestamps
+        st = os.stat(fsdir)
+        os.utime(fsdir, (st.st_atime, st.st_mtime + 10))
+
+        index = PathIndex(self.root, self.cache)
+        self.assertTrue(index.refresh() == 1)
+        self.assertTrue(index.lookup('xfs.ko') is not None)
+
+    def test_removed_directory(self):
+        index = PathIndex(self.root, self.cache)
+        index.refresh()
+        shutil.rmtree(os.path.join(self.root, 'kernel', 'fs'))
+        st = os.stat(os.path.join(self.root, 'kernel'))
+        os.utime(os.path.join(self.root, 'kernel'),
+                 (st.st_atime, st.st_mtime + 10))
+        index.refresh()
+        self.assertTrue(index.lookup('btrfs.ko') is None)
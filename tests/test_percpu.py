@@ -109,3 +109,46 @@ class TestPerCPU(unittest.TestCase):
         with self.assertRaises(TypeError):
             x = crash.types.percpu.get_percpu_var(var, 0)
         self.assertTrue(var['x'] == 0)
+
+    def test_percpu_array(self):
+        var = gdb.lookup_symbol('array_test', None)[0]
+        self.assertTrue(var is not None)
+        rows = crash.types.percpu.get_percpu_array(var, 'events')
+        self.assertTrue(len(rows) == 32)
+        for cpu, row in enumerate(rows):
+            self.assertTrue(row == (cpu, cpu + 1, cpu + 2))
+
+    def test_percpu_array_cpus(self):
+        var = gdb.lookup_symbol('array_test', None)[0]
+        rows = crash.types.percpu.get_percpu_array(var, 'events', [ 3, 1 ])
+        self.assertTrue(rows == [ (3, 4, 5), (1, 2, 3) ])
+
+    def test_sum_percpu_array_signed(self):
+        var = gdb.lookup_symbol('array_test', None)[0]
+        sums = crash.types.percpu.sum_percpu_array(var, 'diffs')
+        self.assertTrue(sums == [ 0, -32, -64, -96 ])
+
+    def test_sum_percpu_array_no_cpus(self):
+        var = gdb.lookup_symbol('array_test', None)[0]
+        sums = crash.types.percpu.sum_percpu_array(var, 'events', [])
+        self.assertTrue(sums == [])
+
+class TestPerCPUDynamicMap(unittest.TestCase):
+    def test_map_used_areas_offsets(self):
+        # used 0-16, free 16-48, used 48-64, sentry at 64
+        values = [ 0 | 1, 16, 48 | 1, 64 | 1 ]
+        areas = crash.types.percpu.TypesPerCPUClass._map_used_areas(values,
+                                                                    False)
+        self.assertTrue(areas == [ (0, 16), (48, 64) ])
+
+    def test_map_used_areas_negative_sizes(self):
+        # used 16, used 8, free 32, used 16
+        values = [ -16, -8, 32, -16, 0 ]
+        areas = crash.types.percpu.TypesPerCPUClass._map_used_areas(values,
+                                                                    True)
+        self.assertTrue(areas == [ (0, 24), (56, 72) ])
+
+    def test_merge_intervals(self):
+        intervals = [ (40, 50), (0, 10), (10, 20), (15, 30), (60, 70) ]
+        merged = crash.types.percpu.TypesPerCPUClass._merge_intervals(intervals)
+        self.assertTrue(merged == [ (0, 30), (40, 50), (60, 70) ])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.types.radix_tree import radix_tree_for_each_raw
+from crash.types.radix_tree import radix_tree_for_each_entry
+from crash.types.radix_tree import radix_tree_exceptional_entry
+
+def get_symbol(name):
+    return gdb.lookup_symbol(name, None)[0].value()
+
+class TestRadixTree(unittest.TestCase):
+    def setUp(self):
+        gdb.execute("file tests/test-trees")
+        self.items = get_symbol("tree_items")
+
+    def item(self, n):
+        return long(self.items[n].address)
+
+    def test_raw(self):
+        root = get_symbol("test_radix_tree")
+        entries = list(radix_tree_for_each_raw(root))
+        self.assertTrue(entries == [ (1, self.item(0)), (3, self.item(1)),
+                                     (4, (5 << 2) | 2), (12, self.item(3)) ])
+
+    def test_raw_pointer(self):
+        root = get_symbol("test_radix_tree").address
+        indices = [ index for (index, entry)
+                    in radix_tree_for_each_raw(root) ]
+        self.assertTrue(indices == [ 1, 3, 4, 12 ])
+
+    def test_exceptional_entry(self):
+        root = get_symbol("test_radix_tree")
+        indices = [ index for (index, entry)
+                    in radix_tree_for_each_raw(root)
+                    if radix_tree_exceptional_entry(entry) ]
+        self.assertTrue(indices == [ 4 ])
+
+    def test_range(self):
+        root = get_symbol("test_radix_tree")
+        indices = [ index for (index, entry)
+                    in radix_tree_for_each_raw(root, 2, 11) ]
+        self.assertTrue(indices == [ 3, 4 ])
+
+    def test_entries(self):
+        root = get_symbol("test_radix_tree")
+        entries = radix_tree_for_each_entry(root, 'unsigned long')
+        self.assertTrue([ (index, long(entry)) for (index, entry) in entries ]
+                        == [ (1, 0xdead0000), (3, 0xdead0001),
+                             (12, 0xdead0003) ])
+
+    def test_xarray(self):
+        # Since v4.20 the page cache radix tree is an xarray
+        xa = get_symbol("test_xarray")
+        indices = [ index for (index, entry) in radix_tree_for_each_raw(xa) ]
+        self.assertTrue(indices == [ 0, 2, 8, 13 ])
+
+    def test_single(self):
+        root = get_symbol("single_radix_tree")
+        self.assertTrue(list(radix_tree_for_each_raw(root)) ==
+                        [ (0, self.item(2)) ])
+
+    def test_empty(self):
+        root = get_symbol("empty_radix_tree")
+        self.assertTrue(len(list(radix_tree_for_each_raw(root))) == 0)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.types.rbtree import rbtree_for_each_raw, rbtree_for_each_entry
+from crash.types.rbtree import rbtree_for_each_entry_range
+from crash.types.rbtree import RBTreeCorruptedError
+
+def get_symbol(name):
+    return gdb.lookup_symbol(name, None)[0].value()
+
+class TestRBTree(unittest.TestCase):
+    def setUp(self):
+        gdb.execute("file tests/test-trees")
+        self.keyed_node = gdb.lookup_type('struct keyed_node')
+
+    def keys(self, entries):
+        return [ long(entry['key']) for entry in entries ]
+
+    def test_in_order(self):
+        root = get_symbol("keyed_tree")
+        entries = rbtree_for_each_entry(root, self.keyed_node, 'node')
+        self.assertTrue(self.keys(entries) == [ 10, 20, 30, 40, 50, 60, 70 ])
+
+    def test_reverse(self):
+        root = get_symbol("keyed_tree")
+        entries = rbtree_for_each_entry(root, self.keyed_node, 'node',
+                                        reverse=True)
+        self.assertTrue(self.keys(entries) == [ 70, 60, 50, 40, 30, 20, 10 ])
+
+    def test_raw(self):
+        root = get_symbol("keyed_tree")
+        nodes = get_symbol("tree_nodes")
+        addrs = list(rbtree_for_each_raw(root))
+        self.assertTrue(addrs[0] == long(nodes[0]['node'].address))
+        self.assertTrue(len(addrs) == 7)
+
+    def test_empty(self):
+        root = get_symbol("empty_tree")
+        self.assertTrue(len(list(rbtree_for_each_raw(root))) == 0)
+
+    def test_range(self):
+        root = get_symbol("keyed_tree")
+        entries = rbtree_for_each_entry_range(root, self.keyed_node, 'node',
+                                              'key', 25, 60)
+        self.assertTrue(self.keys(entries) == [ 30, 40, 50 ])
+
+    def test_range_open_ended(self):
+        root = get_symbol("keyed_tree")
+        entries = rbtree_for_each_entry_range(root, self.keyed_node, 'node',
+                                              'key', low=55)
+        self.assertTrue(self.keys(entries) == [ 60, 70 ])
+
+    def test_range_empty(self):
+        root = get_symbol("keyed_tree")
+        entries = rbtree_for_each_entry_range(root, self.keyed_node, 'node',
+                                              'key', 71)
+        self.assertTrue(len(list(entries)) == 0)
+
+    def test_cycle(self):
+        root = get_symbol("self_loop_tree")
+        with self.assertRaises(RBTreeCorruptedError):
+            list(rbtree_for_each_raw(root))
+
+    def test_cycle_range(self):
+        root = get_symbol("self_loop_tree")
+        with self.assertRaises(RBTreeCorruptedError):
+            list(rbtree_for_each_entry_range(root, self.keyed_node, 'node',
+                                             'key', 5))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.stackscan import StackScanner
+
+def getsym(sym):
+    return gdb.lookup_symbol(sym, None)[0].value()
+
+class TestStackScan(unittest.TestCase):
+    def setUp(self):
+        gdb.execute("file tests/test-util")
+        self.ulong = gdb.lookup_type('unsigned long')
+        self.addr = long(getsym('global_array').address)
+
+    def scanner(self, addresses):
+        # Treat global_array as a five word stack
+        return StackScanner(addresses, stack_size=5 * self.ulong.sizeof)
+
+    def test_scan_matches(self):
+        scanner = self.scanner([ 0xdeadbef1, 0xdeadbef3 ])
+        hits = scanner.scan_stack(self.addr)
+        self.assertTrue(hits == [ (2 * self.ulong.sizeof, 0xdeadbef1),
+                                  (4 * self.ulong.sizeof, 0xdeadbef3) ])
+
+    def test_scan_no_matches(self):
+        scanner = self.scanner([ 0x12345678 ])
+        self.assertTrue(scanner.scan_stack(self.addr) == [])
+
+    def test_scan_no_addresses(self):
+        scanner = self.scanner(None)
+        self.assertTrue(scanner.scan_stack(self.addr) == [])
+
+    def test_scan_bad_address(self):
+        scanner = self.scanner([ 0xdeadbeef ])
+        with self.assertRaises(gdb.MemoryError):
+            scanner.scan_stack(0xdead0000)
+
+    def test_default_stack_size(self):
+        # Without union thread_union, the default THREAD_SIZE is used
+        scanner = StackScanner([ 0xdeadbef1 ])
+        self.assertTrue(scanner.stack_size == 16384)
@@ -7,13 +7,19 @@ from __future__ import division
 
 import unittest
 import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
 
 from crash.exceptions import MissingTypeError, MissingSymbolError
 from crash.util import offsetof, container_of, resolve_type
 from crash.util import get_symbol_value, safe_get_symbol_value
 from crash.util import InvalidComponentError
 from crash.util import InvalidArgumentError
+from crash.util import offsetof_cache_stats, flush_offsetof_cache
 from crash.util import InvalidArgumentTypeError
+from crash.util import add_lookup_fallback, TypesUtilClass
 from crash.util import InvalidComponentError
 
 def getsym(sym):
@@ -599,3 +605,90 @@ class TestUtil(unittest.TestCase):
         self.assertTrue(sym.address != container.address)
         with self.assertRaises(InvalidArgumentTypeError):
             addr = container_of(sym, self.ulong, 'test_member')
+
+    def test_offsetof_cache_hit(self):
+        flush_offsetof_cache()
+        before = offsetof_cache_stats()
+        offset1 = offsetof(self.test_struct, 'named_struct.named_struct_member2')
+        offset2 = offsetof(self.test_struct, 'named_struct.named_struct_member2')
+        after = offsetof_cache_stats()
+        self.assertTrue(offset1 == offset2)
+        self.assertTrue(after['misses'] == before['misses'] + 1)
+        self.assertTrue(after['hits'] == before['hits'] + 1)
+
+    def test_offsetof_cache_by_name(self):
+        flush_offsetof_cache()
+        before = offsetof_cache_stats()
+        offset1 = offsetof('struct test', 'test_member')
+        offset2 = offsetof('struct test', 'test_member')
+        after = offsetof_cache_stats()
+        self.assertTrue(offset1 == offset2)
+        self.assertTrue(after['hits'] == before['hits'] + 1)
+
+    def test_offsetof_cache_same_tag(self):
+        func = gdb.lookup_global_symbol('shadow_struct_function').value()
+        block = gdb.block_for_pc(long(func.address))
+        shadow = gdb.lookup_symbol('shadow_struct_symbol', block)[0]
+        flush_offsetof_cache()
+        offset1 = offsetof(self.test_struct, 'test_member')
+        offset2 = offsetof(shadow.type, 'test_member')
+        self.assertTrue(offset1 == 0)
+        self.assertTrue(offset2 == self.ulongsize)
+
+    def test_offsetof_cache_unicode_name(self):
+        flush_offsetof_cache()
+        before = offsetof_cache_stats()
+        offset1 = offsetof(u'struct test', 'test_member')
+        offset2 = offsetof(u'struct test', 'test_member')
+        after = offsetof_cache_stats()
+        self.assertTrue(offset1 == 0 and offset2 == 0)
+        self.assertTrue(after['hits'] == before['hits'] + 1)
+
+    def test_offsetof_cache_errors_not_cached(self):
+        flush_offsetof_cache()
+        with self.assertRaises(InvalidComponentError):
+            offset = offsetof(self.test_struct, 'invalid_member')
+        with self.assertRaises(InvalidComponentError):
+            offset = offsetof(self.test_struct, 'invalid_member')
+        self.assertTrue(offsetof_cache_stats()['entries'] == 0)
+
+    def test_offsetof_cache_flushed_on_new_objfile(self):
+        offset = offsetof(self.test_struct, 'test_member')
+        self.assertTrue(offsetof_cache_stats()['entries'] > 0)
+        gdb.execute("file tests/test-util")
+        self.assertTrue(offsetof_cache_stats()['entries'] == 0)
+
+    def add_fallback(self, loads):
+        calls = []
+        def fallback():
+            calls.append(True)
+            if len(calls) <= loads:
+                gdb.execute("file tests/test-util")
+                return True
+            return False
+        add_lookup_fallback(fallback)
+        self.addCleanup(TypesUtilClass.lookup_fallbacks.remove, fallback)
+        return calls
+
+    def test_lookup_fallback_symbol(self):
+        calls = self.add_fallback(1)
+        with self.assertRaises(MissingSymbolError):
+            get_symbol_value("test_struct_bad")
+        self.assertTrue(len(calls) == 2)
+
+    def test_lookup_fallback_type(self):
+        calls = self.add_fallback(1)
+        with self.assertRaises(MissingTypeError):
+            resolve_type("struct invalid_struct")
+        self.assertTrue(len(calls) == 2)
+
+    def test_lookup_fallback_not_needed(self):
+        calls = self.add_fallback(1)
+        get_symbol_value("test_struct")
+        resolve_type("struct test")
+        self.assertTrue(len(calls) == 0)
+
+    def test_lookup_fallback_not_used_by_safe(self):
+        calls = self.add_fallback(1)
+        self.assertTrue(safe_get_symbol_value("test_struct_bad") is None)
+        self.assertTrue(len(calls) == 0)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+from crash.workers import _claim, _process, _results
+
+def double(item):
+    print("doubling {}".format(item))
+    return item * 2
+
+def fail(item):
+    print("failing {}".format(item))
+    raise ValueError("bad item {}".format(item))
+
+class TestWorkers(unittest.TestCase):
+    def setUp(self):
+        self.jobdir = tempfile.mkdtemp(prefix="test-workers.")
+        self.addCleanup(shutil.rmtree, self.jobdir)
+
+    def write(self, name, contents):
+        with open(os.path.join(self.jobdir, name), 'w') as f:
+            f.write(contents)
+
+    def write_result(self, index, worker, value):
+        self.write("result-{}".format(index),
+                   json.dumps({ 'output' : "item {}\n".format(index),
+                                'error' : None, 'seconds' : 0.5,
+                                'value' : value, 'worker' : worker }))
+
+    def test_claim(self):
+        self.assertTrue(_claim(self.jobdir, 0, 1))
+        self.assertFalse(_claim(self.jobdir, 0, 2))
+        self.assertTrue(_claim(self.jobdir, 1, 2))
+        with open(os.path.join(self.jobdir, "claim-0")) as f:
+            self.assertTrue(f.read() == "1")
+
+    def test_process(self):
+        stdout = sys.stdout
+        (output, error, seconds, value) = _process(double, 21)
+        self.assertTrue(sys.stdout is stdout)
+        self.assertTrue(output == "doubling 21\n")
+        self.assertTrue(error is None)
+        self.assertTrue(value == 42)
+        self.assertTrue(seconds >= 0)
+
+    def test_process_error(self):
+        stdout = sys.stdout
+        (output, error, seconds, value) = _process(fail, 3)
+        self.assertTrue(sys.stdout is stdout)
+        self.assertTrue(output == "failing 3\n")
+        self.assertTrue("ValueError: bad item 3" in error)
+        self.assertTrue(value is None)
+
+    def test_results_in_item_order(self):
+        # Results are written in the order the workers finish them
+        self.write_result(2, 0, 'c')
+        self.write_result(0, 1, 'a')
+        self.write_result(1, 0, 'b')
+        results = _results(self.jobdir, [ 'x', 'y', 'z' ], [ 0, 0 ])
+        self.assertTrue([ res.item for res in results ] == [ 'x', 'y', 'z' ])
+        self.assertTrue([ res.value for res in results ] == [ 'a', 'b', 'c' ])
+        self.assertTrue([ res.worker for res in results ] == [ 1, 0, 0 ])
+        self.assertTrue(results[0].output == "item 0\n")
+        self.assertTrue(all([ res.error is None for res in results ]))
+
+    def test_results_unfinished(self):
+        self.write_result(0, 0, 'a')
+        _claim(self.jobdir, 1, 1)
+        self.write("worker-0.log", "started\n")
+        self.write("worker-1.log", "".join([ "line {}\n".format(i)
+                                             for i in range(100) ]))
+        results = _results(self.jobdir, [ 'x', 'y' ], [ 0, -9 ])
+        self.assertTrue(results[0].error is None)
+        error = results[1].error
+        self.assertTrue(results[1].worker is None)
+        self.assertTrue("Worker 1 didn't finish" in error)
+        self.assertTrue("status -9" in error)
+        self.assertTrue("line 99\n" in error)
+        self.assertTrue("line 0\n" not in error)
+        self.assertTrue("started" not in error)
+
+    def test_results_unclaimed(self):
+        self.write("worker-0.log", "no vmcore\n")
+        self.write("worker-1.log", "no vmcore either\n")
+        results = _results(self.jobdir, [ 'x' ], [ 1, 1 ])
+        error = results[0].error
+        self.assertTrue("No worker claimed" in error)
+        self.assertTrue("Worker 0 exited with status 1" in error)
+        self.assertTrue("no vmcore either\n" in error)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import unittest
+import gdb
+import sys
+
+if sys.version_info.major >= 3:
+    long = int
+
+from crash.types.xarray import xarray_for_each_raw, xarray_for_each_entry
+from crash.types.xarray import xa_is_value, xa_to_value
+
+def get_symbol(name):
+    return gdb.lookup_symbol(name, None)[0].value()
+
+class TestXArray(unittest.TestCase):
+    def setUp(self):
+        gdb.execute("file tests/test-trees")
+        self.items = get_symbol("tree_items")
+
+    def item(self, n):
+        return long(self.items[n].address)
+
+    def test_raw(self):
+        xa = get_symbol("test_xarray")
+        entries = list(xarray_for_each_raw(xa))
+        self.assertTrue(entries == [ (0, self.item(0)), (2, self.item(1)),
+                                     (8, 15), (13, self.item(2)) ])
+
+    def test_raw_pointer(self):
+        xa = get_symbol("test_xarray").address
+        indices = [ index for (index, entry) in xarray_for_each_raw(xa) ]
+        self.assertTrue(indices == [ 0, 2, 8, 13 ])
+
+    def test_value_entry(self):
+        xa = get_symbol("test_xarray")
+        values = [ xa_to_value(entry)
+                   for (index, entry) in xarray_for_each_raw(xa)
+                   if xa_is_value(entry) ]
+        self.assertTrue(values == [ 7 ])
+
+    def test_range(self):
+        xa = get_symbol("test_xarray")
+        indices = [ index for (index, entry)
+                    in xarray_for_each_raw(xa, 1, 12) ]
+        self.assertTrue(indices == [ 2, 8 ])
+
+    def test_range_multi_index(self):
+        # The value entry covers indices 8-11
+        xa = get_symbol("test_xarray")
+        indices = [ index for (index, entry)
+                    in xarray_for_each_raw(xa, 10, 10) ]
+        self.assertTrue(indices == [ 8 ])
+
+    def test_entries(self):
+        xa = get_symbol("test_xarray")
+        entries = xarray_for_each_entry(xa, 'unsigned long')
+        self.assertTrue([ (index, long(entry)) for (index, entry) in entries ]
+                        == [ (0, 0xdead0000), (2, 0xdead0001),
+                             (13, 0xdead0002) ])
+
+    def test_single(self):
+        xa = get_symbol("single_xarray")
+        self.assertTrue(list(xarray_for_each_raw(xa)) ==
+                        [ (0, self.item(3)) ])
+        self.assertTrue(len(list(xarray_for_each_raw(xa, 1))) == 0)
+
+    def test_empty(self):
+        xa = get_symbol("empty_xarray")
+        self.assertTrue(len(list(xarray_for_each_raw(xa))) == 0)